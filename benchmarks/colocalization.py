@@ -0,0 +1,95 @@
+"""Benchmark: RAD51/H2AX colocalization with per-tile KD-trees vs all-pairs distances per nucleus.
+
+Dense damage gives hundreds of foci per nucleus; the all-pairs reference
+grows with the square of that number. Both methods must agree exactly, on
+continuous coordinates and on the integer pixel grid blob centres live on
+(where pairs exactly `radius` apart are common and must count).
+
+Run from the repository root: python benchmarks/colocalization.py [--foci 50 200 800]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from foci_detection import colocalize
+
+n_nuclei = 40
+nucleus_size = 60  # foci are scattered over a nucleus_size x nucleus_size box
+radius = 3
+
+
+def synthetic_foci(foci_per_nucleus, rng, integer=False):
+    """detect_tile_foci-style per-label blob lists; nuclei sit side by side on a row."""
+    nuclei = [np.empty((0, 3))]
+    for k in range(n_nuclei):
+        yx = rng.uniform(0, nucleus_size, (foci_per_nucleus, 2)) + [0, k * nucleus_size]
+        if integer:
+            yx = np.floor(yx)
+        nuclei.append(np.column_stack([yx, np.full(foci_per_nucleus, 1.5)]))
+    return nuclei
+
+
+def all_pairs(nuclei_a, nuclei_b):
+    """Reference: full distance matrix between the two channels' foci of each nucleus."""
+    coloc_a = np.zeros(len(nuclei_a), dtype=np.int64)
+    coloc_b = np.zeros(len(nuclei_b), dtype=np.int64)
+    for label in range(1, len(nuclei_a)):
+        a, b = nuclei_a[label][:, :2], nuclei_b[label][:, :2]
+        if len(a) == 0 or len(b) == 0:
+            continue
+        close = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(-1)) <= radius
+        coloc_a[label] = close.any(axis=1).sum()
+        coloc_b[label] = close.any(axis=0).sum()
+    return coloc_a, coloc_b
+
+
+def best_of(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def check_boundary():
+    """Foci exactly `radius` apart on the pixel grid, in one nucleus and across two, against all pairs."""
+    focus = np.array([[10.0, 10.0, 1.5]])
+    for offset in ([0, radius], [radius, 0], [0, -radius], [-radius, 0]):
+        nuclei_a = [np.empty((0, 3)), focus]
+        nuclei_b = [np.empty((0, 3)), focus + [*offset, 0]]
+        expected, result = all_pairs(nuclei_a, nuclei_b), colocalize(nuclei_a, nuclei_b, radius)
+        if expected[0][1] != 1 or not all(np.array_equal(x, y) for x, y in zip(expected, result)):
+            raise AssertionError(f"foci {offset} apart not colocalized at radius {radius}")
+    # same distance but in different nuclei: never matched
+    _, result = colocalize([np.empty((0, 3)), focus, np.empty((0, 3))],
+                           [np.empty((0, 3)), np.empty((0, 3)), focus + [0, radius, 0]], radius)
+    if result.any():
+        raise AssertionError("foci of different nuclei colocalized")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--foci", type=int, nargs="+", default=[50, 200, 800], help="foci per nucleus and channel")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    check_boundary()
+    rng = np.random.default_rng(0)
+    print(f"{'foci/nucleus':>12} {'grid':>10} {'all pairs (s)':>14} {'KD-tree (s)':>12} {'speedup':>8}")
+    for n in args.foci:
+        for integer in (False, True):
+            nuclei_a, nuclei_b = synthetic_foci(n, rng, integer), synthetic_foci(n, rng, integer)
+            naive_s, expected = best_of(lambda: all_pairs(nuclei_a, nuclei_b), args.repeats)
+            tree_s, result = best_of(lambda: colocalize(nuclei_a, nuclei_b, radius), args.repeats)
+            if not all(np.array_equal(x, y) for x, y in zip(expected, result)):
+                raise AssertionError(f"KD-tree colocalization differs from all pairs at {n} foci/nucleus")
+            grid = "integer" if integer else "continuous"
+            print(f"{n:>12} {grid:>10} {naive_s:>14.4f} {tree_s:>12.4f} {naive_s / tree_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark: per-tile time and fresh allocations of process_tile() in float64 vs the float32 buffer mode.
+
+Peak allocation is measured with tracemalloc (numpy reports its buffers to
+it), per tile after a warm-up tile, so the float32 mode's reused workspace
+buffers do not count again. Also reports how many per-nucleus counts differ
+between the two modes.
+
+Run from the repository root: python benchmarks/float32_buffers.py [--tiles tile_01 tile_02]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import count_foci_and_visualize_v2 as analysis
+from foci_detection import workspace
+
+
+def measure(tile_id, float32):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows, _ = analysis.process_tile(tile_id, float32=float32)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiles", nargs="+", help="tiles to measure (default: every tile in images/A1)")
+    args = parser.parse_args()
+
+    tiles = [tile_id for tile_id in args.tiles or analysis.loader.tile_ids() if analysis.loader.has_seg(tile_id)]
+    for float32 in (False, True):
+        analysis.process_tile(tiles[0], float32=float32)  # warm the loader cache and the workspace
+
+    print(f"{'tile':>10} {'float64 (s)':>12} {'float32 (s)':>12} {'float64 MiB':>12} {'float32 MiB':>12} {'differ':>8}")
+    for tile_id in tiles:
+        s64, peak64, rows64 = measure(tile_id, False)
+        s32, peak32, rows32 = measure(tile_id, True)
+        counts = [key for key in rows64[0] if "_count_" in key] if rows64 else []
+        differ = sum(a[key] != b[key] for a, b in zip(rows64, rows32) for key in counts)
+        print(f"{tile_id:>10} {s64:>12.3f} {s32:>12.3f} {peak64 / 2**20:>12.1f} {peak32 / 2**20:>12.1f} "
+              f"{differ:>4}/{len(rows64) * len(counts)}")
+    print(f"workspace buffers kept per worker: {workspace.nbytes / 2**20:.1f} MiB")
+    print(f"estimated peak per tile: float64 {analysis.tile_memory_bytes(analysis.loader.seg(tiles[0]).shape) / 2**20:.1f} MiB, "
+          f"float32 {analysis.tile_memory_bytes(analysis.loader.seg(tiles[0]).shape, True) / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark: full-tile LoG detection vs the nucleus-restricted mode, per tile.
+
+Reports the fraction of pixels whose LoG stack is skipped, the speedup and
+how many in-nucleus blobs differ (only pruning near nucleus edges may).
+Real tiles come from images/A1; synthetic sparse fields keep every k-th
+nucleus of a benchmarks/synthetic_tiles.py tile.
+
+Run from the repository root: python benchmarks/nucleus_restricted_detection.py [--tiles tile_01 tile_02]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from foci_detection import detect_blobs_multi, detect_blobs_restricted, skipped_fraction
+from tile_loader import TileLoader, normalize
+from synthetic_tiles import make_tile
+
+thresholds = [0.15, 0.2, 0.25]
+sparse_every = [1, 4, 10]
+
+
+def best_of(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def in_nuclei(blobs, seg):
+    return blobs[seg[blobs[:, 0].astype(int), blobs[:, 1].astype(int)] > 0]
+
+
+def compare(name, img, seg, repeats):
+    full_s, full = best_of(lambda: detect_blobs_multi(img, thresholds), repeats)
+    restricted_s, restricted = best_of(lambda: detect_blobs_restricted(img, seg, thresholds), repeats)
+    differ = sum(len(set(map(tuple, in_nuclei(full[th], seg))) ^ set(map(tuple, restricted[th])))
+                 for th in thresholds)
+    total = sum(len(in_nuclei(full[th], seg)) for th in thresholds)
+    print(f"{name:>16} {(seg > 0).mean():>10.0%} {skipped_fraction(seg):>8.0%} {full_s:>9.3f} "
+          f"{restricted_s:>11.3f} {full_s / restricted_s:>7.2f}x {differ:>5}/{total}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiles", nargs="+", help="real tiles to include (default: every tile in images/A1)")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'tile':>16} {'nuclei px':>10} {'skipped':>8} {'full (s)':>9} {'restricted':>11} {'speedup':>8} {'differ':>5}")
+    loader = TileLoader("images/A1")
+    if os.path.isdir(loader.base_dir):
+        for tile_id in args.tiles or loader.tile_ids():
+            if loader.has_seg(tile_id):
+                compare(tile_id, loader.channel(tile_id, "rad51"), np.asarray(loader.seg(tile_id)), args.repeats)
+
+    gray, seg, _ = make_tile(size=1024, seed=1)
+    img = normalize(gray)
+    for every in sparse_every:
+        sparse = np.where(seg % every == 0, seg, 0)
+        compare(f"synthetic 1/{every}", img, sparse, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
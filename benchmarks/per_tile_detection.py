@@ -0,0 +1,133 @@
+"""Regression benchmark: per-nucleus blob detection (old loop) vs the per-tile stage.
+
+Run from the repository root: python benchmarks/per_tile_detection.py [--tile tile_01]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from math import pi
+from skimage.io import imread
+from skimage.feature import blob_log
+from skimage.color import rgba2rgb, rgb2gray
+from skimage.measure import regionprops
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from foci_detection import detect_tile_foci
+
+base_dir = "images/A1"
+rad51_dir = os.path.join(base_dir, "rad51")
+seg_dir = os.path.join(base_dir, "dapi")
+
+rad51_thresholds = [0.15, 0.2, 0.25]
+prob_thresholds = [0.3, 0.365, 0.4]
+min_sigma = 1
+max_sigma = 4
+
+
+# --- Reference: the loop the analysis scripts used to run ---
+def legacy_detect_blobs(img, seg, threshold):
+    blobs = blob_log(img, min_sigma=min_sigma, max_sigma=max_sigma, threshold=threshold)
+    counts = {}
+    area_pix = {}
+    for y, x, sigma in blobs:
+        y, x = int(y), int(x)
+        if 0 <= y < seg.shape[0] and 0 <= x < seg.shape[1]:
+            nuc_id = seg[y, x]
+            if nuc_id > 0:
+                counts[nuc_id] = counts.get(nuc_id, 0) + 1
+                area_pix[nuc_id] = area_pix.get(nuc_id, 0) + pi * sigma**2
+    return counts, area_pix
+
+
+def legacy_rows(channels, seg, regions):
+    rows = []
+    for r in regions:
+        data = {"region_id": r.label}
+        for name, (img, thresholds) in channels.items():
+            for th in thresholds:
+                counts, area_pix = legacy_detect_blobs(img, seg, th)
+                data[f"{name}_count_th{th}"] = counts.get(r.label, 0)
+                data[f"{name}_area_th{th}"] = area_pix.get(r.label, 0) / r.area
+        rows.append(data)
+    return rows
+
+
+def per_tile_rows(channels, seg, regions):
+    foci = {name: detect_tile_foci(img, seg, thresholds, min_sigma=min_sigma, max_sigma=max_sigma)
+            for name, (img, thresholds) in channels.items()}
+    rows = []
+    for r in regions:
+        data = {"region_id": r.label}
+        for name, (img, thresholds) in channels.items():
+            for th in thresholds:
+                counts, area_pix, _ = foci[name][th]
+                data[f"{name}_count_th{th}"] = counts[r.label]
+                data[f"{name}_area_th{th}"] = area_pix[r.label] / r.area
+        rows.append(data)
+    return rows
+
+
+def rows_match(expected, actual):
+    # Counts must be identical; areas are summed in float64 now, so allow rounding
+    if len(expected) != len(actual):
+        return False
+    for exp, act in zip(expected, actual):
+        if exp.keys() != act.keys():
+            return False
+        for key, value in exp.items():
+            if "_area_" in key:
+                if not np.isclose(value, act[key], rtol=1e-6):
+                    return False
+            elif value != act[key]:
+                return False
+    return True
+
+
+def load_tile(tile_id):
+    rad51_raw = imread(os.path.join(rad51_dir, tile_id + ".png"))
+    if rad51_raw.ndim == 3:
+        rad51_rgb = rgba2rgb(rad51_raw) if rad51_raw.shape[2] == 4 else rad51_raw
+        rad51_gray = (rgb2gray(rad51_rgb) * 255).astype(np.uint8)
+    else:
+        rad51_gray = rad51_raw
+    rad51_norm = (rad51_gray - rad51_gray.min()) / (rad51_gray.max() - rad51_gray.min())
+    channels = {"rad51": (rad51_norm, rad51_thresholds)}
+
+    prob_path = os.path.join(rad51_dir, tile_id + "_Probabilities.npy")
+    if os.path.exists(prob_path):
+        prob = np.load(prob_path)
+        if prob.ndim == 3 and prob.shape[-1] == 2:
+            prob = prob[..., 1]
+        channels["prob"] = ((prob - prob.min()) / (prob.max() - prob.min()), prob_thresholds)
+
+    seg = np.load(os.path.join(seg_dir, tile_id + "_seg.npy"), allow_pickle=True).item()['masks']
+    return channels, seg
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tile", default="tile_01")
+    args = parser.parse_args()
+
+    channels, seg = load_tile(args.tile)
+    regions = [r for r in regionprops(seg) if r.area > 0]
+    n_thresholds = sum(len(ths) for _, ths in channels.values())
+
+    t0 = time.perf_counter()
+    expected = legacy_rows(channels, seg, regions)
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    actual = per_tile_rows(channels, seg, regions)
+    t_tile = time.perf_counter() - t0
+
+    if not rows_match(expected, actual):
+        print("❌ Per-tile results differ from the per-nucleus loop")
+        sys.exit(1)
+
+    print(f"{args.tile}: {len(regions)} nuclei, {n_thresholds} (channel, threshold) pairs")
+    print(f"  per-nucleus loop: {t_legacy:8.2f} s  ({len(regions) * n_thresholds} blob_log calls)")
+    print(f"  per-tile stage:   {t_tile:8.2f} s  ({len(channels)} LoG scale spaces)")
+    print(f"✅ Same results, {t_legacy / t_tile:.1f}x faster")
@@ -0,0 +1,208 @@
+"""Per-stage timings of the tile pipeline on synthetic tiles, saved as JSON.
+
+Each case is a synthetic tile (size x foci density) written in the images/
+layout; every stage runs `--repeat` times and the best time is kept.
+Results go to benchmarks/results/<timestamp>.json; pass --compare with an
+older result file to flag stages that got slower.
+
+Run from the repository root:
+    python benchmarks/pipeline_stages.py [--sizes 256 512 1024] [--compare benchmarks/results/old.json]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import cv2
+import numpy as np
+import pandas as pd
+import skimage
+from skimage.feature import blob_log
+from skimage.measure import regionprops
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from foci_detection import detect_blobs_multi, assign_foci
+from label_index import LabelIndex
+from tile_loader import TileLoader, normalize
+from synthetic_tiles import make_tile, write_tile, recall
+
+results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+thresholds = [0.15, 0.2, 0.25]
+min_sigma = 1
+max_sigma = 4
+densities = {"sparse": 2, "dense": 8}
+
+
+# --- Stages: each takes the case context and returns something to keep alive ---
+def stage_load(ctx):
+    loader = TileLoader(ctx["base_dir"], use_cache=False)
+    return loader.gray(ctx["tile_id"], "rad51"), loader.seg(ctx["tile_id"])
+
+
+def stage_load_cached(ctx):
+    return ctx["cached_loader"].gray(ctx["tile_id"], "rad51"), ctx["cached_loader"].seg(ctx["tile_id"])
+
+
+def stage_normalize(ctx):
+    return normalize(ctx["gray"])
+
+
+def stage_blob_log(ctx):
+    # what the scripts did before the shared scale space: one blob_log per threshold
+    return [blob_log(ctx["norm"], min_sigma=min_sigma, max_sigma=max_sigma, threshold=th) for th in thresholds]
+
+
+def stage_detect(ctx):
+    return detect_blobs_multi(ctx["norm"], thresholds, min_sigma=min_sigma, max_sigma=max_sigma)
+
+
+def stage_assign(ctx):
+    return [assign_foci(blobs, ctx["seg"]) for blobs in ctx["foci"].values()]
+
+
+def stage_regionprops(ctx):
+    return [(r.label, r.area, r.centroid, r.bbox) for r in regionprops(ctx["seg"])]
+
+
+def stage_label_index(ctx):
+    return LabelIndex(ctx["seg"])
+
+
+def stage_overlay(ctx):
+    vis = cv2.cvtColor(ctx["gray"], cv2.COLOR_GRAY2BGR)
+    for y, x, _ in ctx["foci"][thresholds[1]]:
+        cv2.circle(vis, (int(x), int(y)), radius=3, color=(0, 255, 255), thickness=3)
+    cv2.imwrite(os.path.join(ctx["out_dir"], "overlay.png"), vis)
+
+
+def stage_csv_export(ctx):
+    nuclei = ctx["nuclei"]
+    table = {"region_id": nuclei.labels, "area": nuclei.areas[nuclei.labels]}
+    for th, (counts, area_pix, _) in zip(thresholds, ctx["assigned"]):
+        table[f"rad51_count_th{th}"] = counts[nuclei.labels]
+        table[f"rad51_area_th{th}"] = area_pix[nuclei.labels] / nuclei.areas[nuclei.labels]
+    pd.DataFrame(table).to_csv(os.path.join(ctx["out_dir"], "foci.csv"), index=False)
+
+
+def stage_json_export(ctx):
+    nuclei = ctx["nuclei"]
+    data = [{"region_id": int(label), "area": float(nuclei.areas[label]),
+             "outline": np.stack(nuclei.outline_pixels(label), axis=1).tolist(),
+             "pixel_coords": np.stack(nuclei.pixels(label), axis=1).tolist()} for label in nuclei.labels]
+    with open(os.path.join(ctx["out_dir"], "tile.json"), "w") as f:
+        json.dump({"nuclei": data}, f)
+
+
+STAGES = {
+    "load": stage_load,
+    "load_cached": stage_load_cached,
+    "normalize": stage_normalize,
+    "blob_log": stage_blob_log,
+    "detect": stage_detect,
+    "assign": stage_assign,
+    "regionprops": stage_regionprops,
+    "label_index": stage_label_index,
+    "overlay": stage_overlay,
+    "csv_export": stage_csv_export,
+    "json_export": stage_json_export,
+}
+
+
+def best_time(fn, ctx, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(ctx)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def run_case(size, density, repeat, stages, work_dir):
+    gray, seg, truth = make_tile(size=size, foci_per_nucleus=densities[density], seed=size)
+    tile_id = f"synthetic_{size}_{density}"
+    base_dir = os.path.join(work_dir, "images")
+    write_tile(base_dir, tile_id, gray, seg)
+
+    ctx = {"base_dir": base_dir, "tile_id": tile_id, "out_dir": work_dir, "gray": gray, "seg": seg,
+           "cached_loader": TileLoader(base_dir, cache_dir=os.path.join(work_dir, "cache"))}
+    stage_load_cached(ctx)  # warm the cache
+    ctx["norm"] = normalize(gray)
+    ctx["foci"] = stage_detect(ctx)
+    ctx["assigned"] = stage_assign(ctx)
+    ctx["nuclei"] = LabelIndex(seg)
+
+    timings = {name: best_time(STAGES[name], ctx, repeat) for name in stages}
+    return {
+        "size": size,
+        "density": density,
+        "nuclei": len(ctx["nuclei"]),
+        "true_foci": len(truth),
+        "detected_foci": {str(th): len(blobs) for th, blobs in ctx["foci"].items()},
+        "recall": {str(th): recall(blobs[:, :2], truth) for th, blobs in ctx["foci"].items()},
+        "seconds": timings,
+    }
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(results_dir)).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "scikit-image": skimage.__version__, "commit": commit}
+
+
+def compare(old_path, results, tolerance):
+    """Print stages that got slower than `tolerance` x the old run; return how many regressed."""
+    with open(old_path) as f:
+        old = {(c["size"], c["density"]): c["seconds"] for c in json.load(f)["cases"]}
+    regressions = 0
+    for case in results["cases"]:
+        before = old.get((case["size"], case["density"]), {})
+        for stage, seconds in case["seconds"].items():
+            if stage in before and seconds > tolerance * before[stage] and seconds - before[stage] > 1e-3:
+                regressions += 1
+                print(f"⚠️ {case['size']} {case['density']} {stage}: {before[stage]:.4f} s -> {seconds:.4f} s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--densities", nargs="+", choices=sorted(densities), default=sorted(densities))
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is kept (default: 3)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="slowdown ratio reported as a regression (default: 1.2)")
+    args = parser.parse_args()
+
+    results = {"created": datetime.now().isoformat(timespec="seconds"), "machine": machine_info(),
+               "thresholds": thresholds, "repeat": args.repeat, "cases": []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            for density in args.densities:
+                case = run_case(size, density, args.repeat, args.stages, work_dir)
+                results["cases"].append(case)
+                stages = "  ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in case["seconds"].items())
+                print(f"⏱️ {size}px {density} ({case['nuclei']} nuclei, {case['true_foci']} foci, "
+                      f"recall@{thresholds[1]} {case['recall'][str(thresholds[1])]:.2f}): {stages}")
+
+    output = args.output or os.path.join(results_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Saved: {output}")
+
+    if args.compare and compare(args.compare, results, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Synthetic RAD51 tiles with known foci, for benchmarks that must run offline.
+
+make_tile() lays round nuclei out on a jittered grid and adds Gaussian
+spots inside them, so every benchmark knows where the foci really are.
+"""
+import os
+import numpy as np
+from skimage.io import imsave
+
+
+def make_tile(size=512, nucleus_radius=18, foci_per_nucleus=4, seed=0):
+    """Return (gray uint8, seg uint16, foci (N, 2) float [y, x]) for a size x size tile."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size]
+    seg = np.zeros((size, size), dtype=np.uint16)
+    signal = rng.normal(0.05, 0.01, (size, size))
+
+    cell = int(nucleus_radius * 2.6)
+    label = 0
+    foci = []
+    for cy in range(cell // 2, size - cell // 2, cell):
+        for cx in range(cell // 2, size - cell // 2, cell):
+            cy_j = cy + rng.integers(-nucleus_radius // 5, nucleus_radius // 5 + 1)
+            cx_j = cx + rng.integers(-nucleus_radius // 5, nucleus_radius // 5 + 1)
+            r = nucleus_radius * rng.uniform(0.8, 1.0)
+            inside = (yy - cy_j)**2 + (xx - cx_j)**2 <= r**2
+            label += 1
+            seg[inside] = label
+            signal[inside] += 0.1
+
+            for _ in range(rng.poisson(foci_per_nucleus)):
+                # keep spots away from the nucleus edge so they stay inside it
+                angle, dist = rng.uniform(0, 2 * np.pi), rng.uniform(0, 0.7 * r)
+                fy, fx = cy_j + dist * np.sin(angle), cx_j + dist * np.cos(angle)
+                sigma = rng.uniform(1.2, 2.2)
+                y0, y1 = max(0, int(fy) - 10), min(size, int(fy) + 11)
+                x0, x1 = max(0, int(fx) - 10), min(size, int(fx) + 11)
+                patch = np.exp(-((yy[y0:y1, x0:x1] - fy)**2 + (xx[y0:y1, x0:x1] - fx)**2) / (2 * sigma**2))
+                signal[y0:y1, x0:x1] += rng.uniform(0.5, 1.0) * patch
+                foci.append((fy, fx))
+
+    gray = (np.clip(signal, 0, 1) * 255).astype(np.uint8)
+    return gray, seg, np.array(foci).reshape(-1, 2)
+
+
+def write_tile(base_dir, tile_id, gray, seg):
+    """Write a tile in the images/<well>/ layout the analysis scripts read (Cellpose-style seg dict)."""
+    for channel in ("rad51", "dapi"):
+        os.makedirs(os.path.join(base_dir, channel), exist_ok=True)
+        imsave(os.path.join(base_dir, channel, tile_id + ".png"), gray, check_contrast=False)
+    np.save(os.path.join(base_dir, "dapi", tile_id + "_seg.npy"), {"masks": seg, "outlines": seg > 0}, allow_pickle=True)
+
+
+def recall(found, truth, tolerance=2.0):
+    """Fraction of true foci with a detection within `tolerance` pixels."""
+    if len(truth) == 0:
+        return 1.0
+    if len(found) == 0:
+        return 0.0
+    d = np.hypot(truth[:, None, 0] - found[None, :, 0], truth[:, None, 1] - found[None, :, 1])
+    return float((d.min(axis=1) <= tolerance).mean())
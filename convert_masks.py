@@ -0,0 +1,30 @@
+import os
+import glob
+import argparse
+from tile_loader import seg_to_masks
+
+# --- Configuration ---
+base_dir = "images/A1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Cellpose _seg.npy dicts to uint16 _masks.npy label images.")
+    parser.add_argument("--base-dir", default=base_dir, help=f"well directory holding dapi/*_seg.npy (default: {base_dir})")
+    parser.add_argument("--force", action="store_true", help="rewrite masks that are already up to date")
+    args = parser.parse_args()
+
+    seg_paths = sorted(glob.glob(os.path.join(args.base_dir, "dapi", "*_seg.npy")))
+    converted = 0
+    for seg_path in seg_paths:
+        masks_path = seg_path[:-len("_seg.npy")] + "_masks.npy"
+        if not args.force and os.path.exists(masks_path) and os.path.getmtime(masks_path) >= os.path.getmtime(seg_path):
+            continue
+        seg_to_masks(seg_path, masks_path)
+        converted += 1
+        print(f"✅ {os.path.basename(seg_path)} -> {os.path.basename(masks_path)}")
+
+    print(f"📦 Converted {converted} of {len(seg_paths)} segmentation files")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,120 +1,87 @@
 import os
+import argparse
 import numpy as np
-from math import pi
-from skimage.io import imread, imsave
+from functools import partial
 from skimage.feature import blob_log
-import cv2
-from skimage.color import rgba2rgb, rgb2gray
-from skimage.measure import regionprops
+from label_index import LabelIndex
 import pandas as pd
+from foci_detection import assign_foci
+from tile_pipeline import run_tiles
+import profiling
+from tile_loader import TileLoader
+from results_writer import TileResultsWriter, input_fingerprint
+from overlay_render import ImageWriter, marker_offsets, stamp_markers, gray_to_rgb
 
 # --- Configuration ---
 base_dir = "images/A1"
-rad51_dir = os.path.join(base_dir, "rad51")
-dapi_dir = os.path.join(base_dir, "dapi")
-seg_dir = os.path.join(base_dir, "dapi")
+loader = TileLoader(base_dir)
 
 RAD51_BLOB_THRESHOLD = 0.2
 PROB_BLOB_THRESHOLD = 0.365
 min_sigma = 1
 max_sigma = 4
 
-# --- Output directories ---
-os.makedirs("outputs/annotated_rad51", exist_ok=True)
-os.makedirs("outputs/annotated_dapi", exist_ok=True)
+csv_path = "outputs/foci_per_nucleus.csv"
+csv_columns = ["region_id", "image_id", "tile_id", "area", "foci_count_rad51", "foci_count_probs",
+               "foci_fraction_rad51", "foci_fraction_probs"]
 
-df_all = []
+# cv2.circle(radius=3, thickness=3) footprint, stamped at every focus at once
+MARKER = marker_offsets(radius=3, thickness=3)
 
-for fname in sorted(os.listdir(rad51_dir)):
-    if not fname.endswith(".png") or "_Probabilities" in fname:
-        continue
 
-    tile_id = fname.replace(".png", "")
-    rad51_path = os.path.join(rad51_dir, fname)
-    dapi_path = os.path.join(dapi_dir, fname)
-    seg_path = os.path.join(seg_dir, tile_id + "_seg.npy")
-    prob_path = os.path.join(rad51_dir, tile_id + "_Probabilities.npy")
-
-    if not os.path.exists(seg_path):
+# --- Per-tile processing (runs in a worker process when --workers > 1) ---
+# Returns (nucleus table, {png path: RGB/gray image}); the main process writes the images.
+def process_tile(tile_id, overlays=True):
+    if not loader.has_seg(tile_id):
         print(f"❌ Segmentation not found for {tile_id}")
-        continue
-
-    # Load RAD51
-    rad51_raw = imread(rad51_path)
-    if rad51_raw.ndim == 3:
-        if rad51_raw.shape[2] == 4:
-            rad51_rgb = rgba2rgb(rad51_raw)
-        else:
-            rad51_rgb = rad51_raw
-        rad51 = (rgb2gray(rad51_rgb) * 255).astype(np.uint8)
-    else:
-        rad51 = rad51_raw
-
-    # Load DAPI
-    dapi_raw = imread(dapi_path)
-    if dapi_raw.ndim == 3:
-        if dapi_raw.shape[2] == 4:
-            dapi_rgb = rgba2rgb(dapi_raw)
-        else:
-            dapi_rgb = dapi_raw
-        dapi = (rgb2gray(dapi_rgb) * 255).astype(np.uint8)
-    else:
-        dapi = dapi_raw
+        return None, {}
 
-    # Load segmentation
-    loaded = np.load(seg_path, allow_pickle=True).item()
-    seg = loaded['masks']
+    with profiling.stage("load"):
+        rad51 = loader.gray(tile_id, "rad51")
+        dapi = loader.gray(tile_id, "dapi")
+        seg = loader.seg(tile_id)
+        rad51_norm = loader.channel(tile_id, "rad51")
+        prob_norm = loader.probabilities(tile_id)
 
     # ---- RAD51 foci detection ----
-    rad51_norm = (rad51 - rad51.min()) / (rad51.max() - rad51.min())
-    blobs_rad51 = blob_log(rad51_norm, min_sigma=min_sigma, max_sigma=max_sigma, threshold=RAD51_BLOB_THRESHOLD)
+    with profiling.stage("detect"):
+        blobs_rad51 = blob_log(rad51_norm, min_sigma=min_sigma, max_sigma=max_sigma, threshold=RAD51_BLOB_THRESHOLD)
     foci_coords_rad51 = blobs_rad51[:, :2].astype(int)
+    profiling.count("rad51_foci", len(blobs_rad51))
 
-    foci_counts_rad51 = {}
-    foci_pixels_rad51 = {}
-    for y, x, sigma in blobs_rad51:
-        if 0 <= y < seg.shape[0] and 0 <= x < seg.shape[1]:
-            nuc_id = seg[int(y), int(x)]
-            if nuc_id > 0:
-                foci_counts_rad51[nuc_id] = foci_counts_rad51.get(nuc_id, 0) + 1
-                foci_pixels_rad51[nuc_id] = foci_pixels_rad51.get(nuc_id, 0) + pi * sigma**2
+    with profiling.stage("assign"):
+        foci_counts_rad51, foci_pixels_rad51, _ = assign_foci(blobs_rad51, seg)
 
     # ---- Probability foci detection ----
-    foci_counts_probs = {}
-    foci_pixels_probs = {}
+    foci_counts_probs = np.zeros_like(foci_counts_rad51)
+    foci_pixels_probs = np.zeros_like(foci_pixels_rad51)
+    foci_coords_probs = []
+    images = {}
 
-    if os.path.exists(prob_path):
-        prob = np.load(prob_path)
-        prob_vis = ((prob - prob.min()) / (prob.max() - prob.min()) * 255).astype(np.uint8)
-        imsave(f"outputs/annotated_rad51/{tile_id}_probabilities.png", prob_vis)
+    if prob_norm is not None:
+        if overlays:
+            images[f"outputs/annotated_rad51/{tile_id}_probabilities.png"] = (prob_norm * 255).astype(np.uint8)
 
-        prob_norm = (prob - prob.min()) / (prob.max() - prob.min())
-        blobs_probs = blob_log(prob_norm, min_sigma=min_sigma, max_sigma=max_sigma, threshold=PROB_BLOB_THRESHOLD)
+        with profiling.stage("detect"):
+            blobs_probs = blob_log(prob_norm, min_sigma=min_sigma, max_sigma=max_sigma, threshold=PROB_BLOB_THRESHOLD)
         foci_coords_probs = blobs_probs[:, :2].astype(int)
-
-        for blob in blobs_probs:
-            if len(blob) >= 3:
-                y, x, sigma = blob[:3]
-                if 0 <= y < seg.shape[0] and 0 <= x < seg.shape[1]:
-                    nuc_id = seg[int(y), int(x)]
-                    if nuc_id > 0:
-                        foci_counts_probs[nuc_id] = foci_counts_probs.get(nuc_id, 0) + 1
-                        foci_pixels_probs[nuc_id] = foci_pixels_probs.get(nuc_id, 0) + pi * sigma**2
-
-            else:
-                foci_coords_probs = []
-                print(f"⚠️ Probabilities file not found for {tile_id}")
+        profiling.count("prob_foci", len(blobs_probs))
+        with profiling.stage("assign"):
+            foci_counts_probs, foci_pixels_probs, _ = assign_foci(blobs_probs, seg)
+    else:
+        print(f"⚠️ Probabilities file not found for {tile_id}")
 
     # ---- CSV: nucleus stats ----
-    regions = regionprops(seg)
+    with profiling.stage("label_index"):
+        nuclei = LabelIndex(seg)
+    profiling.count("nuclei", len(nuclei))
     rows = []
-    for r in regions:
-        region_id = r.label
-        area = r.area
-        count_r = foci_counts_rad51.get(region_id, 0)
-        count_p = foci_counts_probs.get(region_id, 0)
-        pix_r = foci_pixels_rad51.get(region_id, 0)
-        pix_p = foci_pixels_probs.get(region_id, 0)
+    for region_id in nuclei.labels:
+        area = nuclei.areas[region_id]
+        count_r = foci_counts_rad51[region_id]
+        count_p = foci_counts_probs[region_id]
+        pix_r = foci_pixels_rad51[region_id]
+        pix_p = foci_pixels_probs[region_id]
 
         rows.append({
             'region_id': region_id,
@@ -127,22 +94,54 @@ for fname in sorted(os.listdir(rad51_dir)):
             'foci_fraction_probs': pix_p / area if area > 0 else 0
         })
 
-    df_all.append(pd.DataFrame(rows))
+    tile_df = pd.DataFrame(rows)
 
     # ---- Overlays ----
-    rad51_vis = cv2.cvtColor(rad51, cv2.COLOR_GRAY2BGR)
-    dapi_vis = cv2.cvtColor(dapi, cv2.COLOR_GRAY2BGR)
-
-    for y, x in foci_coords_rad51:
-        cv2.circle(rad51_vis, (int(x), int(y)), radius=3, color=(0, 255, 255), thickness=3)
-        cv2.circle(dapi_vis, (int(x), int(y)), radius=3, color=(0, 255, 0), thickness=3)
-
-    imsave(f"outputs/annotated_rad51/{tile_id}_rad51_foci.png", rad51_vis)
-    imsave(f"outputs/annotated_dapi/{tile_id}_dapi_foci.png", dapi_vis)
+    if overlays:
+        with profiling.stage("overlay"):
+            images[f"outputs/annotated_rad51/{tile_id}_rad51_foci.png"] = stamp_markers(
+                gray_to_rgb(rad51), foci_coords_rad51, MARKER, (0, 255, 255))
+            images[f"outputs/annotated_dapi/{tile_id}_dapi_foci.png"] = stamp_markers(
+                gray_to_rgb(dapi), foci_coords_rad51, MARKER, (0, 255, 0))
 
     print(f"✅ {tile_id}: {len(blobs_rad51)} foci in RAD51, {len(foci_coords_probs)} in Probabilities")
 
-# ---- Final CSV ----
-final_df = pd.concat(df_all, ignore_index=True)
-final_df.to_csv("outputs/foci_per_nucleus.csv", index=False)
-print("📊 Saved CSV: outputs/foci_per_nucleus.csv")
+    return tile_df, images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count RAD51 foci per nucleus and save annotated overlays.")
+    parser.add_argument("--workers", type=int, default=1, help="number of tiles processed in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    parser.add_argument("--fresh", action="store_true", help="reprocess every tile instead of resuming from the manifest")
+    parser.add_argument("--no-overlays", action="store_true", help="skip the annotated PNGs (headless batch runs)")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    # --- Output directories ---
+    if not args.no_overlays:
+        os.makedirs("outputs/annotated_rad51", exist_ok=True)
+        os.makedirs("outputs/annotated_dapi", exist_ok=True)
+
+    # ---- CSV streamed tile by tile; finished tiles with unchanged inputs are skipped ----
+    params = {"rad51_threshold": RAD51_BLOB_THRESHOLD, "prob_threshold": PROB_BLOB_THRESHOLD,
+              "min_sigma": min_sigma, "max_sigma": max_sigma}
+    writer = TileResultsWriter(csv_path, csv_columns, params, resume=not args.fresh)
+    tiles = writer.start({tile_id: input_fingerprint(loader.input_paths(tile_id)) for tile_id in loader.tile_ids()})
+    # PNGs are encoded on background threads while the next tiles are detected
+    image_writer = ImageWriter()
+    worker = partial(process_tile, overlays=not args.no_overlays)
+    for tile_id, (tile_df, images) in run_tiles(worker, tiles, workers=args.workers):
+        writer.write(tile_id, tile_df)
+        for path, img in images.items():
+            image_writer.submit(path, img)
+    image_writer.close()
+
+    print(f"📊 Saved CSV: {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
+
@@ -1,125 +1,240 @@
 import os
+import time
+import argparse
 import numpy as np
 import pandas as pd
 from math import pi, sqrt
-from skimage.io import imread, imsave
-from skimage.feature import blob_log
-from skimage.color import rgba2rgb, rgb2gray
-from skimage.measure import regionprops
+from skimage.io import imsave
+from foci_detection import detect_tile_foci, colocalize, restricted_crops, skipped_fraction, detection_bytes, workspace
+from label_index import LabelIndex
+from tile_pipeline import run_tiles, parse_size, workers_for_budget
+import profiling
+from tile_loader import TileLoader, well_loader
+from results_writer import TileResultsWriter, input_fingerprint
+from results_store import ParquetResultsStore, long_tables, default_root
+import pixel_classifier
+from functools import partial
 import matplotlib.pyplot as plt
 import cv2
 import random
 
 # --- Configuration ---
 base_dir = "images/A1"
-rad51_dir = os.path.join(base_dir, "rad51")
-dapi_dir = os.path.join(base_dir, "dapi")
-seg_dir = os.path.join(base_dir, "dapi")
+loader = TileLoader(base_dir)
 
 output_dir = "outputs"
-os.makedirs(output_dir, exist_ok=True)
-os.makedirs(f"{output_dir}/visuals", exist_ok=True)
 
 rad51_thresholds = [0.15, 0.2, 0.25]
 prob_thresholds = [0.3, 0.365, 0.4]
+# H2AX foci are detected at the RAD51 thresholds and matched to the RAD51 foci of the same threshold
+h2ax_thresholds = rad51_thresholds
+coloc_radius = 3  # pixels between RAD51 and H2AX focus centres
 
 min_sigma = 1
 max_sigma = 4
 
-# --- Utility: blob detection ---
-def detect_blobs(img, seg, threshold):
-    blobs = blob_log(img, min_sigma=min_sigma, max_sigma=max_sigma, threshold=threshold)
-    counts = {}
-    area_pix = {}
-    coords = []
-    for blob in blobs:
-        if len(blob) < 3:
-            continue
-        y, x, sigma = blob[:3]
-        y, x = int(y), int(x)
-        if 0 <= y < seg.shape[0] and 0 <= x < seg.shape[1]:
-            nuc_id = seg[y, x]
-            if nuc_id > 0:
-                counts[nuc_id] = counts.get(nuc_id, 0) + 1
-                area_pix[nuc_id] = area_pix.get(nuc_id, 0) + pi * sigma**2
-                coords.append((nuc_id, x, y, sigma))
-    return counts, area_pix, coords
-
-# --- Process all tiles ---
-df_all = []
-all_tiles = sorted([f for f in os.listdir(rad51_dir) if f.endswith(".png") and "Probabilities" not in f])
-
-for first_image in all_tiles:
-    tile_id = first_image.replace(".png", "")
-    print(tile_id)
-
-    rad51_path = os.path.join(rad51_dir, first_image)
-    dapi_path = os.path.join(dapi_dir, first_image)
-    seg_path = os.path.join(seg_dir, tile_id + "_seg.npy")
-    prob_path = os.path.join(rad51_dir, tile_id + "_Probabilities.npy")
-
-    if not os.path.exists(seg_path):
+csv_path = f"{output_dir}/foci_per_nucleus_multi_threshold.csv"
+csv_columns = (["image_id", "tile_id", "region_id", "area"] +
+               [f"rad51_{kind}_th{th}" for th in rad51_thresholds for kind in ("count", "area")] +
+               [f"prob_{kind}_th{th}" for th in prob_thresholds for kind in ("count", "area")] +
+               [f"h2ax_{kind}_th{th}" for th in h2ax_thresholds for kind in ("count", "area")] +
+               [f"coloc_{kind}_th{th}" for th in h2ax_thresholds
+                for kind in ("count", "rad51_fraction", "h2ax_fraction")])
+# Recorded in the CSV manifest; changing any of them reprocesses every tile
+detection_params = {"rad51_thresholds": rad51_thresholds, "prob_thresholds": prob_thresholds,
+                    "h2ax_thresholds": h2ax_thresholds, "coloc_radius": coloc_radius,
+                    "min_sigma": min_sigma, "max_sigma": max_sigma}
+
+# --- float32 processing ---
+def normalized_channels(tiles, tile_id, float32=False, prob=True):
+    """(rad51, prob, h2ax) min-max normalized images of a tile; prob and h2ax are None when absent.
+
+    prob=False skips the on-disk probability map (a classifier predicts it instead).
+
+    float32 normalizes the cached uint8 images and the raw probability map
+    in place into this process's foci_detection.workspace buffers, so a
+    worker reuses the same float32 arrays from tile to tile.
+    """
+    h2ax = tiles.has_channel(tile_id, "h2ax")
+    if not float32:
+        return (tiles.channel(tile_id, "rad51"), tiles.probabilities(tile_id) if prob else None,
+                tiles.channel(tile_id, "h2ax") if h2ax else None)
+    prob = tiles.raw_probabilities(tile_id) if prob else None
+    return (workspace.normalized("rad51", tiles.gray(tile_id, "rad51")),
+            workspace.normalized("prob", prob) if prob is not None else None,
+            workspace.normalized("h2ax", tiles.gray(tile_id, "h2ax")) if h2ax else None)
+
+
+def tile_memory_bytes(shape, float32=False, classifier_features=None):
+    """Estimated peak memory of one process_tile() call on a tile of `shape`.
+
+    The larger of the detection scratch and, with a pixel classifier (its
+    feature list), the prediction's feature stack; plus the three normalized
+    channels and ~40 bytes per pixel for the label index, raw inputs and
+    temporaries (measured on the 456x456 A1 tiles: 46 MB float64, 34 MB
+    float32 above the worker baseline).
+    """
+    itemsize = 4 if float32 else 8
+    pixels = int(np.prod(shape))
+    scratch = detection_bytes(shape, np.float32 if float32 else np.float64)
+    if classifier_features is not None:
+        scratch = max(scratch, pixel_classifier.prediction_bytes(shape, classifier_features))
+    return scratch + pixels * (3 * itemsize + 40)
+
+
+# --- Per-tile processing (runs in a worker process when --workers > 1) ---
+# Returns (CSV rows, long nucleus/focus tables or None when long_format is off).
+# With `classifier` (a saved pixel_classifier model) the probability map is predicted here instead of read from disk.
+# `well` reads the tile from images/<well> of a plate (see plate_runner.py) instead of base_dir.
+# `restrict` builds the LoG stacks only around nuclei (foci_detection.detect_blobs_restricted).
+# `float32` keeps images and LoG stacks in float32 buffers reused across the tiles of a worker.
+def process_tile(tile_id, long_format=False, classifier=None, well=None, restrict=False, float32=False):
+    tiles = well_loader(well) if well else loader
+    image_id = well or "A1"
+
+    if not tiles.has_seg(tile_id):
         print(f"⚠️ Skipping {tile_id}: no segmentation file")
-        continue
-
-    rad51_raw = imread(rad51_path)
-    dapi_raw = imread(dapi_path)
-
-    if rad51_raw.ndim == 3:
-        rad51_rgb = rgba2rgb(rad51_raw) if rad51_raw.shape[2] == 4 else rad51_raw
-        rad51_gray = (rgb2gray(rad51_rgb) * 255).astype(np.uint8)
-    else:
-        rad51_rgb = cv2.cvtColor(rad51_raw, cv2.COLOR_GRAY2RGB)
-        rad51_gray = rad51_raw
-
-    if dapi_raw.ndim == 3:
-        dapi_raw = rgba2rgb(dapi_raw) if dapi_raw.shape[2] == 4 else dapi_raw
-        dapi = (rgb2gray(dapi_raw) * 255).astype(np.uint8)
-    else:
-        dapi = dapi_raw
-
-    prob = np.load(prob_path) if os.path.exists(prob_path) else None
-    if prob is not None:
-        if prob.shape[-1] == 2:
-            prob = prob[..., 1]  # Take the second channel
-        if prob.ndim != 2:
-            raise ValueError(f"Expected 2D probability image but got shape: {prob.shape}")
-        prob_norm = (prob - prob.min()) / (prob.max() - prob.min())
-    else:
-        prob_norm = None
-
-    seg = np.load(seg_path, allow_pickle=True).item()['masks']
-    regions = regionprops(seg)
-    
-    for r in regions:
-        print(len(regions))
-        region_id = r.label
-        area = r.area
+        return [], None
+
+    with profiling.stage("load"):
+        seg = tiles.seg(tile_id)
+        rad51_norm, prob_norm, h2ax_norm = normalized_channels(tiles, tile_id, float32, prob=classifier is None)
+    if classifier is not None:
+        prob_norm = pixel_classifier.predict_probabilities(tiles, tile_id, classifier,
+                                                           dtype=np.float32 if float32 else None)
+    with profiling.stage("label_index"):
+        nuclei = LabelIndex(seg)
+    profiling.count("nuclei", len(nuclei))
+
+    # Nucleus crops for --restrict-to-nuclei, computed once and shared by every channel
+    crops = restricted_crops(seg, max_sigma) if restrict else None
+
+    # Detect once per (channel, threshold) for the whole tile, then scatter to nuclei
+    buffers = workspace if float32 else None
+    start = time.perf_counter()
+    with profiling.stage("detect"):
+        rad51_foci = detect_tile_foci(rad51_norm, seg, rad51_thresholds, min_sigma=min_sigma, max_sigma=max_sigma, restrict=restrict, workspace=buffers, crops=crops)
+        prob_foci = detect_tile_foci(prob_norm, seg, prob_thresholds, min_sigma=min_sigma, max_sigma=max_sigma, restrict=restrict, workspace=buffers, crops=crops) if prob_norm is not None else {}
+        h2ax_foci = detect_tile_foci(h2ax_norm, seg, h2ax_thresholds, min_sigma=min_sigma, max_sigma=max_sigma, restrict=restrict, workspace=buffers, crops=crops) if h2ax_norm is not None else {}
+    if restrict:
+        # the full-tile time to compare against comes from benchmarks/nucleus_restricted_detection.py
+        skipped = skipped_fraction(seg, max_sigma, crops)
+        profiling.count("log_skipped_pixels", round(skipped * seg.size))
+        print(f"✂️ {tile_id}: LoG restricted to nuclei, {skipped:.0%} of pixels skipped, "
+              f"detection {time.perf_counter() - start:.2f} s")
+    for method, foci in (("rad51", rad51_foci), ("prob", prob_foci), ("h2ax", h2ax_foci)):
+        for th, (counts, _, _) in foci.items():
+            profiling.count(f"{method}_foci_th{th}", counts.sum())
+
+    # RAD51 foci with an H2AX focus within coloc_radius in the same nucleus, and vice versa
+    with profiling.stage("colocalize"):
+        coloc = {th: colocalize(rad51_foci[th][2], h2ax_foci[th][2], coloc_radius) for th in h2ax_foci}
+
+    rows = []
+    for region_id in nuclei.labels:
+        area = nuclei.areas[region_id]
         if area == 0:
             continue
 
         data = {
-            "image_id": "A1",
+            "image_id": image_id,
             "tile_id": tile_id,
             "region_id": region_id,
             "area": area
         }
 
-        rad51_norm = (rad51_gray - rad51_gray.min()) / (rad51_gray.max() - rad51_gray.min())
-
         for th in rad51_thresholds:
-            counts, area_pix, coords = detect_blobs(rad51_norm, seg, th)
-            data[f"rad51_count_th{th}"] = counts.get(region_id, 0)
-            data[f"rad51_area_th{th}"] = area_pix.get(region_id, 0) / area if area > 0 else 0
+            counts, area_pix, _ = rad51_foci[th]
+            data[f"rad51_count_th{th}"] = counts[region_id]
+            data[f"rad51_area_th{th}"] = area_pix[region_id] / area if area > 0 else 0
 
         for th in prob_thresholds:
             if prob_norm is not None:
-                counts, area_pix, coords = detect_blobs(prob_norm, seg, th)
-                data[f"prob_count_th{th}"] = counts.get(region_id, 0)
-                data[f"prob_area_th{th}"] = area_pix.get(region_id, 0) / area if area > 0 else 0
-
-        df_all.append(data)
-
-# --- Save CSV ---
-pd.DataFrame(df_all).to_csv(f"{output_dir}/foci_per_nucleus_multi_threshold.csv", index=False)
-print("📊 Saved: foci_per_nucleus_multi_threshold.csv")
\ No newline at end of file
+                counts, area_pix, _ = prob_foci[th]
+                data[f"prob_count_th{th}"] = counts[region_id]
+                data[f"prob_area_th{th}"] = area_pix[region_id] / area if area > 0 else 0
+
+        for th in h2ax_thresholds:
+            if h2ax_norm is not None:
+                counts, area_pix, _ = h2ax_foci[th]
+                data[f"h2ax_count_th{th}"] = counts[region_id]
+                data[f"h2ax_area_th{th}"] = area_pix[region_id] / area if area > 0 else 0
+                coloc_rad51, coloc_h2ax = coloc[th]
+                rad51_count = rad51_foci[th][0][region_id]
+                data[f"coloc_count_th{th}"] = coloc_rad51[region_id]
+                data[f"coloc_rad51_fraction_th{th}"] = coloc_rad51[region_id] / rad51_count if rad51_count > 0 else 0
+                data[f"coloc_h2ax_fraction_th{th}"] = coloc_h2ax[region_id] / counts[region_id] if counts[region_id] > 0 else 0
+
+        rows.append(data)
+
+    tables = long_tables(nuclei, {"rad51": rad51_foci, "prob": prob_foci, "h2ax": h2ax_foci}) if long_format else None
+    return rows, tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count foci per nucleus for several RAD51, probability and H2AX thresholds, with RAD51/H2AX colocalization.")
+    parser.add_argument("--workers", type=int, default=1, help="number of tiles processed in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    parser.add_argument("--fresh", action="store_true", help="reprocess every tile instead of resuming from the manifest")
+    parser.add_argument("--parquet", nargs="?", const=default_root, metavar="DIR",
+                        help=f"also write the long-format Parquet dataset with per-focus records (default DIR: {default_root})")
+    parser.add_argument("--classifier", nargs="?", const=pixel_classifier.model_path, metavar="MODEL",
+                        help="predict the probability maps in-process with pixel_classifier.py instead of reading "
+                             f"_Probabilities.npy (trained from {pixel_classifier.project_path} if needed; "
+                             f"default MODEL: {pixel_classifier.model_path})")
+    parser.add_argument("--restrict-to-nuclei", action="store_true",
+                        help="build the LoG scale space only around nuclei (skips background pixels; a few blobs "
+                             "near nucleus edges can differ) and report the skipped fraction per tile")
+    parser.add_argument("--float32", action="store_true",
+                        help="normalize images and build LoG stacks in float32, in per-worker buffers reused "
+                             "across tiles (half the memory; counts can differ slightly from float64)")
+    parser.add_argument("--memory-budget", type=parse_size, metavar="SIZE",
+                        help="run at most as many workers as fit in SIZE (e.g. 4G, 1500M) by the per-tile "
+                             "memory estimate; --workers stays the upper limit")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(f"{output_dir}/visuals", exist_ok=True)
+
+    # --- Process tiles, streaming rows to the CSV; finished tiles with unchanged inputs are skipped ---
+    params = dict(detection_params)
+    if args.restrict_to_nuclei:
+        params["restrict_to_nuclei"] = True
+    if args.float32:
+        params["float32"] = True
+    model = None
+    if args.classifier:
+        model = pixel_classifier.load_or_train(path=args.classifier, loader=loader)
+        params["pixel_classifier"] = model.fingerprint
+    writer = TileResultsWriter(csv_path, csv_columns, params, resume=not args.fresh)
+    tiles = writer.start({tile_id: input_fingerprint(loader.input_paths(tile_id)) for tile_id in loader.tile_ids()})
+    csv_tiles = set(tiles)
+    store = ParquetResultsStore(args.parquet) if args.parquet else None
+    if store is not None:
+        # tiles already in the CSV but not yet in the dataset (e.g. --parquet added on a resumed run)
+        tiles += [tile_id for tile_id in loader.tile_ids() if tile_id not in csv_tiles and not store.has_tile("A1", tile_id)]
+    workers = args.workers
+    if args.memory_budget and tiles:
+        shape = max((loader.seg(tile_id).shape for tile_id in tiles if loader.has_seg(tile_id)),
+                    key=np.prod, default=(0, 0))
+        features = model.features if model else None
+        workers = workers_for_budget(args.memory_budget, tile_memory_bytes(shape, args.float32, features),
+                                     args.workers)
+    worker = partial(process_tile, long_format=store is not None, classifier=args.classifier,
+                     restrict=args.restrict_to_nuclei, float32=args.float32)
+    for tile_id, (rows, tables) in run_tiles(worker, tiles, workers=workers):
+        if tile_id in csv_tiles:
+            writer.write(tile_id, rows)
+        if store is not None and tables is not None:
+            store.write_tile("A1", tile_id, *tables)
+
+    print("📊 Saved: foci_per_nucleus_multi_threshold.csv")
+    if store is not None:
+        print(f"💾 Saved Parquet dataset: {store.root}/nuclei, {store.root}/foci")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from tile_loader import TileLoader
+from well_windows import open_well_image, detect_windowed, label_stats, assign_foci_windowed, stitch_tile_labels
+
+# --- Configuration ---
+output_dir = "outputs"
+
+rad51_thresholds = [0.15, 0.2, 0.25]
+
+min_sigma = 1
+max_sigma = 4
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Count foci per nucleus on a whole-well composite, window by window, without splitting it into tiles.")
+    parser.add_argument("--image", required=True, help="whole-well RAD51 image (.tif/.tiff/.npy memory-mapped; .png decoded once)")
+    labels_group = parser.add_mutually_exclusive_group(required=True)
+    labels_group.add_argument("--labels", help="whole-well nucleus label image (.npy)")
+    labels_group.add_argument("--tile-labels", metavar="BASE_DIR",
+                              help="stitch the per-tile segmentations in BASE_DIR/dapi (as cut by splitting.py)")
+    parser.add_argument("--grid", default="3x5", help="ROWSxCOLS of the tile grid for --tile-labels (default: 3x5)")
+    parser.add_argument("--image-id", default="A1")
+    parser.add_argument("--window", type=int, default=1024, help="window size in pixels (default: 1024)")
+    args = parser.parse_args()
+
+    os.makedirs(output_dir, exist_ok=True)
+    img = open_well_image(args.image)
+
+    # ---- Nucleus labels ----
+    if args.tile_labels:
+        rows, cols = map(int, args.grid.lower().split("x"))
+        loader = TileLoader(args.tile_labels)
+        labels_path = f"{output_dir}/{args.image_id}_labels.npy"
+        merged = stitch_tile_labels([loader.seg(tile_id) for tile_id in loader.tile_ids()], (rows, cols), labels_path)
+        print(f"🧵 Stitched {rows}x{cols} tile segmentations ({merged} seam contacts merged): {labels_path}")
+    else:
+        labels_path = args.labels
+    labels = np.load(labels_path, mmap_mode="r")
+
+    if labels.shape != img.shape:
+        if labels.shape[0] > img.shape[0] or labels.shape[1] > img.shape[1]:
+            raise ValueError(f"Label image {labels.shape} is larger than the well image {img.shape}")
+        print(f"⚠️ Labels cover {labels.shape} of the {img.shape} image; analysing that region only")
+        img = img[:labels.shape[0], :labels.shape[1]]
+
+    areas, centroids = label_stats(labels, window=args.window)
+    region_ids = np.flatnonzero(areas[1:]) + 1
+    print(f"🔬 {args.image_id}: {img.shape[0]}x{img.shape[1]} px, {len(region_ids)} nuclei")
+
+    # ---- Windowed detection ----
+    foci = detect_windowed(img, rad51_thresholds, window=args.window, min_sigma=min_sigma, max_sigma=max_sigma)
+
+    table = {
+        "image_id": args.image_id,
+        "region_id": region_ids,
+        "area": areas[region_ids],
+        "centroid_y": centroids[region_ids, 0],
+        "centroid_x": centroids[region_ids, 1],
+    }
+    for th in rad51_thresholds:
+        counts, area_pix, _ = assign_foci_windowed(foci[th], labels, len(areas))
+        table[f"rad51_count_th{th}"] = counts[region_ids]
+        table[f"rad51_area_th{th}"] = area_pix[region_ids] / areas[region_ids]
+        print(f"✅ th={th}: {len(foci[th])} foci, {int(counts[region_ids].sum())} inside nuclei")
+
+    csv_path = f"{output_dir}/foci_per_nucleus_{args.image_id}_well.csv"
+    pd.DataFrame(table).to_csv(csv_path, index=False)
+    print(f"📊 Saved: {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
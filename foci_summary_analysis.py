@@ -1,77 +1,283 @@
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import os
+from results_store import read_table, iter_table, wide_to_long, default_root, foci_channels
 
-# Load the CSV
 csv_path = "outputs/foci_per_nucleus_multi_threshold.csv"
-df = pd.read_csv(csv_path)
-
-# --- Biologically Relevant Overview ---
-os.makedirs("outputs/analysis", exist_ok=True)
-
-overview_stats = {
-    "Total nuclei analyzed": [len(df)],
-    "Mean area (pixels)": [df['area'].mean()],
-    "Median area (pixels)": [df['area'].median()],
-    "Std area (pixels)": [df['area'].std()],
-    "Min area (pixels)": [df['area'].min()],
-    "Max area (pixels)": [df['area'].max()],
-}
-
-overview_df = pd.DataFrame(overview_stats)
-overview_df.to_csv("outputs/analysis/summary_overview.csv", index=False)
-print("\n===== General Overview =====")
-print(overview_df.to_string(index=False))
-
-# --- Per-method Summary ---
-foci_methods = [col for col in df.columns if col.startswith("rad51_count") or col.startswith("prob_count")]
-area_methods = [col for col in df.columns if col.startswith("rad51_area") or col.startswith("prob_area")]
-
-summary_data = []
-for count_col in foci_methods:
-    area_col = count_col.replace("_count_", "_area_")
-    values = df[count_col]
-    area_vals = df[area_col] if area_col in df.columns else pd.Series([None] * len(df))
-    method_label = count_col.replace("_count_", ": ")
-    summary_data.append({
-        "Method": method_label,
-        "Avg Foci/Nucleus": values.mean(),
-        "Median Foci/Nucleus": values.median(),
-        "Std Foci/Nucleus": values.std(),
-        "% Nuclei with ≥1 Foci": (values > 0).mean() * 100,
-        "Max Foci Observed": values.max(),
-        "Avg Foci Area Fraction": area_vals.mean(),
-        "Median Foci Area Fraction": area_vals.median(),
-        "Std Foci Area Fraction": area_vals.std()
+columns = ["well", "tile", "region_id", "area", "channel", "threshold", "count", "area_fraction"]
+
+# Histogram bins: foci counts and nucleus areas are integers (exact), area fractions use 1/1024 bins
+fraction_bin = 1 / 1024
+kde_gridsize = 200
+kde_cut = 3
+
+
+# --- Histograms and binned KDEs ---
+def histogram(values, width=1):
+    """Counts of floor(values / width), NaN dropped; bin k covers [k * width, (k + 1) * width)."""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    return np.bincount(np.maximum(np.floor(values / width), 0).astype(np.int64))
+
+
+def add_histograms(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    a = a.copy()
+    a[:len(b)] += b
+    return a
+
+
+def hist_median(hist, centers):
+    """Median of binned data, averaging the two middle values like pandas for an even count."""
+    n = hist.sum()
+    if n == 0:
+        return np.nan
+    cumulative = np.cumsum(hist)
+    lower = centers[np.searchsorted(cumulative, (n - 1) // 2 + 1)]
+    upper = centers[np.searchsorted(cumulative, n // 2 + 1)]
+    return (lower + upper) / 2
+
+
+def binned_kde(hist, centers):
+    """Gaussian KDE (Scott bandwidth, as seaborn uses) evaluated from a histogram instead of raw points.
+
+    For integer data binned at width 1 this is the same curve as a KDE of the
+    raw values; the cost depends on the number of bins, not of nuclei.
+    """
+    n = hist.sum()
+    if n < 2:
+        return None
+    used = hist > 0
+    weights, points = hist[used], centers[used]
+    mean = (weights * points).sum() / n
+    std = np.sqrt((weights * (points - mean) ** 2).sum() / (n - 1))
+    if std == 0:
+        return None
+    bw = std * n ** (-1 / 5)
+    grid = np.linspace(points.min() - kde_cut * bw, points.max() + kde_cut * bw, kde_gridsize)
+    z = (grid[:, None] - points[None, :]) / bw
+    density = (np.exp(-0.5 * z ** 2) * weights).sum(axis=1) / (n * bw * np.sqrt(2 * np.pi))
+    return grid, density
+
+
+def count_centers(hist):
+    return np.arange(len(hist), dtype=float)
+
+
+def fraction_centers(hist):
+    return (np.arange(len(hist)) + 0.5) * fraction_bin
+
+
+# --- Exact summary of an in-memory long table ---
+def summarize(df):
+    """(overview, per-method summary, {(channel, threshold): (count hist, fraction hist)}) in one grouped pass."""
+    nuclei = df.drop_duplicates(["well", "tile", "region_id"])
+    overview = pd.DataFrame({
+        "Total nuclei analyzed": [len(nuclei)],
+        "Mean area (pixels)": [nuclei['area'].mean()],
+        "Median area (pixels)": [nuclei['area'].median()],
+        "Std area (pixels)": [nuclei['area'].std()],
+        "Min area (pixels)": [nuclei['area'].min()],
+        "Max area (pixels)": [nuclei['area'].max()],
+    })
+
+    methods = df.assign(positive=df["count"] > 0).groupby(["channel", "threshold"], sort=False)
+    summary = methods.agg(**{
+        "Avg Foci/Nucleus": ("count", "mean"),
+        "Median Foci/Nucleus": ("count", "median"),
+        "Std Foci/Nucleus": ("count", "std"),
+        "% Nuclei with ≥1 Foci": ("positive", "mean"),
+        "Max Foci Observed": ("count", "max"),
+        "Avg Foci Area Fraction": ("area_fraction", "mean"),
+        "Median Foci Area Fraction": ("area_fraction", "median"),
+        "Std Foci Area Fraction": ("area_fraction", "std"),
     })
+    summary["% Nuclei with ≥1 Foci"] *= 100
+    summary.insert(0, "Method", [f"{channel}: th{threshold}" for channel, threshold in summary.index])
+
+    hists = {key: (histogram(group["count"]), histogram(group["area_fraction"], fraction_bin))
+             for key, group in methods}
+    return overview, summary.reset_index(drop=True), hists
+
+
+# --- Streaming summary for tables larger than memory ---
+class StreamingSummary:
+    """Per-(channel, threshold) moments and histograms merged chunk by chunk.
+
+    Means and stds are merged exactly (Chan et al.), count and area medians
+    come from exact integer histograms and area-fraction medians from
+    fraction_bin-wide bins, so memory depends on the number of methods
+    and bins, not of nuclei.
+    """
+
+    def __init__(self):
+        self.methods = {}
+        self.area = None
+
+    @staticmethod
+    def _moments(values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        n = len(values)
+        mean = values.mean() if n else 0.0
+        return {"n": n, "mean": mean, "m2": ((values - mean) ** 2).sum(),
+                "min": values.min() if n else np.inf, "max": values.max() if n else -np.inf}
+
+    @staticmethod
+    def _merge(a, b):
+        if a is None or a["n"] == 0:
+            return b
+        if b["n"] == 0:
+            return a
+        n = a["n"] + b["n"]
+        delta = b["mean"] - a["mean"]
+        return {"n": n, "mean": a["mean"] + delta * b["n"] / n,
+                "m2": a["m2"] + b["m2"] + delta ** 2 * a["n"] * b["n"] / n,
+                "min": min(a["min"], b["min"]), "max": max(a["max"], b["max"])}
+
+    def add_nuclei(self, areas):
+        moments = self._moments(areas)
+        previous = self.area or {"moments": None, "hist": np.zeros(0, dtype=np.int64)}
+        self.area = {"moments": self._merge(previous["moments"], moments),
+                     "hist": add_histograms(previous["hist"], histogram(areas))}
+
+    def add(self, chunk):
+        for key, group in chunk.groupby(["channel", "threshold"], sort=False):
+            state = self.methods.setdefault(key, {"rows": 0, "positive": 0, "count": None, "fraction": None,
+                                                  "count_hist": np.zeros(0, dtype=np.int64),
+                                                  "fraction_hist": np.zeros(0, dtype=np.int64)})
+            state["rows"] += len(group)
+            state["positive"] += int((group["count"] > 0).sum())
+            state["count"] = self._merge(state["count"], self._moments(group["count"]))
+            state["fraction"] = self._merge(state["fraction"], self._moments(group["area_fraction"]))
+            state["count_hist"] = add_histograms(state["count_hist"], histogram(group["count"]))
+            state["fraction_hist"] = add_histograms(state["fraction_hist"], histogram(group["area_fraction"], fraction_bin))
+
+    @staticmethod
+    def _std(moments):
+        return np.sqrt(moments["m2"] / (moments["n"] - 1)) if moments["n"] > 1 else np.nan
+
+    def result(self):
+        area, hist = self.area["moments"], self.area["hist"]
+        overview = pd.DataFrame({
+            "Total nuclei analyzed": [area["n"]],
+            "Mean area (pixels)": [area["mean"]],
+            "Median area (pixels)": [hist_median(hist, count_centers(hist))],
+            "Std area (pixels)": [self._std(area)],
+            "Min area (pixels)": [area["min"]],
+            "Max area (pixels)": [area["max"]],
+        })
+        rows = []
+        hists = {}
+        for (channel, threshold), s in self.methods.items():
+            rows.append({
+                "Method": f"{channel}: th{threshold}",
+                "Avg Foci/Nucleus": s["count"]["mean"],
+                "Median Foci/Nucleus": hist_median(s["count_hist"], count_centers(s["count_hist"])),
+                "Std Foci/Nucleus": self._std(s["count"]),
+                "% Nuclei with ≥1 Foci": s["positive"] / s["rows"] * 100,
+                "Max Foci Observed": int(s["count"]["max"]) if s["count"]["n"] else np.nan,
+                "Avg Foci Area Fraction": s["fraction"]["mean"] if s["fraction"]["n"] else np.nan,
+                "Median Foci Area Fraction": hist_median(s["fraction_hist"], fraction_centers(s["fraction_hist"])),
+                "Std Foci Area Fraction": self._std(s["fraction"]),
+            })
+            hists[(channel, threshold)] = (s["count_hist"], s["fraction_hist"])
+        return overview, pd.DataFrame(rows), hists
+
+
+def filter_rows(df, args):
+    if args.wells:
+        df = df[df["well"].isin(args.wells)]
+    if args.channels:
+        df = df[df["channel"].isin(args.channels)]
+    return df
+
+
+def stream_results(args):
+    """Feed the results to a StreamingSummary args.chunksize rows at a time."""
+    stream = StreamingSummary()
+    if args.parquet:
+        reference = None
+        for chunk in iter_table(args.parquet, "nuclei", columns=columns, wells=args.wells, channels=args.channels,
+                                batch_size=args.chunksize):
+            if chunk.empty:
+                continue
+            # every nucleus has one row per method; count nuclei on the first method only
+            reference = reference or (chunk["channel"].iloc[0], chunk["threshold"].iloc[0])
+            stream.add_nuclei(chunk.loc[(chunk["channel"] == reference[0]) & (chunk["threshold"] == reference[1]), "area"])
+            stream.add(chunk)
+    else:
+        for wide in pd.read_csv(csv_path, chunksize=args.chunksize):
+            if args.wells:
+                wide = wide[wide["image_id"].isin(args.wells)]
+            chunk = filter_rows(wide_to_long(wide), args)
+            # same nuclei as summarize(): those with a row left after filtering (one wide row per nucleus)
+            stream.add_nuclei(chunk.drop_duplicates(["well", "tile", "region_id"])["area"])
+            stream.add(chunk)
+    return stream.result()
+
+
+# --- Load per-nucleus results in long format (one row per nucleus, channel and threshold) ---
+def load_results(args):
+    if args.parquet:
+        return read_table(args.parquet, "nuclei", columns=columns, wells=args.wells, channels=args.channels)
+    return filter_rows(wide_to_long(pd.read_csv(csv_path)), args)
+
+
+def plot_kdes(hists, which, centers, title, xlabel, path):
+    plt.figure(figsize=(12, 6))
+    for (channel, threshold), pair in hists.items():
+        kde = binned_kde(pair[which], centers(pair[which]))
+        if kde is not None:
+            plt.plot(*kde, label=f"{channel}: th{threshold}")
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel("Density")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overview statistics and distributions of foci per nucleus.")
+    parser.add_argument("--parquet", nargs="?", const=default_root, metavar="DIR",
+                        help=f"read the Parquet results dataset instead of {csv_path} (default DIR: {default_root})")
+    parser.add_argument("--wells", nargs="+", help="only these wells")
+    parser.add_argument("--channels", nargs="+", help=f"only these channels ({', '.join(foci_channels)})")
+    parser.add_argument("--chunksize", type=int,
+                        help="stream the results this many rows at a time with bounded memory "
+                             f"(area-fraction medians then come from {round(1 / fraction_bin)} bins per unit)")
+    args = parser.parse_args()
+
+    if args.chunksize:
+        overview_df, summary_df, hists = stream_results(args)
+    else:
+        overview_df, summary_df, hists = summarize(load_results(args))
+
+    # --- Biologically Relevant Overview ---
+    os.makedirs("outputs/analysis", exist_ok=True)
+    overview_df.to_csv("outputs/analysis/summary_overview.csv", index=False)
+    print("\n===== General Overview =====")
+    print(overview_df.to_string(index=False))
+
+    # --- Per-method Summary ---
+    summary_df.to_csv("outputs/analysis/summary_by_method.csv", index=False)
+    print("\n===== Summary of Foci Detection by Method =====")
+    print(summary_df.to_string(index=False))
+
+    # --- Plot distributions (KDEs from the per-method histograms) ---
+    # one curve per method (channel: threshold), so the axes name foci in general, not one channel
+    plot_kdes(hists, 0, count_centers, "Distribution of Foci Counts per Nucleus (Biological Scale)",
+              "Number of Foci per Nucleus", "outputs/analysis/foci_count_distributions.png")
+    plot_kdes(hists, 1, fraction_centers, "Distribution of Foci Area Fraction per Nucleus",
+              "Foci Area Fraction", "outputs/analysis/foci_area_distributions.png")
+
+    print("\n✅ Full analysis complete. Summaries and plots saved in outputs/analysis/")
+
 
-summary_df = pd.DataFrame(summary_data)
-summary_df.to_csv("outputs/analysis/summary_by_method.csv", index=False)
-print("\n===== Summary of Foci Detection by Method =====")
-print(summary_df.to_string(index=False))
-
-# --- Plot distributions ---
-plt.figure(figsize=(12, 6))
-for col in foci_methods:
-    sns.kdeplot(df[col], label=col.replace("_count_", ": "))
-plt.title("Distribution of Foci Counts per Nucleus (Biological Scale)")
-plt.xlabel("Number of RAD51 Foci per Nucleus")
-plt.ylabel("Density")
-plt.legend()
-plt.tight_layout()
-plt.savefig("outputs/analysis/foci_count_distributions.png")
-plt.close()
-
-plt.figure(figsize=(12, 6))
-for col in area_methods:
-    sns.kdeplot(df[col], label=col.replace("_area_", ": "))
-plt.title("Distribution of RAD51+ Area Fraction per Nucleus")
-plt.xlabel("RAD51+ Area Fraction")
-plt.ylabel("Density")
-plt.legend()
-plt.tight_layout()
-plt.savefig("outputs/analysis/foci_area_distributions.png")
-plt.close()
-
-print("\n✅ Full analysis complete. Summaries and plots saved in outputs/analysis/")
+if __name__ == "__main__":
+    main()
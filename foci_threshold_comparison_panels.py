@@ -1,104 +1,116 @@
 import os
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
-from skimage.io import imread
-from skimage.feature import blob_log
-from skimage.color import rgba2rgb, rgb2gray
+from foci_detection import detect_blobs_multi, assign_foci
+from tile_pipeline import run_tiles
+import profiling
+from tile_loader import TileLoader
+from foci_threshold_sweep import load_curves
 
 # Paths
 base_dir = "images/A1"
-rad51_dir = os.path.join(base_dir, "rad51")
-seg_dir = os.path.join(base_dir, "dapi")
+loader = TileLoader(base_dir)
 
 # Blob detection thresholds to compare
 thresholds = [0.2,0.25,0.3,0.35,0.4]
 min_sigma = 1
 max_sigma = 4
 
-# Output directory
-os.makedirs("outputs", exist_ok=True)
 
-# Dictionary to store foci count distributions per threshold
-threshold_foci_distributions = {}
+# --- Per-tile counts (runs in a worker process when --workers > 1) ---
+# Each tile is loaded once; the LoG scale space is shared by all thresholds
+def process_tile(tile_id):
+    if not loader.has_seg(tile_id):
+        print(f"Segmentation not found for {tile_id}")
+        return None
 
-for threshold in thresholds:
-    all_foci_counts = []
+    with profiling.stage("load"):
+        seg = loader.seg(tile_id)
+        rad51_norm = loader.channel(tile_id, "rad51")
 
-    for fname in sorted(os.listdir(rad51_dir)):
-        if not fname.endswith(".png"):
-            continue
+    # Detect foci for all thresholds at once
+    with profiling.stage("detect"):
+        blobs_by_threshold = detect_blobs_multi(rad51_norm, thresholds, min_sigma=min_sigma, max_sigma=max_sigma)
 
-        tile_id = fname.replace(".png", "")
-        rad51_path = os.path.join(rad51_dir, fname)
-        seg_path = os.path.join(seg_dir, tile_id + "_seg.npy")
-
-        if not os.path.exists(seg_path):
-            print(f"Segmentation not found for {tile_id}")
-            continue
-
-        # Load and convert RAD51 image
-        rad51_raw = imread(rad51_path)
-        if rad51_raw.ndim == 3:
-            if rad51_raw.shape[2] == 4:
-                rad51_rgb = rgba2rgb(rad51_raw)
-            else:
-                rad51_rgb = rad51_raw
-            rad51 = (rgb2gray(rad51_rgb) * 255).astype(np.uint8)
-        else:
-            rad51 = rad51_raw
-
-        # Load segmentation mask
-        loaded = np.load(seg_path, allow_pickle=True).item()
-        seg = loaded['masks']
-
-        # Detect foci using current threshold
-        rad51_norm = (rad51 - rad51.min()) / (rad51.max() - rad51.min())
-        blobs = blob_log(rad51_norm, min_sigma=min_sigma, max_sigma=max_sigma, threshold=threshold)
-        foci_coords = blobs[:, :2].astype(int)
+    nucleus_ids = np.unique(seg)
+    nucleus_ids = nucleus_ids[nucleus_ids > 0]
 
+    tile_counts = {}
+    for threshold in thresholds:
         # Count foci per nucleus
-        foci_counts = {}
-        for y, x in foci_coords:
-            if 0 <= y < seg.shape[0] and 0 <= x < seg.shape[1]:
-                nuc_id = seg[y, x]
-                if nuc_id > 0:
-                    foci_counts[nuc_id] = foci_counts.get(nuc_id, 0) + 1
-
-        for label in np.unique(seg):
-            if label == 0:
+        with profiling.stage("assign"):
+            foci_counts, _, _ = assign_foci(blobs_by_threshold[threshold], seg)
+        tile_counts[threshold] = foci_counts[nucleus_ids].tolist()
+        profiling.count(f"rad51_foci_th{threshold}", len(blobs_by_threshold[threshold]))
+    return tile_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot foci-per-nucleus histograms for several blob thresholds.")
+    parser.add_argument("--workers", type=int, default=1, help="number of tiles processed in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    parser.add_argument("--curves", action="store_true",
+                        help="read counts from the foci_threshold_sweep.py curve table instead of detecting")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    # Output directory
+    os.makedirs("outputs", exist_ok=True)
+
+    # Dictionary to store foci count distributions per threshold
+    threshold_foci_distributions = {threshold: [] for threshold in thresholds}
+
+    if args.curves:
+        swept, curves = load_curves("rad51")
+        missing = [threshold for threshold in thresholds if threshold not in swept]
+        if missing:
+            raise SystemExit(f"❌ Thresholds {missing} are not in the sweep; rerun foci_threshold_sweep.py to cover them")
+        for threshold in thresholds:
+            threshold_foci_distributions[threshold] = curves[f"count_th{threshold}"].tolist()
+    else:
+        for _, tile_counts in run_tiles(process_tile, loader.tile_ids(), workers=args.workers):
+            if tile_counts is None:
                 continue
-            all_foci_counts.append(foci_counts.get(label, 0))
+            for threshold in thresholds:
+                threshold_foci_distributions[threshold].extend(tile_counts[threshold])
+
+    for threshold in thresholds:
+        print(f"Threshold {threshold:.3f}: {len(threshold_foci_distributions[threshold])} nuclei processed")
+
+    # ---- Plotting ----
 
-    threshold_foci_distributions[threshold] = all_foci_counts
-    print(f"Threshold {threshold:.3f}: {len(all_foci_counts)} nuclei processed")
+    # Determine shared axis limits
+    all_counts = [count for counts in threshold_foci_distributions.values() for count in counts]
+    max_foci = max(max(all_counts), 10)
+    bins = range(0, max_foci + 2)
 
-# ---- Plotting ----
+    fig, axs = plt.subplots(len(thresholds), 1, figsize=(8, 3 * len(thresholds)), sharex=True, sharey=True)
 
-# Determine shared axis limits
-all_counts = [count for counts in threshold_foci_distributions.values() for count in counts]
-max_foci = max(max(all_counts), 10)
-bins = range(0, max_foci + 2)
+    for ax, threshold in zip(axs, thresholds):
+        counts = threshold_foci_distributions[threshold]
+        ax.hist(
+            counts,
+            bins=bins,
+            edgecolor="black",
+            alpha=0.7,
+            color="steelblue"
+        )
+        ax.set_title(f"Threshold = {threshold:.3f}")
+        ax.set_ylabel("Nuclei")
 
-fig, axs = plt.subplots(len(thresholds), 1, figsize=(8, 3 * len(thresholds)), sharex=True, sharey=True)
+    axs[-1].set_xlabel("Number of Foci per Nucleus")
+    fig.suptitle("Foci per Nucleus Distribution Across Thresholds", fontsize=14, y=1.01)
+    fig.tight_layout()
 
-for ax, threshold in zip(axs, thresholds):
-    counts = threshold_foci_distributions[threshold]
-    ax.hist(
-        counts,
-        bins=bins,
-        edgecolor="black",
-        alpha=0.7,
-        color="steelblue"
-    )
-    ax.set_title(f"Threshold = {threshold:.3f}")
-    ax.set_ylabel("Nuclei")
+    # Save the figure
+    plt.savefig("outputs/foci_distribution_panels.png", dpi=300, bbox_inches='tight')
+    plt.close()
 
-axs[-1].set_xlabel("Number of Foci per Nucleus")
-fig.suptitle("Foci per Nucleus Distribution Across Thresholds", fontsize=14, y=1.01)
-fig.tight_layout()
+    print("📊 Saved multi-panel histogram: outputs/foci_distribution_panels.png")
 
-# Save the figure
-plt.savefig("outputs/foci_distribution_panels.png", dpi=300, bbox_inches='tight')
-plt.close()
 
-print("📊 Saved multi-panel histogram: outputs/foci_distribution_panels.png")
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,22 @@
 import os
+import argparse
+import random
+from functools import partial
+from math import sqrt
 import numpy as np
-import pandas as pd
-from math import pi, sqrt
-from skimage.io import imread, imsave
-from skimage.feature import blob_log
-from skimage.color import rgba2rgb, rgb2gray
-from skimage.measure import regionprops
-import matplotlib.pyplot as plt
 import cv2
-import random
+from foci_detection import detect_tile_foci
+from label_index import LabelIndex
+from tile_loader import TileLoader
+from tile_pipeline import run_tiles
+import profiling
 
 # --- Configuration ---
 base_dir = "images/A1"
-rad51_dir = os.path.join(base_dir, "rad51")
-dapi_dir = os.path.join(base_dir, "dapi")
-seg_dir = os.path.join(base_dir, "dapi")
+loader = TileLoader(base_dir)
 
 output_dir = "outputs"
-os.makedirs(output_dir, exist_ok=True)
-os.makedirs(f"{output_dir}/visuals", exist_ok=True)
+visuals_dir = f"{output_dir}/visuals"
 
 rad51_thresholds = [0.05, 0.10, 0.15, 0.2, 0.25]
 prob_thresholds = [0.2, 0.25, 0.3, 0.35, 0.4]
@@ -26,107 +24,149 @@ prob_thresholds = [0.2, 0.25, 0.3, 0.35, 0.4]
 min_sigma = 1
 max_sigma = 4
 
-# --- Utility: blob detection ---
-def detect_blobs(img, seg, threshold):
-    blobs = blob_log(img, min_sigma=min_sigma, max_sigma=max_sigma, threshold=threshold)
-    counts = {}
-    area_pix = {}
-    coords = []
-    for blob in blobs:
-        if len(blob) < 3:
-            continue
-        y, x, sigma = blob[:3]
-        y, x = int(y), int(x)
-        if 0 <= y < seg.shape[0] and 0 <= x < seg.shape[1]:
-            nuc_id = seg[y, x]
-            if nuc_id > 0:
-                counts[nuc_id] = counts.get(nuc_id, 0) + 1
-                area_pix[nuc_id] = area_pix.get(nuc_id, 0) + pi * sigma**2
-                coords.append((nuc_id, x, y, sigma))
-    return counts, area_pix, coords
-
-# --- Generate debug nucleus visuals from first image ---
-first_image = sorted([f for f in os.listdir(rad51_dir) if f.endswith(".png") and "Probabilities" not in f])[0]
-tile_id = first_image.replace(".png", "")
-
-rad51_path = os.path.join(rad51_dir, first_image)
-dapi_path = os.path.join(dapi_dir, first_image)
-seg_path = os.path.join(seg_dir, tile_id + "_seg.npy")
-prob_path = os.path.join(rad51_dir, tile_id + "_Probabilities.npy")
-
-rad51_raw = imread(rad51_path)
-if rad51_raw.ndim == 3:
-    rad51_rgb = rgba2rgb(rad51_raw) if rad51_raw.shape[2] == 4 else rad51_raw
-else:
-    rad51_rgb = cv2.cvtColor(rad51_raw, cv2.COLOR_GRAY2RGB)
-
-rad51_gray = (rgb2gray(rad51_rgb) * 255).astype(np.uint8)
-
-prob = np.load(prob_path) if os.path.exists(prob_path) else None
-if prob is not None:
-    if prob.shape[-1] == 2:
-        prob = prob[..., 1]  # Take the second channel
-    if prob.ndim != 2:
-        raise ValueError(f"Expected 2D probability image but got shape: {prob.shape}")
-    prob_norm = (prob - prob.min()) / (prob.max() - prob.min())
-else:
-    prob_norm = None
-
-seg = np.load(seg_path, allow_pickle=True).item()['masks']
-regions = regionprops(seg)
-random.seed(42)
-region_ids = [r.label for r in regions if r.area > 0]
-selected_nuclei = random.sample(region_ids, min(20, len(region_ids)))
-
-for r in regions:
-    region_id = r.label
-    area = r.area
-    if area == 0 or region_id not in selected_nuclei:
-        continue
-
-    crop = r.bbox
-    minr, minc, maxr, maxc = crop
-    pad = 10
-    minr, minc = max(0, minr - pad), max(0, minc - pad)
-    maxr, maxc = min(seg.shape[0], maxr + pad), min(seg.shape[1], maxc + pad)
-
-    base_crop = (rad51_rgb[minr:maxr, minc:maxc] * 255).astype(np.uint8) if rad51_rgb.max() <= 1 else rad51_rgb[minr:maxr, minc:maxc]
-
-    panels = [base_crop.copy()]
-    titles = ["Nucleus\n(no overlay)"]
-
-    rad51_norm = (rad51_gray - rad51_gray.min()) / (rad51_gray.max() - rad51_gray.min())
-
-    for th in rad51_thresholds:
-        counts, area_pix, coords = detect_blobs(rad51_norm, seg, th)
-        sub = base_crop.copy()
-        for nid, x, y, sigma in coords:
-            if nid == region_id:
-                cx, cy = x - minc, y - minr
-                cv2.circle(sub, (cx, cy), int(sqrt(2) * sigma), (0, 255, 255), 1)
-        panels.append(sub)
-        titles.append(f"RAD51\nth={th:.3f}")
-
-    for th in prob_thresholds:
-        if prob_norm is not None:
-            counts, area_pix, coords = detect_blobs(prob_norm, seg, th)
-            sub = base_crop.copy()
-            for nid, x, y, sigma in coords:
-                if nid == region_id:
-                    cx, cy = x - minc, y - minr
-                    cv2.circle(sub, (cx, cy), int(sqrt(2) * sigma), (255, 0, 255), 1)
-            panels.append(sub)
-            titles.append(f"Prob\nth={th:.3f}")
-
-    if panels:
-        concat = cv2.hconcat(panels)
-        fig, ax = plt.subplots(figsize=(len(panels) * 3, 3))
-        ax.imshow(cv2.cvtColor(concat, cv2.COLOR_BGR2RGB))
-        ax.axis('off')
-        for i, title in enumerate(titles):
-            ax.text(i * concat.shape[1] // len(panels) + 10, -10, title, color='black', fontsize=8,
-                    backgroundcolor='white', fontweight='bold', va='top')
-        vis_path = f"{output_dir}/visuals/debug_nucleus_{region_id}.png"
-        fig.savefig(vis_path, bbox_inches='tight', dpi=200)
-        plt.close(fig)
-        print(f"✅ Saved: {vis_path}")
+n_nuclei = 20
+seed = 42
+cell = 96          # contact-sheet cell size in pixels; crops are scaled up to fit
+label_width = 96   # left column with tile and nucleus id
+header_height = 30
+rows_per_sheet = 60
+
+# BGR, as written by cv2.imwrite
+rad51_color = (0, 255, 255)
+prob_color = (255, 0, 255)
+text_color = (255, 255, 255)
+font = cv2.FONT_HERSHEY_SIMPLEX
+
+
+# --- Panels ---
+def fit_crop(crop):
+    """Scale a crop up into a cell x cell tile (nearest neighbour, top-left aligned); returns (tile, scale)."""
+    scale = cell / max(crop.shape[:2])
+    h, w = max(1, int(crop.shape[0] * scale)), max(1, int(crop.shape[1] * scale))
+    tile = np.zeros((cell, cell, 3), dtype=np.uint8)
+    tile[:h, :w] = cv2.resize(crop, (w, h), interpolation=cv2.INTER_NEAREST)
+    return tile, scale
+
+
+def draw_blobs(base, blobs, origin, scale, color):
+    panel = base.copy()
+    minr, minc = origin
+    for y, x, sigma in blobs:
+        center = (int((x - minc + 0.5) * scale), int((y - minr + 0.5) * scale))
+        cv2.circle(panel, center, max(1, int(sqrt(2) * sigma * scale)), color, 1, cv2.LINE_AA)
+    return panel
+
+
+def put_lines(img, lines, x, y, scale=0.4):
+    for i, line in enumerate(lines):
+        cv2.putText(img, line, (x, y + 12 * i), font, scale, text_color, 1, cv2.LINE_AA)
+
+
+def header(columns):
+    bar = np.zeros((header_height, label_width + cell * len(columns), 3), dtype=np.uint8)
+    for i, title in enumerate(columns):
+        put_lines(bar, title.split("\n"), label_width + i * cell + 4, 12)
+    return bar
+
+
+def column_titles(with_prob):
+    titles = ["Nucleus\n(no overlay)"] + [f"RAD51\nth={th:.3f}" for th in rad51_thresholds]
+    if with_prob:
+        titles += [f"Prob\nth={th:.3f}" for th in prob_thresholds]
+    return titles
+
+
+# --- Per-tile sampling (runs in a worker process when --workers > 1) ---
+def process_tile(tile_id, n_nuclei=n_nuclei, seed=seed):
+    """Sample nuclei of one tile and return [(region_id, strip)], one BGR strip of panels per nucleus."""
+    if not loader.has_seg(tile_id):
+        print(f"⚠️ Skipping {tile_id}: no segmentation file")
+        return []
+
+    with profiling.stage("load"):
+        seg = loader.seg(tile_id)
+        rad51_rgb = loader.rgb(tile_id, "rad51")
+        rad51_norm = loader.channel(tile_id, "rad51")
+        prob_norm = loader.probabilities(tile_id)
+        nuclei = LabelIndex(seg)
+
+    region_ids = [int(label) for label in nuclei.labels]
+    selected = sorted(random.Random(f"{seed}:{tile_id}").sample(region_ids, min(n_nuclei, len(region_ids))))
+    if not selected:
+        return []
+
+    # One multi-threshold detection per channel for the whole tile; panels only read from it
+    with profiling.stage("detect"):
+        rad51_foci = detect_tile_foci(rad51_norm, seg, rad51_thresholds, min_sigma=min_sigma, max_sigma=max_sigma)
+        prob_foci = detect_tile_foci(prob_norm, seg, prob_thresholds, min_sigma=min_sigma, max_sigma=max_sigma) if prob_norm is not None else {}
+
+    strips = []
+    with profiling.stage("render"):
+        for region_id in selected:
+            minr, minc, maxr, maxc = nuclei.bbox(region_id, pad=10)
+            base, scale = fit_crop(cv2.cvtColor(rad51_rgb[minr:maxr, minc:maxc], cv2.COLOR_RGB2BGR))
+            panels = [base]
+            for foci, color in ((rad51_foci, rad51_color), (prob_foci, prob_color)):
+                for th, (_, _, nuclei_blobs) in foci.items():
+                    panels.append(draw_blobs(base, nuclei_blobs[region_id], (minr, minc), scale, color))
+
+            label = np.zeros((cell, label_width, 3), dtype=np.uint8)
+            put_lines(label, [str(tile_id), f"#{region_id}"], 4, 16)
+            strips.append((region_id, np.hstack([label] + panels)))
+
+    print(f"✅ {tile_id}: {len(strips)} nuclei sampled")
+    return strips
+
+
+# --- Contact sheet ---
+def write_sheets(rows, titles, prefix):
+    """Stack the strips under one header row, rows_per_sheet strips per PNG."""
+    paths = []
+    for page, start in enumerate(range(0, len(rows), rows_per_sheet)):
+        sheet = np.vstack([header(titles)] + rows[start:start + rows_per_sheet])
+        path = f"{prefix}.png" if len(rows) <= rows_per_sheet else f"{prefix}_{page + 1}.png"
+        cv2.imwrite(path, sheet)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Contact sheet of sampled nuclei with the foci found at each RAD51/probability threshold.")
+    parser.add_argument("--all-tiles", action="store_true", help="sample nuclei from every tile (default: first tile only)")
+    parser.add_argument("--nuclei", type=int, default=n_nuclei, help=f"nuclei sampled per tile (default: {n_nuclei})")
+    parser.add_argument("--seed", type=int, default=seed, help=f"sampling seed (default: {seed})")
+    parser.add_argument("--strips", action="store_true", help="also save one debug_nucleus_<tile>_<id>.png per nucleus")
+    parser.add_argument("--workers", type=int, default=1, help="number of tiles processed in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    os.makedirs(visuals_dir, exist_ok=True)
+    tiles = loader.tile_ids() if args.all_tiles else loader.tile_ids()[:1]
+
+    rows = []
+    worker = partial(process_tile, n_nuclei=args.nuclei, seed=args.seed)
+    for tile_id, strips in run_tiles(worker, tiles, workers=args.workers):
+        for region_id, strip in strips:
+            rows.append(strip)
+            if args.strips:
+                cv2.imwrite(f"{visuals_dir}/debug_nucleus_{tile_id}_{region_id}.png", strip)
+    if not rows:
+        print("❌ No nuclei to show")
+        return
+
+    # Tiles without a probability map give shorter strips; pad them to the sheet width
+    titles = column_titles(with_prob=any(row.shape[1] > label_width + cell * (1 + len(rad51_thresholds)) for row in rows))
+    width = label_width + cell * len(titles)
+    rows = [np.pad(row, ((0, 0), (0, width - row.shape[1]), (0, 0))) for row in rows]
+
+    prefix = f"{visuals_dir}/debug_contact_sheet" + ("_all" if args.all_tiles else "")
+    for path in write_sheets(rows, titles, prefix):
+        print(f"✅ Saved: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import argparse
+from functools import partial
+import numpy as np
+import pandas as pd
+from foci_detection import sweep_counts
+from tile_loader import TileLoader
+from tile_pipeline import run_tiles
+import profiling
+
+# --- Configuration ---
+base_dir = "images/A1"
+loader = TileLoader(base_dir)
+
+output_dir = "outputs"
+curves_path = output_dir + "/foci_threshold_curves_{method}.csv"
+
+# start, stop (inclusive), step
+rad51_sweep = (0.05, 0.5, 0.005)
+prob_sweep = (0.1, 0.6, 0.005)
+
+min_sigma = 1
+max_sigma = 4
+
+
+def sweep_thresholds(start, stop, step):
+    return [float(th) for th in np.round(np.arange(start, stop + step / 2, step), 6)]
+
+
+# --- Per-tile sweep (runs in a worker process when --workers > 1) ---
+def process_tile(tile_id, rad51_thresholds, prob_thresholds):
+    if not loader.has_seg(tile_id):
+        print(f"⚠️ Skipping {tile_id}: no segmentation file")
+        return None
+
+    with profiling.stage("load"):
+        seg = loader.seg(tile_id)
+        channels = {"rad51": (loader.channel(tile_id, "rad51"), rad51_thresholds),
+                    "prob": (loader.probabilities(tile_id), prob_thresholds)}
+    region_ids = np.flatnonzero(np.bincount(seg.ravel())[1:]) + 1
+
+    frames = {}
+    for method, (img, thresholds) in channels.items():
+        if img is None:
+            continue
+        with profiling.stage("sweep"):
+            counts = sweep_counts(img, seg, thresholds, min_sigma=min_sigma, max_sigma=max_sigma)
+        frame = pd.DataFrame(counts[region_ids], columns=[f"count_th{th}" for th in thresholds])
+        frame.insert(0, "region_id", region_ids)
+        frame.insert(0, "tile_id", tile_id)
+        frames[method] = frame
+    print(f"✅ {tile_id}: {len(region_ids)} nuclei swept")
+    return frames
+
+
+def load_curves(method="rad51"):
+    """Read a curve table back as (thresholds, DataFrame with one count_th column per threshold)."""
+    curves = pd.read_csv(curves_path.format(method=method))
+    count_cols = [col for col in curves.columns if col.startswith("count_th")]
+    return [float(col[len("count_th"):]) for col in count_cols], curves
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-nucleus foci count vs threshold curves from one detection per tile and channel.")
+    parser.add_argument("--rad51", type=float, nargs=3, default=rad51_sweep, metavar=("START", "STOP", "STEP"),
+                        help=f"RAD51 threshold sweep, stop inclusive (default: {rad51_sweep})")
+    parser.add_argument("--prob", type=float, nargs=3, default=prob_sweep, metavar=("START", "STOP", "STEP"),
+                        help=f"probability-map threshold sweep, stop inclusive (default: {prob_sweep})")
+    parser.add_argument("--workers", type=int, default=1, help="number of tiles processed in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    os.makedirs(output_dir, exist_ok=True)
+    rad51_thresholds = sweep_thresholds(*args.rad51)
+    prob_thresholds = sweep_thresholds(*args.prob)
+
+    frames = {"rad51": [], "prob": []}
+    worker = partial(process_tile, rad51_thresholds=rad51_thresholds, prob_thresholds=prob_thresholds)
+    for _, tile_frames in run_tiles(worker, loader.tile_ids(), workers=args.workers):
+        for method, frame in (tile_frames or {}).items():
+            frames[method].append(frame)
+
+    # One table per channel: tile_id, region_id, count_th<t> for every swept threshold
+    for method, thresholds in (("rad51", rad51_thresholds), ("prob", prob_thresholds)):
+        if frames[method]:
+            path = curves_path.format(method=method)
+            pd.concat(frames[method], ignore_index=True).to_csv(path, index=False)
+            print(f"📈 Saved {len(thresholds)} {method} thresholds: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,21 @@ import os
 import numpy as np
 import pandas as pd
 from math import pi, sqrt
-from skimage.io import imread
-from skimage.color import rgba2rgb, rgb2gray
-from skimage.measure import regionprops
 import json
+import argparse
+from functools import partial
+from foci_detection import detect_tile_foci
+from label_index import LabelIndex
+from viewer_export import write_binary_tile, write_pyramid, write_tile_summary
+from tile_pipeline import run_tiles
+import profiling
+from tile_loader import TileLoader, well_loader
+from foci_threshold_sweep import load_curves
 
 # --- Configuration ---
 base_dir = "images/A1"
-rad51_dir = os.path.join(base_dir, "rad51")
-dapi_dir = os.path.join(base_dir, "dapi")
-seg_dir = os.path.join(base_dir, "dapi")
+loader = TileLoader(base_dir)
 output_json_dir = "data"
-os.makedirs(output_json_dir, exist_ok=True)
 
 rad51_thresholds = [0.15, 0.2, 0.25]
 prob_thresholds = [0.3, 0.365, 0.4]
@@ -21,122 +24,138 @@ prob_thresholds = [0.3, 0.365, 0.4]
 min_sigma = 1
 max_sigma = 4
 
-# --- Utility: blob detection ---
-def detect_blobs(img, seg, threshold):
-    from skimage.feature import blob_log
-    blobs = blob_log(img, min_sigma=min_sigma, max_sigma=max_sigma, threshold=threshold)
-    counts = {}
-    area_pix = {}
-    coords = []
-    for blob in blobs:
-        if len(blob) < 3:
-            continue
-        y, x, sigma = blob[:3]
-        y, x = int(y), int(x)
-        if 0 <= y < seg.shape[0] and 0 <= x < seg.shape[1]:
-            nuc_id = seg[y, x]
-            if nuc_id > 0:
-                counts[nuc_id] = counts.get(nuc_id, 0) + 1
-                area_pix[nuc_id] = area_pix.get(nuc_id, 0) + pi * sigma**2
-                coords.append((nuc_id, x, y, sigma))
-    return counts, area_pix, coords
-
-# --- Process all tiles ---
-rad51_tiles = sorted([f for f in os.listdir(rad51_dir) if f.endswith(".png") and "Probabilities" not in f])
-tile_index = []
-
-for tile_filename in rad51_tiles:
-    tile_id = tile_filename.replace(".png", "")
-    tile_index.append(tile_id)
-    rad51_path = os.path.join(rad51_dir, tile_filename)
-    dapi_path = os.path.join(dapi_dir, tile_filename)
-    seg_path = os.path.join(seg_dir, tile_id + "_seg.npy")
-    prob_path = os.path.join(rad51_dir, tile_id + "_Probabilities.npy")
-
-    if not os.path.exists(seg_path):
-        print(f"⚠️ Segmentation not found for {tile_id}, skipping.")
-        continue
-
-    rad51_raw = imread(rad51_path)
-    dapi_raw = imread(dapi_path)
-
-    if rad51_raw.ndim == 3:
-        rad51_rgb = rgba2rgb(rad51_raw) if rad51_raw.shape[2] == 4 else rad51_raw
-        rad51_gray = (rgb2gray(rad51_rgb) * 255).astype(np.uint8)
-    else:
-        rad51_gray = rad51_raw
-
-    if dapi_raw.ndim == 3:
-        dapi_rgb = rgba2rgb(dapi_raw) if dapi_raw.shape[2] == 4 else dapi_raw
-        dapi_gray = (rgb2gray(dapi_rgb) * 255).astype(np.uint8)
-    else:
-        dapi_gray = dapi_raw
-
-    prob = np.load(prob_path) if os.path.exists(prob_path) else None
-    if prob is not None and prob.ndim == 3 and prob.shape[-1] == 2:
-        prob = prob[..., 1]
-    if prob is not None:
-        prob_norm = (prob - prob.min()) / (prob.max() - prob.min())
-    else:
-        prob_norm = None
-
-    seg = np.load(seg_path, allow_pickle=True).item()['masks']
-    regions = regionprops(seg)
 
-    nuclei_data = []
-
-    rad51_norm = (rad51_gray - rad51_gray.min()) / (rad51_gray.max() - rad51_gray.min())
+def convert_numpy(obj):
+    if isinstance(obj, (np.integer, np.int32, np.int64)):
+        return int(obj)
+    elif isinstance(obj, (np.floating, np.float32, np.float64)):
+        return float(obj)
+    elif isinstance(obj, (np.ndarray,)):
+        return obj.tolist()
+    return obj
+
+
+# --- Per-tile export (runs in a worker process when --workers > 1) ---
+# With `well` (plate runs) the tile comes from images/<well> and is written as data/<well>/<tile>.*;
+# returns the id the viewer's index.json lists it under.
+def process_tile(tile_id, output_format="json", rad51_thresholds=rad51_thresholds, prob_thresholds=prob_thresholds,
+                 well=None):
+    tiles = well_loader(well) if well else loader
+    data_id = f"{well}/{tile_id}" if well else tile_id
+    if not tiles.has_seg(tile_id):
+        print(f"⚠️ Segmentation not found for {data_id}, skipping.")
+        return None
+
+    with profiling.stage("load"):
+        seg = tiles.seg(tile_id)
+        rad51_norm = tiles.channel(tile_id, "rad51")
+        prob_norm = tiles.probabilities(tile_id)
+    # One pass over the label image gives every nucleus its pixels, area and centroid
+    with profiling.stage("label_index"):
+        nuclei = LabelIndex(seg)
+    profiling.count("nuclei", len(nuclei))
+
+    # Detect once per (channel, threshold) for the whole tile, then scatter to nuclei
+    with profiling.stage("detect"):
+        rad51_foci = detect_tile_foci(rad51_norm, seg, rad51_thresholds, min_sigma=min_sigma, max_sigma=max_sigma)
+        prob_foci = detect_tile_foci(prob_norm, seg, prob_thresholds, min_sigma=min_sigma, max_sigma=max_sigma) if prob_norm is not None else {}
+    for method, foci in (("rad51", rad51_foci), ("prob", prob_foci)):
+        for th, (counts, _, _) in foci.items():
+            profiling.count(f"{method}_foci_th{th}", counts.sum())
+
+    images = {
+        "rad51_image": f"{tiles.base_dir}/rad51/{tile_id}.png",
+        "dapi_image": f"{tiles.base_dir}/dapi/{tile_id}.png",
+    }
+    os.makedirs(os.path.dirname(os.path.join(output_json_dir, data_id)), exist_ok=True)
+    if output_format in ("binary", "split"):
+        foci = {"rad51": rad51_foci, "prob": prob_foci}
+        with profiling.stage("export"):
+            write_binary_tile(output_json_dir, data_id, images, seg, nuclei, foci)
+            if output_format == "split":
+                pyramid = {channel: write_pyramid(output_json_dir, data_id, channel, images[f"{channel}_image"])
+                           for channel in ("rad51", "dapi")}
+                write_tile_summary(output_json_dir, data_id, pyramid, seg, nuclei, foci)
+        print(f"✅ Saved {output_format} data for {data_id}")
+        return data_id
 
-    for r in regions:
-        region_id = r.label
-        area = r.area
-        centroid = [float(c) for c in r.centroid]
-        coords = list(zip(*np.where(seg == region_id)))
+    nuclei_data = []
+    for region_id in nuclei.labels:
+        area = nuclei.areas[region_id]
+        centroid = [float(c) for c in nuclei.centroids[region_id]]
+        coords = np.stack(nuclei.pixels(region_id), axis=1)
 
         data = {
             "region_id": region_id,
             "area": area,
             "centroid": centroid,
+            "bbox": list(nuclei.bbox(region_id)),
+            "outline": np.stack(nuclei.outline_pixels(region_id), axis=1),
             "pixel_coords": coords
         }
 
         for th in rad51_thresholds:
-            counts, area_pix, coord_list = detect_blobs(rad51_norm, seg, th)
-            data[f"rad51_count_th{th}"] = counts.get(region_id, 0)
-            data[f"rad51_area_th{th}"] = area_pix.get(region_id, 0) / area if area > 0 else 0
-            data[f"rad51_coords_th{th}"] = [[int(y), int(x)] for nid, x, y, sigma in coord_list if nid == region_id]
+            counts, area_pix, nuclei_blobs = rad51_foci[th]
+            data[f"rad51_count_th{th}"] = counts[region_id]
+            data[f"rad51_area_th{th}"] = area_pix[region_id] / area if area > 0 else 0
+            data[f"rad51_coords_th{th}"] = [[int(y), int(x)] for y, x, sigma in nuclei_blobs[region_id]]
 
         for th in prob_thresholds:
             if prob_norm is not None:
-                counts, area_pix, coord_list = detect_blobs(prob_norm, seg, th)
-                data[f"prob_count_th{th}"] = counts.get(region_id, 0)
-                data[f"prob_area_th{th}"] = area_pix.get(region_id, 0) / area if area > 0 else 0
-                data[f"prob_coords_th{th}"] = [[int(y), int(x)] for nid, x, y, sigma in coord_list if nid == region_id]
+                counts, area_pix, nuclei_blobs = prob_foci[th]
+                data[f"prob_count_th{th}"] = counts[region_id]
+                data[f"prob_area_th{th}"] = area_pix[region_id] / area if area > 0 else 0
+                data[f"prob_coords_th{th}"] = [[int(y), int(x)] for y, x, sigma in nuclei_blobs[region_id]]
 
         nuclei_data.append(data)
 
     tile_json = {
-        "tile_id": tile_id,
-        "rad51_image": f"images/A1/rad51/{tile_id}.png",
-        "dapi_image": f"images/A1/dapi/{tile_id}.png",
+        "tile_id": data_id,
+        **images,
         "nuclei": nuclei_data
     }
 
-    def convert_numpy(obj):
-        if isinstance(obj, (np.integer, np.int32, np.int64)):
-            return int(obj)
-        elif isinstance(obj, (np.floating, np.float32, np.float64)):
-            return float(obj)
-        elif isinstance(obj, (np.ndarray,)):
-            return obj.tolist()
-        return obj
-
-    with open(os.path.join(output_json_dir, f"{tile_id}.json"), "w") as f:
+    with profiling.stage("export"), open(os.path.join(output_json_dir, f"{data_id}.json"), "w") as f:
         json.dump(tile_json, f, indent=2, default=convert_numpy)
 
-    print(f"✅ Saved JSON for {tile_id}")
-
-with open(os.path.join(output_json_dir, "index.json"), "w") as f:
-    json.dump({"A1": tile_index}, f, indent=2)
-
-print("✅ Saved index.json")
\ No newline at end of file
+    print(f"✅ Saved JSON for {data_id}")
+    return data_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export per-tile nucleus and foci data for the web viewer.")
+    parser.add_argument("--format", choices=["json", "binary", "split"], default="json",
+                        help="'binary' writes a label-mask RLE and typed-array foci tables (<tile>.bin) "
+                             "with a small <tile>.json manifest instead of per-pixel JSON; 'split' adds a "
+                             "<tile>.summary.json and downsampled images so the viewer loads tiles lazily")
+    parser.add_argument("--workers", type=int, default=1, help="number of tiles processed in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    parser.add_argument("--sweep-thresholds", action="store_true",
+                        help="export every threshold of the foci_threshold_sweep.py curve tables so the viewer's "
+                             "dropdown offers the full sweep (best combined with --format binary)")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    os.makedirs(output_json_dir, exist_ok=True)
+
+    # --- Process all tiles ---
+    thresholds = {"rad51_thresholds": rad51_thresholds, "prob_thresholds": prob_thresholds}
+    if args.sweep_thresholds:
+        thresholds = {"rad51_thresholds": load_curves("rad51")[0], "prob_thresholds": load_curves("prob")[0]}
+    worker = partial(process_tile, output_format=args.format, **thresholds)
+    tile_index = [tile_id for _, tile_id in run_tiles(worker, loader.tile_ids(), workers=args.workers) if tile_id]
+
+    index = {"A1": tile_index}
+    if args.format == "split":
+        # lets the viewer lay out the plate before fetching any tile
+        index["layout"] = {"A1": {"format": "split", "shape": list(loader.seg(tile_index[0]).shape) if tile_index else None}}
+    with open(os.path.join(output_json_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+
+    print("✅ Saved index.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""In-process foci pixel classifier, replacing the Ilastik export of `_Probabilities.npy` maps.
+
+The feature selection, label names, stored labels and forest size are read
+from the Ilastik project (foci_area_model.ilp). A random forest equivalent
+to Ilastik's is retrained on the project's labels or, when the project has
+none, on the confident pixels of the existing `_Probabilities.npy` exports.
+Ilastik's trained vigra forest cannot be loaded without vigra, so it is never
+reused directly. The model is pickled to outputs/models/, and
+`count_foci_and_visualize_v2.py --classifier` predicts the maps inside the
+tile workers and hands them straight to detection.
+
+    python pixel_classifier.py [--project foci_area_model.ilp] [--retrain] [--workers N]
+
+trains the model if needed, predicts every tile and reports agreement with
+the Ilastik maps where they exist.
+"""
+import os
+import re
+import pickle
+import argparse
+import numpy as np
+from functools import partial
+from scipy.ndimage import gaussian_filter1d
+from tile_loader import TileLoader, normalize
+from tile_pipeline import run_tiles
+from results_writer import input_fingerprint
+import profiling
+
+try:
+    import h5py
+except ImportError:  # without it the project's settings are replaced by the defaults below
+    h5py = None
+
+try:
+    from sklearn.ensemble import RandomForestClassifier
+except ImportError:
+    RandomForestClassifier = None
+
+# --- Configuration ---
+project_path = "foci_area_model.ilp"
+model_path = "outputs/models/pixel_classifier.pkl"
+base_dir = "images/A1"
+
+# Used when the project has no feature selection: Ilastik's features at the scales foci live at
+default_features = [(name, sigma) for sigma in (0.7, 1.0, 1.6, 3.5)
+                    for name in ("GaussianSmoothing", "LaplacianOfGaussian", "GaussianGradientMagnitude",
+                                 "DifferenceOfGaussians", "StructureTensorEigenvalues",
+                                 "HessianOfGaussianEigenvalues")]
+default_label_names = ["Background", "Foci"]
+default_num_trees = 100
+
+# Pseudo-labels from existing Ilastik maps (only when the project stores no labels)
+confident = 0.9
+samples_per_class = 5000
+seed = 42
+
+
+def require_sklearn():
+    if RandomForestClassifier is None:
+        raise ImportError("The pixel classifier needs scikit-learn: pip install scikit-learn")
+
+
+# --- Ilastik project ---
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _parse_slice(text):
+    """Ilastik's blockSlice attribute ("[0:10,5:20,0:1]") as a tuple of slices."""
+    return tuple(slice(int(start), int(stop)) for start, stop in re.findall(r"(\d+):(\d+)", _text(text)))
+
+
+def read_project(path=project_path):
+    """Settings of an Ilastik pixel-classification project.
+
+    Returns {"features": [(name, sigma)], "label_names", "num_trees",
+    "labels": [(image path, [(slices, block)])]}, falling back to the
+    defaults above for anything the project does not store (or for
+    everything when h5py is missing).
+    """
+    project = {"features": default_features, "label_names": default_label_names,
+               "num_trees": default_num_trees, "labels": []}
+    if h5py is None:
+        print(f"⚠️ h5py not installed, using default classifier settings instead of {path}")
+        return project
+    with h5py.File(path, "r") as f:
+        selection = f.get("FeatureSelections")
+        if selection is not None and "SelectionMatrix" in selection:
+            names = [_text(name) for name in selection["FeatureIds"][()]]
+            scales = selection["Scales"][()]
+            matrix = selection["SelectionMatrix"][()]
+            features = [(names[i], float(scales[j])) for i, j in zip(*np.nonzero(matrix))]
+            if features:
+                project["features"] = features
+
+        classification = f.get("PixelClassification")
+        if classification is not None:
+            if "LabelNames" in classification:
+                project["label_names"] = [_text(name) for name in classification["LabelNames"][()]]
+            factory = classification.get("ClassifierFactory")
+            if factory is not None:
+                # pickled ParallelVigraRfLazyflowClassifierFactory: "V_num_trees\np7\nI100\n"
+                match = re.search(rb"_num_trees\n(?:p\d+\n)?I(\d+)", np.asarray(factory[()]).tobytes())
+                if match:
+                    project["num_trees"] = int(match[1])
+            lanes = classification.get("LabelSets", {})
+            infos = f.get("Input Data/infos", {})
+            for lane_name, lane in zip(sorted(infos), (lanes[name] for name in sorted(lanes))):
+                raw = infos[lane_name].get("Raw Data")
+                image = _text(raw["filePath"][()]) if raw is not None and "filePath" in raw else None
+                blocks = [(_parse_slice(block.attrs["blockSlice"]), block[()]) for block in lane.values()]
+                if blocks:
+                    project["labels"].append((image, blocks))
+    return project
+
+
+# --- Filter bank (separable Gaussian derivatives, shared per scale) ---
+def _derivatives(img, sigma, orders):
+    """{(order_y, order_x): Gaussian derivative} computed with 1-D passes, reusing the row pass across orders."""
+    rows = {}
+    out = {}
+    for oy, ox in orders:
+        if oy not in rows:
+            rows[oy] = gaussian_filter1d(img, sigma, axis=0, order=oy)
+        out[(oy, ox)] = gaussian_filter1d(rows[oy], sigma, axis=1, order=ox)
+    return out
+
+
+def _eigenvalues(a, b, c):
+    """Eigenvalues of the symmetric 2x2 field [[a, b], [b, c]], largest first (as vigra orders them)."""
+    mean = (a + c) / 2
+    radius = np.sqrt(((a - c) / 2) ** 2 + b ** 2)
+    return [mean + radius, mean - radius]
+
+
+def _feature_orders(name):
+    return {"GaussianSmoothing": [(0, 0)], "DifferenceOfGaussians": [(0, 0)],
+            "LaplacianOfGaussian": [(2, 0), (0, 2)],
+            "GaussianGradientMagnitude": [(1, 0), (0, 1)], "StructureTensorEigenvalues": [(1, 0), (0, 1)],
+            "HessianOfGaussianEigenvalues": [(2, 0), (1, 1), (0, 2)]}[name]
+
+
+def filter_bank(img, features):
+    """(H, W, n_channels) float32 feature stack in Ilastik's feature definitions.
+
+    Derivatives of one scale are computed together from shared 1-D row passes.
+    DifferenceOfGaussians uses scales sigma and 0.66 * sigma, and the structure
+    tensor is smoothed at 0.5 * sigma, as Ilastik does. scipy truncates its
+    kernels at 4 sigma, so values differ slightly from vigra's at the borders.
+    """
+    img = np.asarray(img, dtype=np.float32)
+    by_scale = {}
+    for name, sigma in features:
+        by_scale.setdefault(sigma, set()).update(_feature_orders(name))
+    derivs = {sigma: _derivatives(img, sigma, sorted(orders)) for sigma, orders in by_scale.items()}
+
+    channels = []
+    for name, sigma in features:
+        d = derivs[sigma]
+        if name == "GaussianSmoothing":
+            channels.append(d[(0, 0)])
+        elif name == "DifferenceOfGaussians":
+            inner = gaussian_filter1d(gaussian_filter1d(img, 0.66 * sigma, axis=0), 0.66 * sigma, axis=1)
+            channels.append(d[(0, 0)] - inner)
+        elif name == "LaplacianOfGaussian":
+            channels.append(d[(2, 0)] + d[(0, 2)])
+        elif name == "GaussianGradientMagnitude":
+            channels.append(np.hypot(d[(1, 0)], d[(0, 1)]))
+        elif name == "StructureTensorEigenvalues":
+            outer = 0.5 * sigma
+            smooth = lambda x: gaussian_filter1d(gaussian_filter1d(x, outer, axis=0), outer, axis=1)
+            gy, gx = d[(1, 0)], d[(0, 1)]
+            channels += _eigenvalues(smooth(gy * gy), smooth(gy * gx), smooth(gx * gx))
+        elif name == "HessianOfGaussianEigenvalues":
+            channels += _eigenvalues(d[(2, 0)], d[(1, 1)], d[(0, 2)])
+        else:
+            raise ValueError(f"Unsupported Ilastik feature: {name}")
+    return np.stack(channels, axis=-1).astype(np.float32, copy=False)
+
+
+def prediction_bytes(shape, features, n_classes=2):
+    """Estimated peak memory of PixelClassifier.predict() on a tile of `shape`.
+
+    The per-scale derivatives and row passes, the feature channels and their
+    stacked copy (float32), and the forest's float64 class probabilities
+    (the running sum plus one tree's output).
+    """
+    by_scale = {}
+    for name, sigma in features:
+        by_scale.setdefault(sigma, set()).update(_feature_orders(name))
+    planes = sum(len(orders) + len({oy for oy, _ in orders}) for orders in by_scale.values())
+    channels = sum(2 if name.endswith("Eigenvalues") else 1 for name, _ in features)
+    return int(np.prod(shape)) * (4 * (planes + 2 * channels) + 8 * 2 * n_classes)
+
+
+# --- Classifier ---
+class PixelClassifier:
+    """Random forest over filter_bank() features; predict() gives the foci-class probability per pixel."""
+
+    def __init__(self, features, label_names, num_trees=default_num_trees, fingerprint=None):
+        self.features = list(features)
+        self.label_names = list(label_names)
+        self.num_trees = num_trees
+        self.fingerprint = fingerprint
+        self.forest = None
+
+    @property
+    def foreground(self):
+        """Class value of foci: the label named like "foci", else the second label (Ilastik's channel 1)."""
+        for value, name in enumerate(self.label_names, start=1):
+            if "foci" in name.lower():
+                return value
+        return 2
+
+    def fit(self, X, y):
+        require_sklearn()
+        self.forest = RandomForestClassifier(n_estimators=self.num_trees, n_jobs=1, random_state=seed)
+        self.forest.fit(X, y)
+        return self
+
+    def predict(self, img):
+        """Foci probability map (float32, same shape as `img`)."""
+        stack = filter_bank(img, self.features)
+        classes = list(self.forest.classes_)
+        if self.foreground not in classes:
+            return np.zeros(img.shape, dtype=np.float32)
+        prob = self.forest.predict_proba(stack.reshape(-1, stack.shape[-1]))[:, classes.index(self.foreground)]
+        return prob.reshape(img.shape).astype(np.float32)
+
+    def save(self, path=model_path):
+        """Pickle plain state (settings, fingerprint, forest), not the instance: a model trained by
+        running this file would otherwise be saved as __main__.PixelClassifier and not load elsewhere."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        state = {"features": self.features, "label_names": self.label_names, "num_trees": self.num_trees,
+                 "fingerprint": self.fingerprint, "forest": self.forest}
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path=model_path):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        forest = state.pop("forest")
+        model = PixelClassifier(**state)
+        model.forest = forest
+        return model
+
+
+# --- Training data ---
+def _tile_for(image_path, loader):
+    """Tile id an Ilastik lane was labelled on, matched by file name."""
+    if not image_path:
+        return None
+    stem = os.path.splitext(os.path.basename(image_path.split(".h5/")[0]))[0]
+    return stem if stem in loader.tile_ids() else None
+
+
+def project_samples(project, loader):
+    """(X, y) from the labels stored in the project, one feature row per labelled pixel."""
+    X, y = [], []
+    for image_path, blocks in project["labels"]:
+        tile_id = _tile_for(image_path, loader)
+        if tile_id is None:
+            print(f"⚠️ No tile matches labelled image {image_path}, skipping its labels")
+            continue
+        stack = filter_bank(loader.gray(tile_id, "rad51"), project["features"])
+        for slices, block in blocks:
+            block = np.asarray(block).reshape(block.shape[:2] if block.ndim > 2 and block.shape[-1] == 1
+                                              else block.shape)
+            region = stack[slices[0], slices[1]]
+            labelled = block > 0
+            X.append(region[labelled])
+            y.append(block[labelled].astype(np.int64))
+    return X, y
+
+
+def pseudo_samples(project, loader, tiles):
+    """(X, y) from confident pixels of the existing Ilastik maps, balanced per class and tile."""
+    rng = np.random.default_rng(seed)
+    X, y = [], []
+    for tile_id in tiles:
+        path = loader.prob_path(tile_id)
+        if not os.path.exists(path):
+            continue
+        prob = np.load(path)
+        prob = prob[..., 1] if prob.ndim == 3 else prob
+        stack = filter_bank(loader.gray(tile_id, "rad51"), project["features"])
+        for value, mask in ((1, prob <= 1 - confident), (2, prob >= confident)):
+            index = np.flatnonzero(mask)
+            index = rng.choice(index, min(samples_per_class, len(index)), replace=False)
+            X.append(stack.reshape(-1, stack.shape[-1])[index])
+            y.append(np.full(len(index), value, dtype=np.int64))
+    return X, y
+
+
+def train(project_file=project_path, loader=None):
+    """Train a PixelClassifier from a project's labels, or from the Ilastik maps when it stores none."""
+    require_sklearn()
+    loader = loader or TileLoader(base_dir)
+    project = read_project(project_file)
+    tiles = loader.tile_ids()
+    X, y = project_samples(project, loader)
+    source = "project labels"
+    if not X:
+        X, y = pseudo_samples(project, loader, tiles)
+        source = f"confident pixels of {sum(loader.has_prob(t) for t in tiles)} Ilastik map(s)"
+    if not X:
+        raise ValueError(f"{project_file} stores no labels and no _Probabilities.npy maps exist to learn from")
+    X, y = np.concatenate(X), np.concatenate(y)
+
+    classifier = PixelClassifier(project["features"], project["label_names"], project["num_trees"],
+                                 fingerprint=training_fingerprint(project_file, loader))
+    print(f"🌲 Training {classifier.num_trees} trees on {len(y)} pixels ({source}), "
+          f"{X.shape[1]} feature channels")
+    return classifier.fit(X, y)
+
+
+def training_fingerprint(project_file, loader):
+    """Changes when the project or any map the model may be trained on changes."""
+    return input_fingerprint([project_file] + [loader.prob_path(t) for t in loader.tile_ids()])
+
+
+def load_or_train(project_file=project_path, path=model_path, retrain=False, loader=None):
+    """The saved model if it was trained on the current inputs, else a freshly trained (and saved) one."""
+    loader = loader or TileLoader(base_dir)
+    if not retrain and os.path.exists(path):
+        classifier = PixelClassifier.load(path)
+        if classifier.fingerprint == training_fingerprint(project_file, loader):
+            return classifier
+        print("♻️ Project or training maps changed, retraining the pixel classifier")
+    classifier = train(project_file, loader)
+    classifier.save(path)
+    print(f"💾 Saved pixel classifier: {path}")
+    return classifier
+
+
+# --- Prediction inside tile workers ---
+_loaded = {}
+
+
+def classifier_from(path=model_path):
+    """Model at `path`, unpickled once per process (tile workers reuse it across tiles)."""
+    if path not in _loaded:
+        _loaded[path] = PixelClassifier.load(path)
+    return _loaded[path]
+
+
+def predict_probabilities(loader, tile_id, path=model_path, dtype=None):
+    """Normalized foci probability map of a tile, in the form TileLoader.probabilities() returns (dtype overrides loader.dtype)."""
+    dtype = dtype or loader.dtype
+    with profiling.stage("pixel_classifier"):
+        prob = classifier_from(path).predict(loader.gray(tile_id, "rad51"))
+    if prob.max() == prob.min():
+        return np.zeros_like(prob, dtype=dtype or np.float32)
+    return normalize(prob, dtype)
+
+
+def compare_tile(tile_id, path=model_path):
+    """(pearson r, fraction of pixels on the same side of 0.5) against the Ilastik map, or None without one."""
+    loader = TileLoader(base_dir)
+    prob = classifier_from(path).predict(loader.gray(tile_id, "rad51"))
+    if not loader.has_prob(tile_id):
+        return None
+    reference = np.load(loader.prob_path(tile_id))
+    reference = reference[..., 1] if reference.ndim == 3 else reference
+    return float(np.corrcoef(prob.ravel(), reference.ravel())[0, 1]), float(((prob >= 0.5) == (reference >= 0.5)).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--project", default=project_path, help=f"Ilastik project (default: {project_path})")
+    parser.add_argument("--model", default=model_path, help=f"where the trained model is kept (default: {model_path})")
+    parser.add_argument("--retrain", action="store_true", help="train even if the saved model is up to date")
+    parser.add_argument("--workers", type=int, default=1, help="number of tiles predicted in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    loader = TileLoader(base_dir)
+    load_or_train(args.project, args.model, retrain=args.retrain, loader=loader)
+    for tile_id, agreement in run_tiles(partial(compare_tile, path=args.model), loader.tile_ids(), workers=args.workers):
+        if agreement is None:
+            print(f"✅ {tile_id}: predicted (no Ilastik map to compare)")
+        else:
+            print(f"✅ {tile_id}: r={agreement[0]:.3f}, {agreement[1]:.1%} pixels agree with the Ilastik map")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Run the per-tile analysis (and optionally the viewer export) for every well of a plate.
+
+Wells are the subdirectories of images/ that have a rad51/ folder
+(images/A1, images/A2, ...). All (well, tile) jobs go into one queue,
+largest inputs first, so the worker pool stays busy across well boundaries
+instead of draining at the end of each well. Outputs are partitioned by well:
+
+    outputs/wells/<well>/foci_per_nucleus_multi_threshold.csv   (+ .manifest.json, resumable)
+    outputs/results/{nuclei,foci}/well=<well>/...               (--parquet)
+    data/<well>/<tile>.*  and a combined data/index.json        (--viewer FORMAT)
+    data/<well>/viewer_formats.json                             format each tile was last exported in
+    outputs/wells/plate_progress.json                           done/failed jobs per well
+
+    python plate_runner.py [--wells A1 A2] [--workers N] [--memory-budget 8G] [--parquet] [--viewer split]
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+from functools import partial
+from tile_loader import DEFAULT_PLATE_DIR, discover_wells, well_loader
+from tile_pipeline import run_tiles, parse_size, workers_for_budget
+from results_writer import TileResultsWriter, input_fingerprint
+from results_store import ParquetResultsStore, default_root
+import count_foci_and_visualize_v2 as analysis
+import json_generation
+import pixel_classifier
+import profiling
+
+# --- Configuration ---
+wells_dir = "outputs/wells"
+progress_path = f"{wells_dir}/plate_progress.json"
+csv_name = "foci_per_nucleus_multi_threshold.csv"
+viewer_formats_name = "viewer_formats.json"
+# files each viewer export format writes per tile (split also writes pyramid levels)
+viewer_suffixes = {"json": [".json"], "binary": [".json", ".bin"], "split": [".json", ".bin", ".summary.json"]}
+
+
+# --- Jobs (run in worker processes) ---
+def run_job(job, long_format=False, classifier=None, viewer_format=None, restrict=False, float32=False):
+    """One (kind, well, tile) job: "results" gives process_tile()'s (rows, tables), "viewer" the exported data id."""
+    kind, well, tile_id = job
+    if kind == "viewer":
+        return json_generation.process_tile(tile_id, output_format=viewer_format, well=well)
+    return analysis.process_tile(tile_id, long_format=long_format, classifier=classifier, well=well, restrict=restrict,
+                                 float32=float32)
+
+
+def job_cost(job):
+    """Relative cost of a job: size of the tile's input files (busier images and more nuclei are bigger)."""
+    _, well, tile_id = job
+    return sum(os.path.getsize(path) for path in well_loader(well).input_paths(tile_id) if os.path.exists(path))
+
+
+def viewer_stale(well, tile_id, viewer_format, formats):
+    """Whether the tile's viewer data must be (re)exported in `viewer_format`.
+
+    It is stale when it was last exported in another format (per `formats`,
+    the well's viewer_formats.json), when a file of that format is missing,
+    or when one is older than the tile's inputs.
+    """
+    if formats.get(tile_id) != viewer_format:
+        return True
+    base = os.path.join(json_generation.output_json_dir, well, tile_id)
+    paths = [base + suffix for suffix in viewer_suffixes[viewer_format]]
+    if not all(os.path.exists(path) for path in paths):
+        return True
+    loader = well_loader(well)
+    return min(map(os.path.getmtime, paths)) < max(os.path.getmtime(p) for p in loader.input_paths(tile_id)
+                                                   if os.path.exists(p))
+
+
+def read_viewer_formats(well):
+    """{tile: format} of the well's viewer exports made by earlier runs."""
+    path = os.path.join(json_generation.output_json_dir, well, viewer_formats_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_viewer_formats(well, formats):
+    path = os.path.join(json_generation.output_json_dir, well, viewer_formats_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(formats, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# --- Progress ---
+class PlateProgress:
+    """Counts finished and failed jobs per well and keeps plate_progress.json current."""
+
+    def __init__(self, jobs, path=progress_path):
+        self.path = path
+        self.total = len(jobs)
+        self.pending = set(jobs)
+        self.done = 0
+        self.started = time.perf_counter()
+        self.wells = {}
+        for _, well, _ in jobs:
+            self.wells.setdefault(well, {"jobs": 0, "done": 0, "failed": []})["jobs"] += 1
+        self._write()
+
+    def finish(self, job):
+        kind, well, tile_id = job
+        self.pending.discard(job)
+        self.done += 1
+        self.wells[well]["done"] += 1
+        elapsed = time.perf_counter() - self.started
+        eta = elapsed / self.done * (self.total - self.done)
+        print(f"🧮 [{self.done}/{self.total}] {well}/{tile_id} {kind} done "
+              f"({elapsed:.0f} s elapsed, ~{eta:.0f} s left)")
+        self._write()
+
+    def close(self):
+        """Mark every job that never came back as failed (run_tiles already reported why)."""
+        for kind, well, tile_id in sorted(self.pending):
+            self.wells[well]["failed"].append(f"{kind}:{tile_id}")
+        self._write()
+        return sum(len(w["failed"]) for w in self.wells.values())
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"total": self.total, "done": self.done, "wells": self.wells}, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+# --- Combined viewer index ---
+def write_index(exported, viewer_format):
+    """Merge {well: [data ids]} into data/index.json, keeping wells of earlier runs that were not rerun."""
+    path = os.path.join(json_generation.output_json_dir, "index.json")
+    index = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            index = json.load(f)
+    layout = index.pop("layout", {})
+    for well, ids in exported.items():
+        index[well] = sorted(ids)
+        if viewer_format == "split" and ids:
+            tile_id = sorted(ids)[0].split("/", 1)[1]
+            layout[well] = {"format": "split", "shape": list(well_loader(well).seg(tile_id).shape)}
+        else:
+            layout.pop(well, None)
+    if layout:
+        index["layout"] = layout
+    with open(path, "w") as f:
+        json.dump(index, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wells", nargs="+", help="only these wells (default: every well found)")
+    parser.add_argument("--workers", type=int, default=1, help="number of jobs processed in parallel (default: 1)")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record per-stage time/memory and write a run report (same as {profiling.PROFILE_ENV}=1)")
+    parser.add_argument("--fresh", action="store_true", help="reprocess every tile instead of resuming")
+    parser.add_argument("--parquet", nargs="?", const=default_root, metavar="DIR",
+                        help=f"also write the long-format Parquet dataset (default DIR: {default_root})")
+    parser.add_argument("--classifier", nargs="?", const=pixel_classifier.model_path, metavar="MODEL",
+                        help="predict probability maps in-process (see pixel_classifier.py)")
+    parser.add_argument("--viewer", choices=["json", "binary", "split"],
+                        help="also export viewer data to data/<well>/ and update data/index.json")
+    parser.add_argument("--restrict-to-nuclei", action="store_true",
+                        help="build the LoG scale space only around nuclei (see count_foci_and_visualize_v2.py)")
+    parser.add_argument("--float32", action="store_true",
+                        help="float32 images and LoG stacks in reused per-worker buffers (see count_foci_and_visualize_v2.py)")
+    parser.add_argument("--memory-budget", type=parse_size, metavar="SIZE",
+                        help="run at most as many workers as fit in SIZE (e.g. 8G) by the per-tile memory estimate")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    wells = args.wells or discover_wells(DEFAULT_PLATE_DIR)
+    missing = [well for well in wells if not os.path.isdir(os.path.join(DEFAULT_PLATE_DIR, well, "rad51"))]
+    if missing:
+        parser.error(f"no rad51/ folder for well(s): {', '.join(missing)}")
+    print(f"🧪 Plate {DEFAULT_PLATE_DIR}/: {len(wells)} well(s)")
+
+    params = dict(analysis.detection_params)
+    if args.restrict_to_nuclei:
+        params["restrict_to_nuclei"] = True
+    if args.float32:
+        params["float32"] = True
+    model = None
+    if args.classifier:
+        model = pixel_classifier.load_or_train(path=args.classifier)
+        params["pixel_classifier"] = model.fingerprint
+    store = ParquetResultsStore(args.parquet) if args.parquet else None
+
+    # --- One queue of (kind, well, tile) jobs for the whole plate ---
+    writers, csv_jobs, jobs = {}, set(), []
+    formats = {well: read_viewer_formats(well) for well in wells}
+    for well in wells:
+        loader = well_loader(well)
+        tiles = loader.tile_ids()
+        writers[well] = TileResultsWriter(os.path.join(wells_dir, well, csv_name), analysis.csv_columns, params,
+                                          resume=not args.fresh)
+        os.makedirs(os.path.join(wells_dir, well), exist_ok=True)
+        pending = writers[well].start({tile_id: input_fingerprint(loader.input_paths(tile_id)) for tile_id in tiles})
+        csv_jobs.update(("results", well, tile_id) for tile_id in pending)
+        if store is not None:
+            pending += [tile_id for tile_id in tiles if tile_id not in pending and not store.has_tile(well, tile_id)]
+        jobs += [("results", well, tile_id) for tile_id in pending]
+        if args.viewer:
+            jobs += [("viewer", well, tile_id) for tile_id in tiles
+                     if args.fresh or viewer_stale(well, tile_id, args.viewer, formats[well])]
+    jobs.sort(key=job_cost, reverse=True)
+    print(f"📋 {len(jobs)} job(s) queued across {len(wells)} well(s)")
+
+    # --- Run, writing each result as it arrives ---
+    workers = args.workers
+    if args.memory_budget and jobs:
+        shape = max((well_loader(well).seg(tile_id).shape for _, well, tile_id in jobs
+                     if well_loader(well).has_seg(tile_id)), key=np.prod, default=(0, 0))
+        features = model.features if model else None
+        workers = workers_for_budget(args.memory_budget, analysis.tile_memory_bytes(shape, args.float32, features),
+                                     args.workers)
+    progress = PlateProgress(jobs)
+    worker = partial(run_job, long_format=store is not None, classifier=args.classifier, viewer_format=args.viewer,
+                     restrict=args.restrict_to_nuclei, float32=args.float32)
+    for job, result in run_tiles(worker, jobs, workers=workers, ordered=False):
+        kind, well, tile_id = job
+        if kind == "results":
+            rows, tables = result
+            if job in csv_jobs:
+                writers[well].write(tile_id, rows)
+            if store is not None and tables is not None:
+                store.write_tile(well, tile_id, *tables)
+        elif result is not None:
+            formats[well][tile_id] = args.viewer
+            write_viewer_formats(well, formats[well])
+        progress.finish(job)
+    failed = progress.close()
+
+    if args.viewer:
+        # every tile with current viewer data, including ones exported by earlier runs
+        exported = {well: [f"{well}/{tile_id}" for tile_id in well_loader(well).tile_ids()
+                           if well_loader(well).has_seg(tile_id)
+                           and not viewer_stale(well, tile_id, args.viewer, formats[well])]
+                    for well in wells}
+        write_index(exported, args.viewer)
+        print(f"🗂️ Saved {json_generation.output_json_dir}/index.json ({len(exported)} well(s))")
+
+    print(f"📊 Saved per-well results in {wells_dir}/<well>/{csv_name}")
+    if failed:
+        print(f"⚠️ {failed} job(s) failed; see {progress_path} (rerun to retry them)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import re
+import sys
+import csv
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows; the process high-water RSS is then left empty
+    resource = None
+
+# Linux lets a process reset its RSS high-water mark (VmHWM), which gives true per-stage peaks
+_status_path = "/proc/self/status"
+_clear_refs_path = "/proc/self/clear_refs"
+
+PROFILE_ENV = "FOCI_PROFILE"
+report_dir = "outputs/run_reports"
+
+_enabled = os.environ.get(PROFILE_ENV, "") not in ("", "0")
+_null = nullcontext()
+_current_tile = None
+_records = []
+_counts = []
+_open_peaks = []  # highest RSS seen so far by each open stage, innermost last
+_process_peak = 0.0  # highest RSS of the process so far (ru_maxrss alone is lost when VmHWM is reset)
+
+
+# --- Switch ---
+def enable():
+    """Turn profiling on for this process and for worker processes it starts."""
+    global _enabled
+    _enabled = True
+    os.environ[PROFILE_ENV] = "1"
+
+
+def is_enabled():
+    return _enabled
+
+
+# --- Hooks used by the pipeline ---
+def stage(name):
+    """Context manager timing one pipeline stage of the current tile; a shared no-op when profiling is off."""
+    return _stage(name) if _enabled else _null
+
+
+@contextmanager
+def _stage(name):
+    wall, cpu = time.perf_counter(), time.process_time()
+    _enter_peak()
+    try:
+        yield
+    finally:
+        _records.append({"tile": _current_tile, "stage": name,
+                         "wall_s": time.perf_counter() - wall, "cpu_s": time.process_time() - cpu,
+                         **_exit_memory()})
+
+
+def count(name, value):
+    """Record a per-tile quantity such as the number of blobs found."""
+    if _enabled:
+        _counts.append({"tile": _current_tile, "name": name, "value": int(value)})
+
+
+# --- Memory ---
+# peak_rss_mb is the highest RSS reached during the stage itself: the kernel's high-water mark is
+# reset when a stage starts, and an enclosing stage (tile_total) keeps the max of what its inner
+# stages saw. Where it cannot be reset (not Linux) it is left empty. process_high_water_rss_mb is
+# the highest RSS of the whole process so far, which never goes down.
+def _read_high_water_mb():
+    try:
+        with open(_status_path) as f:
+            return int(re.search(r"VmHWM:\s+(\d+) kB", f.read())[1]) / 1024
+    except (OSError, TypeError):
+        return None
+
+
+def _reset_high_water():
+    try:
+        with open(_clear_refs_path, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _enter_peak():
+    if _open_peaks and _open_peaks[-1] is not None:
+        _open_peaks[-1] = max(_open_peaks[-1], _read_high_water_mb() or 0.0)
+    _open_peaks.append(0.0 if _reset_high_water() else None)
+
+
+def _exit_peak():
+    peak = _open_peaks.pop()
+    if peak is not None:
+        peak = max(peak, _read_high_water_mb() or 0.0)
+        if _open_peaks and _open_peaks[-1] is not None:
+            _open_peaks[-1] = max(_open_peaks[-1], peak)
+    return peak
+
+
+def _exit_memory():
+    """{peak_rss_mb, process_high_water_rss_mb} of the stage being closed."""
+    global _process_peak
+    peak = _exit_peak()
+    if resource is None:
+        return {"peak_rss_mb": peak, "process_high_water_rss_mb": None}
+    # ru_maxrss is in KiB on Linux and bytes on macOS; on Linux it only covers the time since the last reset
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    _process_peak = max(_process_peak, peak or 0.0, maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024)
+    return {"peak_rss_mb": peak, "process_high_water_rss_mb": _process_peak}
+
+
+# --- Collection across processes ---
+def profiled_call(worker, tile):
+    """Run worker(tile) and return (result, records) so a pool can send the measurements back."""
+    global _current_tile
+    _current_tile = str(tile)
+    start = len(_records), len(_counts)
+    try:
+        with _stage("tile_total"):
+            result = worker(tile)
+    finally:
+        _current_tile = None
+    records = {"stages": _records[start[0]:], "counts": _counts[start[1]:]}
+    del _records[start[0]:], _counts[start[1]:]
+    return result, records
+
+
+def collect(records):
+    _records.extend(records["stages"])
+    _counts.extend(records["counts"])
+
+
+# --- Report ---
+def summarize():
+    """Per-stage totals: tiles, wall and CPU seconds, slowest tile and peak RSS."""
+    summary = {}
+    for rec in _records:
+        s = summary.setdefault(rec["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_wall_s": 0.0,
+                                              "peak_rss_mb": 0.0})
+        s["calls"] += 1
+        s["wall_s"] += rec["wall_s"]
+        s["cpu_s"] += rec["cpu_s"]
+        s["max_wall_s"] = max(s["max_wall_s"], rec["wall_s"])
+        s["peak_rss_mb"] = max(s["peak_rss_mb"], rec["peak_rss_mb"] or 0.0)
+    totals = {}
+    for c in _counts:
+        totals[c["name"]] = totals.get(c["name"], 0) + c["value"]
+    return summary, totals
+
+
+def write_report(name=None):
+    """Write <report_dir>/<name>_<timestamp>.json (records, counts, summary) and .csv, and print the summary table."""
+    if not _enabled or not _records:
+        return None
+    name = name or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "run"
+    os.makedirs(report_dir, exist_ok=True)
+    base = os.path.join(report_dir, f"{name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    summary, totals = summarize()
+
+    with open(base + ".json", "w") as f:
+        json.dump({"script": name, "stages": _records, "counts": _counts, "summary": summary, "totals": totals},
+                  f, indent=2)
+    with open(base + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["tile", "stage", "wall_s", "cpu_s", "peak_rss_mb",
+                                               "process_high_water_rss_mb"])
+        writer.writeheader()
+        writer.writerows(_records)
+
+    print(f"{'stage':<14}{'calls':>6}{'wall s':>10}{'cpu s':>10}{'max s':>9}{'peak MB':>9}")
+    for stage_name, s in sorted(summary.items(), key=lambda item: -item[1]["wall_s"]):
+        print(f"{stage_name:<14}{s['calls']:>6}{s['wall_s']:>10.2f}{s['cpu_s']:>10.2f}"
+              f"{s['max_wall_s']:>9.2f}{s['peak_rss_mb']:>9.0f}")
+    for counter, value in totals.items():
+        print(f"  {counter}: {value}")
+    print(f"🧾 Run report: {base}.json / .csv")
+    return base
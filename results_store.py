@@ -0,0 +1,176 @@
+"""Long-format Parquet dataset of per-nucleus measurements and per-focus records.
+
+    <root>/nuclei/well=<well>/tile=<tile>/part-0.parquet   one row per nucleus, channel and threshold
+    <root>/foci/well=<well>/tile=<tile>/part-0.parquet     one row per focus inside a nucleus
+
+Readers pick partitions and columns, so a plate-wide summary never parses
+per-threshold column names or loads columns it does not use. Convert an
+existing wide CSV with:
+    python results_store.py --from-csv outputs/foci_per_nucleus_multi_threshold.csv
+"""
+import os
+import re
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # the CSV outputs keep working without it
+    pa = ds = pq = None
+
+default_root = "outputs/results"
+nucleus_columns = ["region_id", "area", "channel", "threshold", "count", "area_fraction"]
+focus_columns = ["region_id", "channel", "threshold", "y", "x", "sigma"]
+numpy_types = {"region_id": np.uint32, "area": np.uint32, "count": np.uint32, "threshold": np.float64,
+               "area_fraction": np.float64, "y": np.uint32, "x": np.uint32, "sigma": np.float32}
+# Foci channels of the wide CSV; other per-threshold columns (coloc_count_th*, ...) are not detection methods
+foci_channels = ("rad51", "prob", "h2ax")
+wide_column = re.compile(rf"^(?P<channel>{'|'.join(foci_channels)})_(?P<kind>count|area)_th(?P<threshold>[0-9.eE+-]+)$")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("The Parquet results store needs pyarrow: pip install pyarrow")
+
+
+def schemas():
+    """(nuclei schema, foci schema); well and tile come from the partition directories."""
+    require_pyarrow()
+    channel = pa.dictionary(pa.int8(), pa.string())
+    nuclei = pa.schema([("region_id", pa.uint32()), ("area", pa.uint32()), ("channel", channel),
+                        ("threshold", pa.float64()), ("count", pa.uint32()), ("area_fraction", pa.float64())])
+    foci = pa.schema([("region_id", pa.uint32()), ("channel", channel), ("threshold", pa.float64()),
+                      ("y", pa.uint32()), ("x", pa.uint32()), ("sigma", pa.float32())])
+    return nuclei, foci
+
+
+# --- Building the long tables (plain NumPy, so pool workers do not need pyarrow) ---
+def long_tables(nuclei, foci):
+    """Per-nucleus and per-focus columns of one tile.
+
+    `nuclei` is the tile's LabelIndex and `foci` maps channel ->
+    detect_tile_foci() result. Returns two dicts of equal-length arrays.
+    """
+    labels = nuclei.labels
+    areas = nuclei.areas[labels]
+    rows = {name: [] for name in nucleus_columns}
+    spots = {name: [] for name in focus_columns}
+    for channel, results in foci.items():
+        for th, (counts, area_pix, nuclei_blobs) in results.items():
+            rows["region_id"].append(labels)
+            rows["area"].append(areas)
+            rows["channel"].append(np.full(len(labels), channel, dtype=object))
+            rows["threshold"].append(np.full(len(labels), float(th)))
+            rows["count"].append(counts[labels])
+            rows["area_fraction"].append(area_pix[labels] / areas)
+
+            blobs = [nuclei_blobs[label] for label in labels]
+            n_blobs = counts[labels]
+            blobs = np.concatenate(blobs) if blobs else np.empty((0, 3))
+            spots["region_id"].append(np.repeat(labels, n_blobs))
+            spots["channel"].append(np.full(len(blobs), channel, dtype=object))
+            spots["threshold"].append(np.full(len(blobs), float(th)))
+            spots["y"].append(blobs[:, 0])
+            spots["x"].append(blobs[:, 1])
+            spots["sigma"].append(blobs[:, 2])
+    concat = lambda parts: np.concatenate(parts) if parts else np.empty(0)
+    return ({name: concat(parts) for name, parts in rows.items()},
+            {name: concat(parts) for name, parts in spots.items()})
+
+
+def wide_to_long(df):
+    """Melt the foci channels of a wide CSV (rad51_count_th0.15, ...) into the long nucleus layout, keeping column order."""
+    measures = {}
+    for col in df.columns:
+        match = wide_column.match(col)
+        if match:
+            key = (match["channel"], match["threshold"])
+            measures.setdefault(key, {})[match["kind"]] = col
+    ids = df.rename(columns={"image_id": "well", "tile_id": "tile"})[["well", "tile", "region_id", "area"]]
+    parts = []
+    for (channel, threshold), cols in measures.items():
+        part = ids.copy()
+        part["channel"] = channel
+        part["threshold"] = float(threshold)
+        part["count"] = df[cols["count"]] if "count" in cols else np.nan
+        part["area_fraction"] = df[cols["area"]] if "area" in cols else np.nan
+        parts.append(part)
+    if not parts:
+        return ids.assign(channel=pd.Series(dtype=str), threshold=np.nan, count=np.nan, area_fraction=np.nan)
+    return pd.concat(parts, ignore_index=True)
+
+
+# --- Store ---
+class ParquetResultsStore:
+    """Writes each tile's tables into its own well/tile partition (rewriting it on reruns)."""
+
+    def __init__(self, root=default_root):
+        require_pyarrow()
+        self.root = root
+        self.nuclei_schema, self.foci_schema = schemas()
+
+    def partition(self, table, well, tile_id):
+        return os.path.join(self.root, table, f"well={well}", f"tile={tile_id}")
+
+    def has_tile(self, well, tile_id):
+        return os.path.exists(os.path.join(self.partition("nuclei", well, tile_id), "part-0.parquet"))
+
+    def write_tile(self, well, tile_id, nucleus_rows, focus_rows):
+        for name, columns, schema in (("nuclei", nucleus_rows, self.nuclei_schema),
+                                      ("foci", focus_rows, self.foci_schema)):
+            if columns is None:
+                continue
+            frame = pd.DataFrame(columns).astype({col: numpy_types[col] for col in schema.names if col in numpy_types})
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            directory = self.partition(name, well, tile_id)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "part-0.parquet")
+            pq.write_table(table, path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+
+
+def _select(root, table, wells, tiles, channels, thresholds):
+    """(dataset, filter expression or None) for the given partition and row values."""
+    require_pyarrow()
+    dataset = ds.dataset(os.path.join(root, table), format="parquet", partitioning="hive")
+    condition = None
+    for field, values in (("well", wells), ("tile", tiles), ("channel", channels), ("threshold", thresholds)):
+        if values:
+            clause = ds.field(field).isin(list(values))
+            condition = clause if condition is None else condition & clause
+    return dataset, condition
+
+
+def read_table(root, table="nuclei", columns=None, wells=None, tiles=None, channels=None, thresholds=None):
+    """Load a table of the store as a DataFrame, reading only `columns` and the matching partitions/rows."""
+    dataset, condition = _select(root, table, wells, tiles, channels, thresholds)
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def iter_table(root, table="nuclei", columns=None, wells=None, tiles=None, channels=None, thresholds=None,
+               batch_size=1_000_000):
+    """Same selection as read_table(), yielded as DataFrames of at most `batch_size` rows."""
+    dataset, condition = _select(root, table, wells, tiles, channels, thresholds)
+    for batch in dataset.to_batches(columns=columns, filter=condition, batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-csv", required=True, help="wide per-nucleus CSV to convert")
+    parser.add_argument("--root", default=default_root, help=f"dataset directory (default: {default_root})")
+    args = parser.parse_args()
+
+    store = ParquetResultsStore(args.root)
+    long = wide_to_long(pd.read_csv(args.from_csv))
+    for (well, tile_id), rows in long.groupby(["well", "tile"], sort=False):
+        store.write_tile(well, tile_id, rows[nucleus_columns].dropna(subset=["count"]), None)
+    print(f"💾 Wrote {long[['well', 'tile']].drop_duplicates().shape[0]} tile(s) to {args.root}/nuclei "
+          "(per-focus records need a fresh analysis run)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import csv
+import json
+import hashlib
+import pandas as pd
+
+
+def input_fingerprint(paths):
+    """Hash of path, mtime and size of every input file that exists."""
+    h = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            h.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+    return h.hexdigest()
+
+
+class TileResultsWriter:
+    """Appends each tile's rows to a CSV as soon as the tile finishes.
+
+    `<csv>.manifest.json` records the detection parameters and, for every
+    finished tile, a fingerprint of its input files. start() keeps finished
+    tiles whose fingerprint still matches, drops the rows of every other tile
+    (stale inputs, or a run that crashed mid-tile) and returns the tiles left
+    to process. Changed parameters or resume=False start a fresh CSV.
+    """
+
+    def __init__(self, csv_path, columns, params, resume=True):
+        self.csv_path = csv_path
+        self.columns = list(columns)
+        self.params = params
+        self.manifest_path = csv_path + ".manifest.json"
+        self.resume = resume
+        self.done = {}
+        self._fingerprints = {}
+
+    def start(self, fingerprints):
+        """Take {tile: input fingerprint} for this run and return the tiles that still need processing."""
+        self._fingerprints = dict(fingerprints)
+        manifest = self._read_manifest() if self.resume else None
+        if manifest is None or manifest.get("params") != self.params or manifest.get("columns") != self.columns:
+            if manifest is not None:
+                print(f"♻️ Parameters changed since the last run, rewriting {self.csv_path}")
+            for path in (self.csv_path, self.manifest_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.done = {}
+        else:
+            self.done = {tile: fp for tile, fp in manifest["tiles"].items() if fingerprints.get(tile) == fp}
+            self._drop_rows_except(set(self.done))
+            if self.done:
+                print(f"⏩ Resuming: {len(self.done)} tile(s) already in {self.csv_path}")
+        self._write_manifest()
+        return [tile for tile in fingerprints if tile not in self.done]
+
+    def write(self, tile, rows):
+        """Append a tile's rows (list of dicts or DataFrame; None for no rows) and mark the tile done."""
+        if rows is not None and len(rows):
+            new_file = not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0
+            pd.DataFrame(rows, columns=self.columns).to_csv(self.csv_path, mode="a", header=new_file, index=False)
+        self.done[tile] = self._fingerprints[tile]
+        self._write_manifest()
+
+    # --- Manifest / CSV bookkeeping ---
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        manifest = {"params": self.params, "columns": self.columns, "tiles": self.done}
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def _drop_rows_except(self, keep):
+        """Rewrite the CSV with only the rows of `keep` tiles, copying kept lines verbatim."""
+        if not os.path.exists(self.csv_path):
+            return
+        tile_col = self.columns.index("tile_id")
+        with open(self.csv_path, newline="") as f:
+            lines = f.readlines()
+        # a line without its newline is the tail of an interrupted append
+        kept = lines[:1] + [line for line in lines[1:]
+                            if line.endswith("\n") and next(csv.reader([line]))[tile_col] in keep]
+        if len(kept) == len(lines):
+            return
+        tmp = self.csv_path + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            f.writelines(kept)
+        os.replace(tmp, self.csv_path)
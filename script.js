@@ -30,27 +30,74 @@ document.addEventListener("DOMContentLoaded", () => {
   // Application state variables
   let dataset = "A1";
   let canvasScale = 0.4; // This scale is used for merging tiles into the overview.
+  const cols = 5;
   let currentTileList = [];
-  const tileCache = new Map();
+  let plate = null;         // { format, tileWidth, tileHeight, canvas } of the dataset on screen
+  let renderVersion = 0;    // bumped when a setting changes; tiles drawn with an older version are stale
+  const tileDrawn = new Map();     // tileId -> renderVersion it was last drawn with
+  const tileRegions = new Map();   // tileId -> nuclei boxes of that tile, for hover/click detection
+  const outlineLayers = new Map(); // tileId -> offscreen canvas with that tile's outlines
+  const thresholdsByMethod = new Map(); // method -> Set of thresholds seen in loaded tiles
   let lockedNucleus = null; // stores the nucleus when a user clicks on it (to lock dashboard view)
-  let nucleiRegions = [];   // stores each nucleus's bounding box and data for hover/click detection
-
-  // Fetch the tile index and preload JSON data for each tile.
-  fetch("data/index.json")
-    .then(res => res.json())
-    .then(index => {
-      currentTileList = index[dataset] || [];
-      if (currentTileList.length > 0) preloadAndRender(currentTileList);
-    });
 
-  datasetSelect.addEventListener("change", e => {
-    dataset = e.target.value;
+  // Small LRU cache: get() refreshes an entry, set() evicts the least recently used ones.
+  class LRUCache {
+    constructor(limit, onEvict = () => {}) {
+      this.limit = limit;
+      this.onEvict = onEvict;
+      this.entries = new Map();
+    }
+    get(key) {
+      if (!this.entries.has(key)) return undefined;
+      const value = this.entries.get(key);
+      this.entries.delete(key);
+      this.entries.set(key, value);
+      return value;
+    }
+    set(key, value) {
+      this.entries.delete(key);
+      this.entries.set(key, value);
+      while (this.entries.size > this.limit) {
+        const oldest = this.entries.keys().next().value;
+        this.entries.delete(oldest);
+        this.onEvict(oldest);
+      }
+    }
+    clear() {
+      this.entries.clear();
+    }
+  }
+
+  // Only tiles near the viewport are fetched; these bound what stays in memory.
+  const summaryCache = new LRUCache(512);           // tileId -> Promise of counts, boxes, image paths
+  const detailCache = new LRUCache(48, tileId => {  // tileId -> Promise of outlines and foci
+    tileRegions.delete(tileId);
+    outlineLayers.delete(tileId);
+    tileDrawn.delete(tileId);
+  });
+  const imageCache = new LRUCache(96);             // image path -> Promise of the loaded image
+
+  // Fetch the tile index and lay the plate out; tiles load as they scroll into view.
+  // The dataset dropdown lists the wells in the index (plate_runner.py writes one per well).
+  function openDataset() {
     fetch("data/index.json")
       .then(res => res.json())
       .then(index => {
+        const wells = Object.keys(index).filter(key => key !== "layout");
+        if (wells.length > 0 && !wells.includes(dataset)) dataset = wells[0];
+        datasetSelect.innerHTML = wells
+          .map(well => `<option value="${well}"${well === dataset ? " selected" : ""}>${well}</option>`)
+          .join("");
         currentTileList = index[dataset] || [];
-        if (currentTileList.length > 0) preloadAndRender(currentTileList);
+        const layout = (index.layout || {})[dataset] || {};
+        if (currentTileList.length > 0) setupPlate(currentTileList, layout);
       });
+  }
+  openDataset();
+
+  datasetSelect.addEventListener("change", e => {
+    dataset = e.target.value;
+    openDataset();
   });
 
   // Helper function: Compute the outline edge pixels from pixel coordinates.
@@ -74,209 +121,445 @@ document.addEventListener("DOMContentLoaded", () => {
     return edge;
   }
 
-  // Preload JSON for each tile.
-  function preloadAndRender(tileList) {
-    const promises = tileList.map(tileId => {
-      return fetch(`data/${tileId}.json`)
-        .then(res => res.json())
-        .then(data => { tileCache.set(tileId, data); });
+  // Typed array constructors named in binary tile manifests.
+  const TYPED_ARRAYS = { Uint16Array, Uint32Array, Float32Array };
+
+  // Turn a binary tile (manifest + ArrayBuffer written by
+  // `json_generation.py --format binary`) into the same shape as a JSON tile.
+  function decodeBinaryTile(manifest, buffer) {
+    const arrays = {};
+    Object.entries(manifest.arrays).forEach(([name, spec]) => {
+      arrays[name] = new TYPED_ARRAYS[spec.type](buffer, spec.offset, spec.length);
     });
-    Promise.all(promises).then(() => {
-      renderMergedCanvas(tileList);
+
+    const nuclei = Array.from(arrays.nuclei_id, (regionId, n) => {
+      const outline = [];
+      for (let p = arrays.outline_offsets[n]; p < arrays.outline_offsets[n + 1]; p++) {
+        outline.push([arrays.outline_y[p], arrays.outline_x[p]]);
+      }
+      const nuc = {
+        region_id: regionId,
+        area: arrays.nuclei_area[n],
+        centroid: [arrays.nuclei_centroid[2 * n], arrays.nuclei_centroid[2 * n + 1]],
+        bbox: Array.from(arrays.nuclei_bbox.subarray(4 * n, 4 * n + 4)),
+        outline
+      };
+      Object.entries(manifest.methods).forEach(([method, thresholds]) => {
+        thresholds.forEach(th => {
+          const key = `${method}_th${th}`;
+          const start = arrays[`${key}_offsets`][n];
+          const end = arrays[`${key}_offsets`][n + 1];
+          const coords = [];
+          for (let f = start; f < end; f++) {
+            coords.push([arrays[`${key}_y`][f], arrays[`${key}_x`][f]]);
+          }
+          nuc[`${method}_count_th${th}`] = arrays[`${key}_count`][n];
+          nuc[`${method}_area_th${th}`] = arrays[`${key}_area`][n];
+          nuc[`${method}_coords_th${th}`] = coords;
+        });
+      });
+      return nuc;
     });
+
+    return { ...manifest, nuclei };
   }
 
-  // Render the merged overview canvas (with downscaled tiles and overlays),
-  // and record each nucleus's bounding box.
-  function renderMergedCanvas(tileList) {
-    tileGrid.innerHTML = "";
-    const mergedCanvas = document.createElement("canvas");
-    const mergedCtx = mergedCanvas.getContext("2d");
-    const cols = 5;
-    const rows = Math.ceil(tileList.length / cols);
-
-    // Get tile images for the overview based on the displayMode.
-    // Add support for h2ax here.
-    const promises = tileList.map(tileId => {
-      const data = tileCache.get(tileId);
-      let imgPath;
-      if (displayMode === "rad51") {
-        imgPath = data.rad51_image;
-      } else if (displayMode === "dapi") {
-        imgPath = data.dapi_image;
-      } else if (displayMode === "h2ax") {
-        imgPath = data.h2ax_image;
-      }
-      return new Promise(resolve => {
+  // Fetch one tile's data, following the manifest to the binary payload if needed.
+  function loadTileData(tileId) {
+    return fetch(`data/${tileId}.json`)
+      .then(res => res.json())
+      .then(data => {
+        if (data.format !== "binary") return data;
+        return fetch(`data/${data.binary}`)
+          .then(res => res.arrayBuffer())
+          .then(buffer => decodeBinaryTile(data, buffer));
+      });
+  }
+
+  // Expand a `<tile>.summary.json` (column per field) into one object per nucleus.
+  function expandSummary(summary) {
+    const table = summary.nuclei;
+    const nuclei = table.region_id.map((regionId, n) => {
+      const nuc = {};
+      Object.keys(table).forEach(key => { nuc[key] = table[key][n]; });
+      return nuc;
+    });
+    return { ...summary, nuclei };
+  }
+
+  // Per-tile counts and boxes. Split exports have a small summary file; for
+  // JSON and binary exports the summary is the full tile.
+  function loadSummary(tileId) {
+    let promise = summaryCache.get(tileId);
+    if (!promise) {
+      promise = plate.format === "split"
+        ? fetch(`data/${tileId}.summary.json`).then(res => res.json()).then(expandSummary)
+        : loadDetail(tileId);
+      promise.then(registerThresholds, () => summaryCache.entries.delete(tileId));
+      summaryCache.set(tileId, promise);
+    }
+    return promise;
+  }
+
+  // Outlines and foci coordinates, only fetched for tiles in view.
+  function loadDetail(tileId) {
+    let promise = detailCache.get(tileId);
+    if (!promise) {
+      promise = loadTileData(tileId);
+      promise.catch(() => detailCache.entries.delete(tileId));
+      detailCache.set(tileId, promise);
+    }
+    return promise;
+  }
+
+  // Load each image once; re-renders and zoom views reuse it while it stays cached.
+  function loadImage(path) {
+    if (!path) return Promise.resolve(null);
+    let promise = imageCache.get(path);
+    if (!promise) {
+      promise = new Promise(resolve => {
         const img = new Image();
-        img.onload = () => resolve({ tileId, data, img });
-        img.onerror = () => resolve({ tileId, data, img: null });
-        img.src = imgPath;
+        img.onload = () => resolve(img);
+        img.onerror = () => resolve(null);
+        img.src = path;
       });
+      imageCache.set(path, promise);
+    }
+    return promise;
+  }
+
+  // Image of a channel at the coarsest pyramid level that still has one
+  // pixel per screen pixel at `scale`; full resolution without a pyramid.
+  function imagePath(summary, channel, scale) {
+    const levels = summary.pyramid && summary.pyramid[channel];
+    if (!levels) return summary[`${channel}_image`];
+    const maxFactor = 1 / (scale * (window.devicePixelRatio || 1));
+    let best = "1";
+    Object.keys(levels).forEach(factor => {
+      if (Number(factor) <= maxFactor && Number(factor) > Number(best)) best = factor;
     });
+    return levels[best];
+  }
 
-    Promise.all(promises).then(results => {
-      const validResults = results.filter(r => r.img);
-      if (validResults.length === 0) return;
-      const tileWidth = validResults[0].img.width;
-      const tileHeight = validResults[0].img.height;
-      mergedCanvas.width = cols * tileWidth * canvasScale;
-      mergedCanvas.height = rows * tileHeight * canvasScale;
-      nucleiRegions = []; // Clear any prior region data
-
-      // For each valid tile, draw it scaled into mergedCanvas and then add overlays.
-      validResults.forEach(({ tileId, data, img }, idx) => {
-        const col = idx % cols;
-        const row = Math.floor(idx / cols);
-        const offsetX = col * tileWidth * canvasScale;
-        const offsetY = row * tileHeight * canvasScale;
-
-        // Create a temporary canvas to draw a scaled version of the tile.
-        const scaledImgCanvas = document.createElement("canvas");
-        scaledImgCanvas.width = tileWidth * canvasScale;
-        scaledImgCanvas.height = tileHeight * canvasScale;
-        const scaledCtx = scaledImgCanvas.getContext("2d");
-        scaledCtx.drawImage(img, 0, 0, scaledImgCanvas.width, scaledImgCanvas.height);
-        mergedCtx.drawImage(scaledImgCanvas, offsetX, offsetY);
-
-        // Process each nucleus in the tile.
-        data.nuclei.forEach(nuc => {
-          const coords = nuc.pixel_coords;
-          if (!Array.isArray(coords)) return;
-          // Draw outlines.
-          if (showOutlines) {
-            const edges = getEdgePixels(coords, tileWidth, tileHeight);
-            edges.forEach(([y, x]) => {
-              mergedCtx.fillStyle = "lime";
-              mergedCtx.fillRect(offsetX + x * canvasScale, offsetY + y * canvasScale, 1, 1);
-            });
-          }
-          // Draw labels.
-          if (showLabels && nuc.centroid) {
-            mergedCtx.fillStyle = "yellow";
-            mergedCtx.font = "10px Arial";
-            mergedCtx.textAlign = "center";
-            mergedCtx.textBaseline = "middle";
-            mergedCtx.fillText(nuc.region_id, offsetX + nuc.centroid[1] * canvasScale, offsetY + nuc.centroid[0] * canvasScale);
-          }
-          // Draw foci markers.
-          const fociKey = `${selectedMethod}_coords_th${selectedThreshold}`;
-          if (showFoci && Array.isArray(nuc[fociKey])) {
-            mergedCtx.fillStyle = (selectedMethod === "rad51") ? "cyan" : "magenta";
-            nuc[fociKey].forEach(([y, x]) => {
-              mergedCtx.beginPath();
-              mergedCtx.arc(offsetX + x * canvasScale, offsetY + y * canvasScale, 2, 0, 2 * Math.PI);
-              mergedCtx.fill();
-            });
-          }
-          // Compute the bounding box for the nucleus.
-          let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
-          coords.forEach(([y, x]) => {
-            if (x < minX) minX = x;
-            if (y < minY) minY = y;
-            if (x > maxX) maxX = x;
-            if (y > maxY) maxY = y;
-          });
-          const box = {
-            x: offsetX + minX * canvasScale,
-            y: offsetY + minY * canvasScale,
-            width: (maxX - minX + 1) * canvasScale,
-            height: (maxY - minY + 1) * canvasScale
-          };
-          nucleiRegions.push({ tileId, nuc, box, offsetX, offsetY, tileWidth, tileHeight, data });
+  // Outline and bounding box of a nucleus. Exported tiles ship both; older
+  // JSON tiles only have pixel_coords, so derive them once and keep them.
+  function getNucleusOutline(nuc, width, height) {
+    if (!nuc.outline) nuc.outline = getEdgePixels(nuc.pixel_coords, width, height);
+    return nuc.outline;
+  }
+
+  function getNucleusBBox(nuc) {
+    if (!nuc.bbox) {
+      let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+      nuc.pixel_coords.forEach(([y, x]) => {
+        if (x < minX) minX = x;
+        if (y < minY) minY = y;
+        if (x > maxX) maxX = x;
+        if (y > maxY) maxY = y;
+      });
+      nuc.bbox = [minY, minX, maxY + 1, maxX + 1];
+    }
+    return nuc.bbox; // [min_row, min_col, max_row, max_col), like regionprops
+  }
+
+  // Draw a tile's outlines once into an offscreen layer at overview scale, so
+  // switching method, threshold or display mode only redraws the foci.
+  function getOutlineLayer(tileId, data, tileWidth, tileHeight) {
+    if (!outlineLayers.has(tileId)) {
+      const layer = document.createElement("canvas");
+      layer.width = tileWidth * canvasScale;
+      layer.height = tileHeight * canvasScale;
+      const ctx = layer.getContext("2d");
+      ctx.fillStyle = "lime";
+      data.nuclei.forEach(nuc => {
+        if (!nuc.outline && !Array.isArray(nuc.pixel_coords)) return;
+        getNucleusOutline(nuc, tileWidth, tileHeight).forEach(([y, x]) => {
+          ctx.fillRect(x * canvasScale, y * canvasScale, 1, 1);
         });
       });
+      outlineLayers.set(tileId, layer);
+    }
+    return outlineLayers.get(tileId);
+  }
+
+  // Remember the thresholds each loaded tile was exported with and refresh
+  // the dropdown when new ones appear, so denser exports show up without
+  // editing index.html.
+  function registerThresholds(data) {
+    let methods = data.methods;
+    if (!methods) {
+      // plain JSON tiles: read them off the count keys of a nucleus
+      methods = {};
+      Object.keys(data.nuclei[0] || {}).forEach(key => {
+        const match = key.match(/^(.+)_count_th(.+)$/);
+        if (match) (methods[match[1]] = methods[match[1]] || []).push(match[2]);
+      });
+    }
+    let added = false;
+    Object.entries(methods).forEach(([method, thresholds]) => {
+      if (!thresholdsByMethod.has(method)) thresholdsByMethod.set(method, new Set());
+      const known = thresholdsByMethod.get(method);
+      thresholds.forEach(th => {
+        if (!known.has(th)) {
+          known.add(th);
+          added = true;
+        }
+      });
+    });
+    if (!added) return;
+    const previous = selectedThreshold;
+    updateThresholdOptions();
+    if (selectedThreshold !== previous) redrawTiles();
+  }
+
+  // Fill the threshold dropdown with the thresholds seen for the selected method.
+  function updateThresholdOptions() {
+    const thresholds = thresholdsByMethod.get(selectedMethod);
+    if (!thresholds || !thresholds.size) return;
+    const sorted = [...thresholds].sort((a, b) => parseFloat(a) - parseFloat(b));
+    if (!thresholds.has(selectedThreshold)) {
+      // keep the closest available threshold when switching method
+      const target = parseFloat(selectedThreshold);
+      selectedThreshold = sorted.reduce((best, th) =>
+        Math.abs(parseFloat(th) - target) < Math.abs(parseFloat(best) - target) ? th : best);
+    }
+    thresholdSelect.innerHTML = sorted
+      .map(th => `<option value="${th}"${th === selectedThreshold ? " selected" : ""}>${th}</option>`)
+      .join("");
+  }
+
+  // Size the overview canvas for the whole plate without loading any tile
+  // (split exports record the tile shape in index.json; otherwise the first
+  // tile is loaded to measure it), then draw the tiles in view.
+  function setupPlate(tileList, layout) {
+    summaryCache.clear();
+    detailCache.clear();
+    tileDrawn.clear();
+    tileRegions.clear();
+    outlineLayers.clear();
+    thresholdsByMethod.clear();
+    const current = plate = { format: layout.format || "json" };
+
+    const shape = layout.shape
+      ? Promise.resolve(layout.shape)
+      : loadSummary(tileList[0]).then(data => data.shape ||
+          loadImage(imagePath(data, displayMode, 1)).then(img => img && [img.height, img.width]));
+
+    shape.then(([tileHeight, tileWidth] = []) => {
+      if (plate !== current || !tileWidth) return;
+      const canvas = document.createElement("canvas");
+      canvas.width = cols * tileWidth * canvasScale;
+      canvas.height = Math.ceil(tileList.length / cols) * tileHeight * canvasScale;
+      Object.assign(plate, { tileWidth, tileHeight, canvas });
+      attachCanvasListeners(canvas);
+      tileGrid.innerHTML = "";
+      tileGrid.appendChild(canvas);
+      drawVisible();
+    });
+  }
+
+  // Indices of the tiles overlapping the visible part of the canvas, plus one
+  // row above and below so scrolling does not reveal empty tiles.
+  function visibleTileIndices() {
+    const { canvas, tileWidth, tileHeight } = plate;
+    const rect = canvas.getBoundingClientRect();
+    const view = tileGrid.getBoundingClientRect();
+    const scaledWidth = tileWidth * canvasScale;
+    const scaledHeight = tileHeight * canvasScale;
+    const top = Math.max(view.top, 0) - scaledHeight - rect.top;
+    const bottom = Math.min(view.bottom, window.innerHeight) + scaledHeight - rect.top;
+    const left = Math.max(view.left, 0) - rect.left;
+    const right = Math.min(view.right, window.innerWidth) - rect.left;
+    const indices = [];
+    const rowStart = Math.max(0, Math.floor(top / scaledHeight));
+    const rowEnd = Math.floor(bottom / scaledHeight);
+    const colStart = Math.max(0, Math.floor(left / scaledWidth));
+    const colEnd = Math.min(cols - 1, Math.floor(right / scaledWidth));
+    for (let row = rowStart; row <= rowEnd; row++) {
+      for (let col = colStart; col <= colEnd; col++) {
+        const idx = row * cols + col;
+        if (idx < currentTileList.length) indices.push(idx);
+      }
+    }
+    return indices;
+  }
 
-      // ----- High-Resolution Magnifier Code -----
-      // Instead of sampling from the merged (downscaled) view, use the full-res tile.
-      mergedCanvas.addEventListener("mousemove", e => {
-        const rect = mergedCanvas.getBoundingClientRect();
-        const mouseX = e.clientX - rect.left;
-        const mouseY = e.clientY - rect.top;
-        const magnifierSize = 70; // Output size in pixels
-        const zoomFactor = 2;     // Magnification factor for the magnifier
-
-        // Determine the scaled dimensions of each tile.
-        const scaledTileWidth = tileWidth * canvasScale;
-        const scaledTileHeight = tileHeight * canvasScale;
-        // Find the tile over which the mouse hovers.
-        const col = Math.floor(mouseX / scaledTileWidth);
-        const row = Math.floor(mouseY / scaledTileHeight);
-        const index = row * cols + col;
-        if (index < validResults.length) {
-          const tileInfo = validResults[index];
-          const tileOffsetX = col * scaledTileWidth;
-          const tileOffsetY = row * scaledTileHeight;
-          // Convert to raw tile coordinates.
-          const localX = (mouseX - tileOffsetX) / canvasScale;
-          const localY = (mouseY - tileOffsetY) / canvasScale;
-          const regionSize = magnifierSize / zoomFactor;
+  // Draw every visible tile that is missing or was drawn with older settings.
+  function drawVisible() {
+    if (!plate || !plate.canvas) return;
+    visibleTileIndices().forEach(idx => {
+      if (tileDrawn.get(currentTileList[idx]) !== renderVersion) drawTile(idx);
+    });
+  }
+
+  let drawScheduled = false;
+  function scheduleDraw() {
+    if (drawScheduled) return;
+    drawScheduled = true;
+    requestAnimationFrame(() => {
+      drawScheduled = false;
+      drawVisible();
+    });
+  }
+  tileGrid.addEventListener("scroll", scheduleDraw);
+  window.addEventListener("scroll", scheduleDraw);
+  window.addEventListener("resize", scheduleDraw);
+
+  // Fetch one tile's data and its overview-sized image, then paint it.
+  function drawTile(idx) {
+    const tileId = currentTileList[idx];
+    const current = plate;
+    const version = renderVersion;
+    tileDrawn.set(tileId, version);
+    Promise.all([loadSummary(tileId), loadDetail(tileId)])
+      .then(([summary, data]) => loadImage(imagePath(summary, displayMode, canvasScale)).then(img => {
+        if (plate === current && version === renderVersion) paintTile(idx, summary, data, img);
+      }))
+      .catch(() => tileDrawn.delete(tileId));
+  }
+
+  // Draw one tile with its overlays into the overview canvas and record
+  // each nucleus's bounding box.
+  function paintTile(idx, summary, data, img) {
+    const tileId = currentTileList[idx];
+    const { canvas, tileWidth, tileHeight } = plate;
+    const ctx = canvas.getContext("2d");
+    const offsetX = (idx % cols) * tileWidth * canvasScale;
+    const offsetY = Math.floor(idx / cols) * tileHeight * canvasScale;
+
+    ctx.clearRect(offsetX, offsetY, tileWidth * canvasScale, tileHeight * canvasScale);
+    if (img) ctx.drawImage(img, offsetX, offsetY, tileWidth * canvasScale, tileHeight * canvasScale);
+
+    // Draw outlines from the cached per-tile layer.
+    if (showOutlines) {
+      ctx.drawImage(getOutlineLayer(tileId, data, tileWidth, tileHeight), offsetX, offsetY);
+    }
+
+    // Process each nucleus in the tile.
+    const regions = [];
+    const fociKey = `${selectedMethod}_coords_th${selectedThreshold}`;
+    data.nuclei.forEach(nuc => {
+      if (!nuc.bbox && !Array.isArray(nuc.pixel_coords)) return;
+      // Draw labels.
+      if (showLabels && nuc.centroid) {
+        ctx.fillStyle = "yellow";
+        ctx.font = "10px Arial";
+        ctx.textAlign = "center";
+        ctx.textBaseline = "middle";
+        ctx.fillText(nuc.region_id, offsetX + nuc.centroid[1] * canvasScale, offsetY + nuc.centroid[0] * canvasScale);
+      }
+      // Draw foci markers.
+      if (showFoci && Array.isArray(nuc[fociKey])) {
+        ctx.fillStyle = (selectedMethod === "rad51") ? "cyan" : "magenta";
+        nuc[fociKey].forEach(([y, x]) => {
+          ctx.beginPath();
+          ctx.arc(offsetX + x * canvasScale, offsetY + y * canvasScale, 2, 0, 2 * Math.PI);
+          ctx.fill();
+        });
+      }
+      // Bounding box of the nucleus in merged-canvas coordinates.
+      const [minY, minX, maxY, maxX] = getNucleusBBox(nuc);
+      const box = {
+        x: offsetX + minX * canvasScale,
+        y: offsetY + minY * canvasScale,
+        width: (maxX - minX) * canvasScale,
+        height: (maxY - minY) * canvasScale
+      };
+      regions.push({ tileId, nuc, box, offsetX, offsetY, tileWidth, tileHeight, data, summary });
+    });
+    tileRegions.set(tileId, regions);
+  }
+
+  // Tile under a point of the overview canvas, or null.
+  function getTileAtPosition(mouseX, mouseY) {
+    const col = Math.floor(mouseX / (plate.tileWidth * canvasScale));
+    const row = Math.floor(mouseY / (plate.tileHeight * canvasScale));
+    const idx = row * cols + col;
+    if (col < 0 || col >= cols || row < 0 || idx >= currentTileList.length) return null;
+    return { idx, col, row, tileId: currentTileList[idx] };
+  }
+
+  // Helper: Determine which nucleus region (if any) is at mouse coordinates.
+  function getNucleusAtPosition(mouseX, mouseY) {
+    const tile = getTileAtPosition(mouseX, mouseY);
+    if (!tile) return null;
+    for (const region of tileRegions.get(tile.tileId) || []) {
+      const { box } = region;
+      if (
+        mouseX >= box.x &&
+        mouseX <= box.x + box.width &&
+        mouseY >= box.y &&
+        mouseY <= box.y + box.height
+      ) {
+        return region;
+      }
+    }
+    return null;
+  }
+
+  function attachCanvasListeners(mergedCanvas) {
+    // ----- High-Resolution Magnifier Code -----
+    // Instead of sampling from the overview thumbnails, use the full-res tile.
+    mergedCanvas.addEventListener("mousemove", e => {
+      const rect = mergedCanvas.getBoundingClientRect();
+      const mouseX = e.clientX - rect.left;
+      const mouseY = e.clientY - rect.top;
+      const magnifierSize = 70; // Output size in pixels
+      const zoomFactor = 2;     // Magnification factor for the magnifier
+
+      const tile = getTileAtPosition(mouseX, mouseY);
+      if (!tile) return;
+      // Convert to raw tile coordinates.
+      const localX = (mouseX - tile.col * plate.tileWidth * canvasScale) / canvasScale;
+      const localY = (mouseY - tile.row * plate.tileHeight * canvasScale) / canvasScale;
+      const regionSize = magnifierSize / zoomFactor;
+      loadSummary(tile.tileId)
+        .then(summary => loadImage(imagePath(summary, displayMode, zoomFactor)))
+        .then(img => {
+          if (!img) return;
           magnifierCanvas.width = magnifierSize;
           magnifierCanvas.height = magnifierSize;
           const ctx = magnifierCanvas.getContext("2d");
           ctx.imageSmoothingEnabled = true;
           ctx.clearRect(0, 0, magnifierCanvas.width, magnifierCanvas.height);
           ctx.drawImage(
-            tileInfo.img,
+            img,
             localX - regionSize / 2, localY - regionSize / 2, regionSize, regionSize,
             0, 0, magnifierSize, magnifierSize
           );
-        }
-      });
-      // -------------------------------------------------
-
-      // Helper: Determine which nucleus region (if any) is at mouse coordinates.
-      function getNucleusAtPosition(mouseX, mouseY) {
-        for (const region of nucleiRegions) {
-          const { box } = region;
-          if (
-            mouseX >= box.x &&
-            mouseX <= box.x + box.width &&
-            mouseY >= box.y &&
-            mouseY <= box.y + box.height
-          ) {
-            return region;
-          }
-        }
-        return null;
-      }
-
-      // On mousemove over the merged canvas, update the dashboard (if not locked).
-      mergedCanvas.addEventListener("mousemove", e => {
-        if (lockedNucleus) return;
-        const rect = mergedCanvas.getBoundingClientRect();
-        const mouseX = e.clientX - rect.left;
-        const mouseY = e.clientY - rect.top;
-        const hoveredRegion = getNucleusAtPosition(mouseX, mouseY);
-        if (hoveredRegion) {
-          updateDashboard(hoveredRegion);
-        } else {
-          clearDashboard();
-        }
-      });
-
-      // On click over the merged canvas, lock the dashboard.
-      mergedCanvas.addEventListener("click", e => {
-        const rect = mergedCanvas.getBoundingClientRect();
-        const mouseX = e.clientX - rect.left;
-        const mouseY = e.clientY - rect.top;
-        const clickedRegion = getNucleusAtPosition(mouseX, mouseY);
-        if (clickedRegion) {
-          lockedNucleus = clickedRegion;
-          updateDashboard(clickedRegion);
-        }
-      });
+        });
+    });
+    // -------------------------------------------------
 
-      // Clear the lock when the "Clear Info Lock" button is clicked.
-      document.getElementById("clearSelection").addEventListener("click", () => {
-        lockedNucleus = null;
+    // On mousemove over the merged canvas, update the dashboard (if not locked).
+    mergedCanvas.addEventListener("mousemove", e => {
+      if (lockedNucleus) return;
+      const rect = mergedCanvas.getBoundingClientRect();
+      const hoveredRegion = getNucleusAtPosition(e.clientX - rect.left, e.clientY - rect.top);
+      if (hoveredRegion) {
+        updateDashboard(hoveredRegion);
+      } else {
         clearDashboard();
-      });
+      }
+    });
 
-      tileGrid.appendChild(mergedCanvas);
+    // On click over the merged canvas, lock the dashboard.
+    mergedCanvas.addEventListener("click", e => {
+      const rect = mergedCanvas.getBoundingClientRect();
+      const clickedRegion = getNucleusAtPosition(e.clientX - rect.left, e.clientY - rect.top);
+      if (clickedRegion) {
+        lockedNucleus = clickedRegion;
+        updateDashboard(clickedRegion);
+      }
     });
   }
 
+  // Clear the lock when the "Clear Info Lock" button is clicked.
+  document.getElementById("clearSelection").addEventListener("click", () => {
+    lockedNucleus = null;
+    clearDashboard();
+  });
+
   // Update the dashboard: update the info panel and render zoomed views.
   function updateDashboard(region) {
     infoPanel.innerHTML = `<table border="1" style="width:100%;color:white;">
@@ -309,18 +592,8 @@ document.addEventListener("DOMContentLoaded", () => {
   // The parameter "withOverlays" now, when true, draws only the foci markers
   // (no outlines or labels) for the annotated view.
   function renderZoomView(region, zoomFactor, channel, canvas, withOverlays) {
-    const tileData = tileCache.get(region.tileId);
-    if (!tileData) return;
-    let imgPath;
-    if (channel === "rad51") {
-      imgPath = tileData.rad51_image;
-    } else if (channel === "dapi") {
-      imgPath = tileData.dapi_image;
-    } else if (channel === "h2ax") {
-      imgPath = tileData.h2ax_image;
-    }
-    const img = new Image();
-    img.onload = () => {
+    loadImage(imagePath(region.summary, channel, zoomFactor)).then(img => {
+      if (!img) return;
       // Convert region.box from merged-canvas coordinates to tile (raw) coordinates.
       const tileBox = {
         x: (region.box.x - region.offsetX) / canvasScale,
@@ -364,13 +637,13 @@ document.addEventListener("DOMContentLoaded", () => {
           }
         }
       }
-    };
-    img.src = imgPath;
+    });
   }
 
   // UI event listeners for controls:
   methodSelect.addEventListener("change", e => {
     selectedMethod = e.target.value;
+    updateThresholdOptions();
     redrawTiles();
   });
 
@@ -407,8 +680,10 @@ document.addEventListener("DOMContentLoaded", () => {
     toggleInfo.classList.toggle("active", infoInPanel);
   });
 
+  // Settings changed: redraw the tiles in view now, the rest when they scroll in.
   function redrawTiles() {
-    if (!currentTileList.length) return;
-    renderMergedCanvas(currentTileList);
+    if (!plate || !plate.canvas) return;
+    renderVersion++;
+    drawVisible();
   }
 });
@@ -0,0 +1,315 @@
+"""Local server for the web viewer (index.html, data/, images/, outputs/).
+
+Adds what a plain static server lacks: gzip/brotli responses (precompressed
+`.br`/`.gz` siblings, or gzip on the fly), ETag/If-None-Match revalidation
+and byte ranges. Viewer data missing from data/, or older than its tile's
+inputs, is generated on request through json_generation.py, both for the
+single-well layout (data/<tile>.*) and the plate layout plate_runner.py
+writes (data/<well>/<tile>.*, tiles read from images/<well>/).
+
+Run from the repository root:
+    python serve_viewer.py [--port 8000] [--format split] [--plate] [--precompress]
+"""
+import os
+import re
+import gzip
+import argparse
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote
+
+try:
+    import brotli
+except ImportError:  # optional; .br files are still served if they exist
+    brotli = None
+
+# --- Configuration ---
+root_files = {"index.html", "script.js", "style.css"}
+served_dirs = {"data", "images", "outputs"}
+data_dir = "data"
+
+compressible = {".json", ".js", ".css", ".html", ".csv", ".svg", ".bin", ".txt"}
+min_compress_size = 1024
+gzip_cache_bytes = 64 * 1024 * 1024
+
+# data/[pyramid/][<well>/]<tile> files written by json_generation.process_tile
+tile_file = re.compile(r"^data/(?:pyramid/)?(?:(?P<well>[^/]+)/)?(?P<tile>[^/]+?)"
+                       r"(?:_(?:rad51|dapi)_\d+\.png|\.summary\.json|\.json|\.bin)$")
+
+
+# --- On-the-fly gzip, cached by path/mtime/size ---
+class GzipCache:
+    def __init__(self, max_bytes=gzip_cache_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, stat):
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        with open(path, "rb") as f:
+            body = gzip.compress(f.read(), compresslevel=6, mtime=0)
+        with self.lock:
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+        return body
+
+
+# --- On-demand viewer data ---
+class TileDataGenerator:
+    """Writes data/[<well>/]<tile>.* through json_generation.process_tile when they are missing or stale.
+
+    With `plate`, a missing data/index.json lists every well of images/ in
+    the plate layout (as plate_runner.py --viewer does) instead of A1 alone.
+    """
+
+    def __init__(self, output_format, plate=False):
+        import json_generation  # detection stack; only needed when generating
+        import tile_loader
+        self.json_generation = json_generation
+        self.tile_loader = tile_loader
+        self.output_format = output_format
+        self.plate = plate
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+
+    def loader(self, well=None):
+        """TileLoader of images/<well>, or json_generation's single-well loader; None for an unknown well."""
+        if well is None:
+            return self.json_generation.loader
+        if not os.path.isdir(os.path.join(self.tile_loader.DEFAULT_PLATE_DIR, well, "rad51")):
+            return None
+        return self.tile_loader.well_loader(well)
+
+    def ensure(self, rel_path):
+        if rel_path == f"{data_dir}/index.json":
+            return self._ensure_index(rel_path)
+        match = tile_file.match(rel_path)
+        if not match:
+            return
+        well, tile_id = match["well"], match["tile"]
+        loader = self.loader(well)
+        if loader is None or tile_id not in loader.tile_ids():
+            return
+        with self.locks_guard:
+            lock = self.locks.setdefault((well, tile_id), threading.Lock())
+        with lock:
+            if not self._stale(rel_path, loader, tile_id):
+                return
+            print(f"⚙️ Generating viewer data for {f'{well}/' if well else ''}{tile_id}")
+            self.json_generation.process_tile(tile_id, output_format=self.output_format, well=well)
+
+    def _stale(self, rel_path, loader, tile_id):
+        if not os.path.exists(rel_path):
+            return True
+        newest_input = max(os.path.getmtime(p) for p in loader.input_paths(tile_id) if os.path.exists(p))
+        return os.path.getmtime(rel_path) < newest_input
+
+    def _ensure_index(self, rel_path):
+        if os.path.exists(rel_path):
+            return
+        import json
+        wells = self.tile_loader.discover_wells(self.tile_loader.DEFAULT_PLATE_DIR) if self.plate else [None]
+        index, layout = {}, {}
+        for well in wells:
+            loader = self.loader(well)
+            tiles = [tile_id for tile_id in loader.tile_ids() if loader.has_seg(tile_id)]
+            name = well or "A1"
+            index[name] = [f"{well}/{tile_id}" if well else tile_id for tile_id in tiles]
+            if self.output_format == "split" and tiles:
+                layout[name] = {"format": "split", "shape": list(loader.seg(tiles[0]).shape)}
+        if layout:
+            index["layout"] = layout
+        os.makedirs(data_dir, exist_ok=True)
+        with open(rel_path, "w") as f:
+            json.dump(index, f, indent=2)
+
+
+def precompress(directory):
+    """Write .gz (and .br with the brotli module) next to every compressible file that lacks an up-to-date one."""
+    written = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.splitext(name)[1] not in compressible or os.path.getsize(path) < min_compress_size:
+                continue
+            variants = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append((".br", lambda data: brotli.compress(data, quality=11)))
+            for suffix, compress in variants:
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                with open(path, "rb") as f:
+                    data = compress(f.read())
+                with open(target, "wb") as f:
+                    f.write(data)
+                written += 1
+    return written
+
+
+# --- Request handling ---
+class ViewerHandler(SimpleHTTPRequestHandler):
+    gzip_cache = GzipCache()
+    generator = None
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def serve(self, send_body):
+        rel_path = self.resolve(urlsplit(self.path).path)
+        if rel_path is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        if self.generator is not None and rel_path.startswith(data_dir + "/"):
+            try:
+                self.generator.ensure(rel_path)
+            except Exception as exc:
+                print(f"❌ Could not generate {rel_path}: {type(exc).__name__}: {exc}")
+        if not os.path.isfile(rel_path):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        stat = os.stat(rel_path)
+        byte_range = self.headers.get("Range")
+        encoding, body_path, body = (None, rel_path, None) if byte_range else self.pick_encoding(rel_path, stat)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{"-" + encoding if encoding else ""}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": self.date_time_string(stat.st_mtime),
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+            "Accept-Ranges": "bytes",
+        }
+
+        if self.etag_matches(etag):
+            self.respond(HTTPStatus.NOT_MODIFIED, headers)
+            return
+
+        headers["Content-Type"] = self.guess_type(rel_path)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        size = len(body) if body is not None else os.path.getsize(body_path)
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        if byte_range:
+            parsed = parse_range(byte_range, size)
+            if parsed is None:
+                self.respond(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, {**headers, "Content-Range": f"bytes */{size}", "Content-Length": "0"})
+                return
+            if parsed != (0, size - 1) or size == 0:
+                status = HTTPStatus.PARTIAL_CONTENT
+                headers["Content-Range"] = f"bytes {parsed[0]}-{parsed[1]}/{size}"
+            start, end = parsed
+        headers["Content-Length"] = str(max(0, end - start + 1))
+        self.respond(status, headers)
+        if not send_body:
+            return
+        if body is not None:
+            self.wfile.write(body[start:end + 1])
+            return
+        with open(body_path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1 << 16))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def resolve(self, url_path):
+        """Repository-relative path of a URL, or None outside the served files."""
+        rel_path = os.path.normpath(unquote(url_path)).lstrip("/").replace(os.sep, "/")
+        if rel_path in ("", "."):
+            rel_path = "index.html"
+        if rel_path.startswith("..") or (rel_path not in root_files and rel_path.split("/")[0] not in served_dirs):
+            return None
+        return rel_path
+
+    def pick_encoding(self, rel_path, stat):
+        """(encoding, file to send, in-memory body) for the client's Accept-Encoding."""
+        accepted = {token.split(";")[0].strip() for token in self.headers.get("Accept-Encoding", "").split(",")}
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = rel_path + suffix
+            if encoding in accepted and os.path.exists(variant) and os.stat(variant).st_mtime_ns >= stat.st_mtime_ns:
+                return encoding, variant, None
+        if ("gzip" in accepted and os.path.splitext(rel_path)[1] in compressible
+                and stat.st_size >= min_compress_size):
+            return "gzip", rel_path, self.gzip_cache.get(rel_path, stat)
+        return None, rel_path, None
+
+    def etag_matches(self, etag):
+        header = self.headers.get("If-None-Match")
+        if not header:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+        return "*" in tags or etag in tags
+
+    def respond(self, status, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+
+def parse_range(header, size):
+    """First range of a `bytes=` header as inclusive (start, end), or None if it cannot be satisfied."""
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*(?:,.*)?", header)
+    if not match or match[1] == match[2] == "":
+        return None
+    if match[1] == "":
+        length = int(match[2])
+        if length == 0 or size == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(match[1])
+    end = min(int(match[2]), size - 1) if match[2] else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--format", choices=["json", "binary", "split"], default="split",
+                        help="format of viewer data generated on request (default: split)")
+    parser.add_argument("--no-generate", action="store_true", help="only serve files that already exist")
+    parser.add_argument("--plate", action="store_true",
+                        help="generate a missing data/index.json for every well of images/ (data/<well>/<tile>.*) "
+                             "instead of the single-well layout")
+    parser.add_argument("--precompress", action="store_true",
+                        help=f"write .gz{'/.br' if brotli else ''} copies of {data_dir}/ files before serving")
+    args = parser.parse_args()
+
+    if args.precompress:
+        print(f"🗜️ Precompressed {precompress(data_dir)} file(s) in {data_dir}/")
+    if not args.no_generate:
+        ViewerHandler.generator = TileDataGenerator(args.format, plate=args.plate)
+
+    server = ThreadingHTTPServer((args.host, args.port), ViewerHandler)
+    print(f"🌐 Viewer at http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Decode cache shared by the wells of a plate (run with python -m pytest tests)."""
+import os
+import sys
+import glob
+import numpy as np
+from skimage.io import imsave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tile_loader import TileLoader
+
+
+def make_well(plate, well, value):
+    """A well with one tile, tile_01, whose rad51 image is filled with `value`."""
+    os.makedirs(os.path.join(plate, well, "rad51"))
+    img = np.full((32, 32), value, dtype=np.uint8)
+    img[0, 0] = 0  # keep normalize() well defined
+    imsave(os.path.join(plate, well, "rad51", "tile_01.png"), img, check_contrast=False)
+
+
+def test_wells_with_the_same_tile_ids_keep_their_own_entries(tmp_path):
+    plate, cache = str(tmp_path / "plate"), str(tmp_path / "cache")
+    make_well(plate, "A1", 100)
+    make_well(plate, "A2", 200)
+    loaders = {well: TileLoader(os.path.join(plate, well), cache_dir=cache) for well in ("A1", "A2")}
+
+    for well in ("A1", "A2", "A1"):
+        assert loaders[well].gray("tile_01", "rad51")[1, 1] == (100 if well == "A1" else 200)
+    entries = glob.glob(os.path.join(cache, "tile_01.rad51_gray.*.npy"))
+    assert len(entries) == 2
+
+    # a rerun of either well is a cache hit: nothing is decoded or rewritten
+    mtimes = {path: os.stat(path).st_mtime_ns for path in entries}
+    for well in ("A2", "A1"):
+        loaders[well].gray("tile_01", "rad51")
+    assert {path: os.stat(path).st_mtime_ns for path in glob.glob(os.path.join(cache, "tile_01.rad51_gray.*.npy"))} == mtimes
+
+
+def test_changed_source_replaces_only_its_own_entry(tmp_path):
+    plate, cache = str(tmp_path / "plate"), str(tmp_path / "cache")
+    make_well(plate, "A1", 100)
+    make_well(plate, "A2", 200)
+    loaders = {well: TileLoader(os.path.join(plate, well), cache_dir=cache) for well in ("A1", "A2")}
+    for loader in loaders.values():
+        loader.gray("tile_01", "rad51")
+
+    path = os.path.join(plate, "A1", "rad51", "tile_01.png")
+    img = np.full((32, 32), 50, dtype=np.uint8)
+    img[0, 0] = 0
+    imsave(path, img, check_contrast=False)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+
+    assert loaders["A1"].gray("tile_01", "rad51")[1, 1] == 50
+    assert loaders["A2"].gray("tile_01", "rad51")[1, 1] == 200
+    assert len(glob.glob(os.path.join(cache, "tile_01.rad51_gray.*.npy"))) == 2
+
+
+def test_same_named_well_images_of_different_plates_keep_their_own_entries(tmp_path):
+    from well_windows import open_well_image
+    cache = str(tmp_path / "cache")
+    paths = {}
+    for plate, value in (("p1", 10), ("p2", 20)):
+        os.makedirs(tmp_path / plate)
+        paths[plate] = str(tmp_path / plate / "well.png")
+        imsave(paths[plate], np.full((40, 40, 3), value, dtype=np.uint8), check_contrast=False)
+
+    for plate in ("p1", "p2", "p1"):
+        assert open_well_image(paths[plate], cache)[0, 0] == (10 if plate == "p1" else 20)
+    assert len(glob.glob(os.path.join(cache, "well.well_gray.*.npy"))) == 2
@@ -0,0 +1,228 @@
+import os
+import glob
+import hashlib
+import numpy as np
+from skimage.io import imread
+from skimage.color import rgba2rgb, rgb2gray
+
+DEFAULT_CACHE_DIR = ".tile_cache"
+DEFAULT_PLATE_DIR = "images"
+
+
+# --- Decoding helpers ---
+def to_gray_uint8(raw):
+    """RGBA/RGB/gray PNG data -> uint8 gray, the conversion every script used to inline."""
+    if raw.ndim == 3:
+        rgb = rgba2rgb(raw) if raw.shape[2] == 4 else raw
+        return (rgb2gray(rgb) * 255).astype(np.uint8)
+    return raw
+
+
+def to_rgb_uint8(raw):
+    """PNG data -> uint8 RGB (alpha composited on white, gray replicated)."""
+    if raw.ndim == 3:
+        return (rgba2rgb(raw) * 255).astype(np.uint8) if raw.shape[2] == 4 else raw
+    return np.repeat(raw[..., None], 3, axis=2)
+
+
+def seg_to_masks(seg_path, masks_path):
+    """Convert a Cellpose `_seg.npy` dict to a plain uint16 `_masks.npy` (no pickle needed to read it)."""
+    masks = np.load(seg_path, allow_pickle=True).item()['masks']
+    if masks.max() > np.iinfo(np.uint16).max:
+        raise ValueError(f"{seg_path}: {masks.max()} labels do not fit in uint16")
+    tmp = f"{masks_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(masks, dtype=np.uint16))
+    os.replace(tmp, masks_path)
+
+
+def cache_entry(cache_dir, source, name):
+    """Cache file for `name` decoded from `source`, keyed by the source's path, mtime and size."""
+    stat = os.stat(source)
+    key = f"{os.path.abspath(source)}:{stat.st_mtime_ns}:{stat.st_size}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{name}.{digest}.npy")
+
+
+def source_name(source, name):
+    """`name` qualified by a digest of the source's absolute path.
+
+    Cache names are built from tile ids, which repeat across wells; with the
+    source in the name, remove_stale() only drops older decodes of the same
+    file, not the same tile of another well sharing the cache.
+    """
+    digest = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:8]
+    return f"{name}.{digest}"
+
+
+def remove_stale(cache_dir, name, keep=None):
+    """Delete every cached version of `name` except `keep` (the entry just published).
+
+    Another worker may be cleaning up the same entries, so files that are
+    already gone are not an error.
+    """
+    for stale in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(name) + ".*.npy")):
+        if keep is not None and os.path.abspath(stale) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+
+
+def foreground(prob):
+    """Foci-class channel of a pixel-classifier probability array."""
+    if prob.ndim == 3 and prob.shape[-1] == 2:
+        prob = prob[..., 1]  # channel 1 is the foci class
+    if prob.ndim != 2:
+        raise ValueError(f"Expected 2D probability image but got shape: {prob.shape}")
+    return prob
+
+
+def normalize(img, dtype=None):
+    """Min-max scale to [0, 1]. uint8 input gives float64 (as the scripts always did) unless dtype is set."""
+    if dtype is not None:
+        img = img.astype(dtype)
+    return (img - img.min()) / (img.max() - img.min())
+
+
+# --- Loader ---
+class TileLoader:
+    """Loads a tile's channels, probability map and nucleus labels from `base_dir`.
+
+    Decoded arrays are cached as .npy files in `cache_dir`, keyed by the
+    source path, mtime and size, and opened memory-mapped on later runs, so
+    PNG decoding, colour conversion and unpickling the Cellpose output only
+    happen once per source file. `dtype` sets the float type of normalized
+    channels; None keeps the precision detection has always used (float64
+    for the PNG channels, float32 for the probability map).
+    """
+
+    def __init__(self, base_dir="images/A1", cache_dir=DEFAULT_CACHE_DIR, dtype=None, use_cache=True):
+        self.base_dir = base_dir
+        self.cache_dir = cache_dir
+        self.dtype = dtype
+        self.use_cache = use_cache
+        # normalized arrays of different precision are cached side by side
+        self._norm = "norm" if dtype is None else f"norm_{np.dtype(dtype).str[1:]}"
+        if use_cache:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    # --- Paths ---
+    def image_path(self, tile_id, channel):
+        return os.path.join(self.base_dir, channel, tile_id + ".png")
+
+    def seg_path(self, tile_id):
+        return os.path.join(self.base_dir, "dapi", tile_id + "_seg.npy")
+
+    def masks_path(self, tile_id):
+        return os.path.join(self.base_dir, "dapi", tile_id + "_masks.npy")
+
+    def prob_path(self, tile_id):
+        return os.path.join(self.base_dir, "rad51", tile_id + "_Probabilities.npy")
+
+    def input_paths(self, tile_id):
+        """Every source file a tile's results can depend on (some may not exist)."""
+        return [self.image_path(tile_id, "rad51"), self.image_path(tile_id, "dapi"),
+                self.seg_path(tile_id), self.masks_path(tile_id), self.prob_path(tile_id),
+                self.image_path(tile_id, "h2ax")]
+
+    def tile_ids(self):
+        """Tile ids with a RAD51 image, sorted."""
+        rad51_dir = os.path.join(self.base_dir, "rad51")
+        return [f[:-4] for f in sorted(os.listdir(rad51_dir))
+                if f.endswith(".png") and "Probabilities" not in f]
+
+    def has_seg(self, tile_id):
+        return os.path.exists(self.masks_path(tile_id)) or os.path.exists(self.seg_path(tile_id))
+
+    def has_channel(self, tile_id, channel):
+        return os.path.exists(self.image_path(tile_id, channel))
+
+    def has_prob(self, tile_id):
+        return os.path.exists(self.prob_path(tile_id))
+
+    # --- Arrays ---
+    def gray(self, tile_id, channel):
+        """uint8 gray image of a channel ("rad51", "dapi" or "h2ax")."""
+        path = self.image_path(tile_id, channel)
+        return self._cached(path, f"{tile_id}.{channel}_gray", lambda: to_gray_uint8(imread(path)))
+
+    def rgb(self, tile_id, channel):
+        """uint8 RGB image of a channel, for colour crops and overlays."""
+        path = self.image_path(tile_id, channel)
+        return self._cached(path, f"{tile_id}.{channel}_rgb", lambda: to_rgb_uint8(imread(path)))
+
+    def channel(self, tile_id, channel):
+        """Min-max normalized channel ("rad51", "dapi" or "h2ax")."""
+        path = self.image_path(tile_id, channel)
+        return self._cached(path, f"{tile_id}.{channel}_{self._norm}",
+                            lambda: normalize(self.gray(tile_id, channel), self.dtype))
+
+    def probabilities(self, tile_id):
+        """Normalized foreground channel of the pixel-classifier output, or None if there is none."""
+        path = self.prob_path(tile_id)
+        if not os.path.exists(path):
+            return None
+        return self._cached(path, f"{tile_id}.prob_{self._norm}", lambda: self._decode_prob(path))
+
+    def raw_probabilities(self, tile_id):
+        """Memory-mapped foreground channel of the pixel-classifier output, not normalized (None if there is none)."""
+        path = self.prob_path(tile_id)
+        if not os.path.exists(path):
+            return None
+        return foreground(np.load(path, mmap_mode="r"))
+
+    def seg(self, tile_id):
+        """Cellpose nucleus label image.
+
+        A converted `_masks.npy` (see convert_masks.py) is memory-mapped
+        directly, so parallel workers share its pages; otherwise the pickled
+        `_seg.npy` dict is unpickled once and cached.
+        """
+        masks_path = self.masks_path(tile_id)
+        path = self.seg_path(tile_id)
+        if os.path.exists(masks_path) and (not os.path.exists(path) or
+                                           os.path.getmtime(masks_path) >= os.path.getmtime(path)):
+            return np.asarray(np.load(masks_path, mmap_mode="r"))
+        return self._cached(path, f"{tile_id}.seg",
+                            lambda: np.load(path, allow_pickle=True).item()['masks'])
+
+    def _decode_prob(self, path):
+        return normalize(foreground(np.load(path)), self.dtype)
+
+    # --- Cache ---
+    def _cached(self, source, name, decode):
+        if not self.use_cache:
+            return decode()
+        name = source_name(source, name)
+        path = cache_entry(self.cache_dir, source, name)
+        if not os.path.exists(path):
+            arr = np.ascontiguousarray(decode())
+            # write then rename, so parallel workers never read a half-written file
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, path)
+            # only after publishing, and never the new entry: a worker decoding the same tile may load it now
+            remove_stale(self.cache_dir, name, keep=path)
+        # plain ndarray view of the mapping, so results pickle like ordinary arrays
+        return np.asarray(np.load(path, mmap_mode="r"))
+
+
+# --- Plate ---
+def discover_wells(plate_dir=DEFAULT_PLATE_DIR):
+    """Wells of a plate: subdirectories of `plate_dir` that have a rad51/ folder, sorted (A1, A2, ..., B1, ...)."""
+    wells = [name for name in os.listdir(plate_dir) if os.path.isdir(os.path.join(plate_dir, name, "rad51"))]
+    return sorted(wells, key=lambda name: (name[:1], int(name[1:]) if name[1:].isdigit() else 0, name))
+
+
+_well_loaders = {}
+
+
+def well_loader(well, plate_dir=DEFAULT_PLATE_DIR):
+    """TileLoader of `plate_dir/<well>`, created once per process and shared by every tile of the well."""
+    key = (plate_dir, well)
+    if key not in _well_loaders:
+        _well_loaders[key] = TileLoader(os.path.join(plate_dir, well))
+    return _well_loaders[key]
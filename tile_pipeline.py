@@ -0,0 +1,86 @@
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import profiling
+
+# Resident memory of a worker before its first tile (interpreter, numpy/scipy/skimage/pandas imports),
+# counted once per worker by workers_for_budget()
+worker_overhead = 150 * 2**20
+
+size_units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+# --- Memory budget ---
+def parse_size(text):
+    """Bytes in a size like "4G", "1500M", "512k" or "1e9" (binary units, optional trailing B)."""
+    text = text.strip().upper().removesuffix("B")
+    unit = size_units.get(text[-1:], 1)
+    try:
+        return int(float(text[:-1] if unit > 1 else text) * unit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r} (expected e.g. 4G or 1500M)") from None
+
+
+def workers_for_budget(budget, tile_bytes, workers):
+    """Number of workers (at most `workers`, at least 1) whose estimated peak memory fits in `budget` bytes."""
+    per_worker = worker_overhead + tile_bytes
+    fit = max(1, min(workers, budget // per_worker))
+    print(f"🧠 Memory budget {budget / 2**30:.1f} GiB, ~{per_worker / 2**20:.0f} MiB per worker: "
+          f"{fit} worker(s)" + (f" instead of {workers}" if fit < workers else ""))
+    if budget < per_worker:
+        print("⚠️ Even one worker is estimated to need more than the budget")
+    return int(fit)
+
+
+# --- Tile runner ---
+def run_tiles(worker, tiles, workers=1, ordered=True):
+    """Run `worker(tile)` for every tile and yield (tile, result) in input order.
+
+    With workers > 1 tiles are processed in a process pool, so `worker` must
+    be a module-level function (or a functools.partial of one). A tile whose
+    worker raises is reported and skipped instead of aborting the run.
+    With profiling on, each worker's stage measurements are sent back with
+    its result and a run report is written once all tiles are done.
+    ordered=False yields results as they finish instead (all tiles are queued
+    up front either way, so the pool never idles while one tile is slow).
+    """
+    if not profiling.is_enabled():
+        yield from _run(worker, tiles, workers, ordered)
+        return
+    for tile, (result, records) in _run(partial(profiling.profiled_call, worker), tiles, workers, ordered):
+        profiling.collect(records)
+        yield tile, result
+    profiling.write_report()
+
+
+def _run(worker, tiles, workers, ordered=True):
+    failed = []
+    if workers <= 1:
+        for tile in tiles:
+            try:
+                result = worker(tile)
+            except Exception as exc:
+                _report_failure(tile, exc, failed)
+                continue
+            yield tile, result
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(tile, pool.submit(worker, tile)) for tile in tiles]
+            if not ordered:
+                tile_of = {future: tile for tile, future in futures}
+                futures = ((tile_of[future], future) for future in as_completed(tile_of))
+            for tile, future in futures:
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    _report_failure(tile, exc, failed)
+                    continue
+                yield tile, result
+
+    if failed:
+        print(f"⚠️ {len(failed)} tile(s) failed: {', '.join(map(str, failed))}")
+
+
+def _report_failure(tile, exc, failed):
+    failed.append(tile)
+    print(f"❌ {tile} failed: {type(exc).__name__}: {exc}")
@@ -0,0 +1,158 @@
+import os
+import json
+import numpy as np
+import cv2
+
+# numpy dtype -> JavaScript typed array used by script.js to view the buffer
+TYPED_ARRAYS = {
+    "<u2": "Uint16Array",
+    "<u4": "Uint32Array",
+    "<f4": "Float32Array",
+}
+
+
+# --- Encoding helpers ---
+def rle_encode(seg):
+    """Row-major run-length encoding of a label image as (values, lengths)."""
+    flat = seg.ravel()
+    starts = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1])
+    lengths = np.diff(np.append(starts, flat.size))
+    return flat[starts].astype("<u2"), lengths.astype("<u4")
+
+
+def rle_decode(values, lengths, shape):
+    return np.repeat(values, lengths).reshape(shape)
+
+
+def pack_arrays(arrays):
+    """Concatenate arrays into one little-endian buffer, 8-byte aligned.
+
+    Returns (payload, specs) where specs[name] gives the typed array, byte
+    offset and element count the viewer needs to wrap each array zero-copy.
+    """
+    chunks = []
+    specs = {}
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        pad = -offset % 8
+        chunks.append(b"\0" * pad)
+        offset += pad
+        specs[name] = {"type": TYPED_ARRAYS[arr.dtype.str], "offset": offset, "length": int(arr.size)}
+        chunks.append(arr.tobytes())
+        offset += arr.nbytes
+    return b"".join(chunks), specs
+
+
+# --- Tile export ---
+def write_binary_tile(output_dir, tile_id, images, seg, nuclei, foci):
+    """Write one tile as `<tile_id>.bin` plus a small `<tile_id>.json` manifest.
+
+    `images` maps manifest keys (rad51_image, ...) to paths, `nuclei` is the
+    tile's LabelIndex and `foci` maps method -> detect_tile_foci() result.
+    Foci and outline pixels are stored nucleus by nucleus; the `*_offsets`
+    arrays give where each nucleus starts in the matching y/x arrays, and
+    nuclei_bbox holds (min_row, min_col, max_row, max_col) per nucleus.
+    """
+    labels = nuclei.labels
+    rle_values, rle_lengths = rle_encode(seg)
+    outlines = [nuclei.outline_pixels(label) for label in labels]
+    outline_lengths = [len(rows) for rows, cols in outlines]
+    arrays = {
+        "labels_rle_values": rle_values,
+        "labels_rle_lengths": rle_lengths,
+        "nuclei_id": labels.astype("<u2"),
+        "nuclei_area": nuclei.areas[labels].astype("<u4"),
+        "nuclei_centroid": nuclei.centroids[labels].astype("<f4"),
+        "nuclei_bbox": np.array([nuclei.bbox(label) for label in labels], dtype="<u2").reshape(-1, 4),
+        "outline_offsets": np.concatenate([[0], np.cumsum(outline_lengths)]).astype("<u4"),
+        "outline_y": np.concatenate([rows for rows, cols in outlines] or [[]]).astype("<u2"),
+        "outline_x": np.concatenate([cols for rows, cols in outlines] or [[]]).astype("<u2"),
+    }
+
+    methods = {}
+    for method, results in foci.items():
+        methods[method] = []
+        for th, (counts, area_pix, nuclei_blobs) in results.items():
+            key = f"{method}_th{th}"
+            methods[method].append(str(th))
+            blobs = [nuclei_blobs[label] for label in labels]
+            blobs = np.concatenate(blobs) if blobs else np.empty((0, 3))
+            arrays[f"{key}_count"] = counts[labels].astype("<u2")
+            arrays[f"{key}_area"] = (area_pix[labels] / nuclei.areas[labels]).astype("<f4")
+            arrays[f"{key}_offsets"] = np.concatenate([[0], np.cumsum(counts[labels])]).astype("<u4")
+            arrays[f"{key}_y"] = blobs[:, 0].astype("<u2")
+            arrays[f"{key}_x"] = blobs[:, 1].astype("<u2")
+            arrays[f"{key}_sigma"] = blobs[:, 2].astype("<f4")
+
+    payload, specs = pack_arrays(arrays)
+    with open(os.path.join(output_dir, f"{tile_id}.bin"), "wb") as f:
+        f.write(payload)
+
+    manifest = {
+        "format": "binary",
+        "tile_id": tile_id,
+        **images,
+        "shape": list(seg.shape),
+        "binary": f"{tile_id}.bin",
+        "methods": methods,
+        "arrays": specs,
+    }
+    with open(os.path.join(output_dir, f"{tile_id}.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+# --- Split export: image pyramid + summary/detail ---
+def write_pyramid(output_dir, tile_id, channel, image_path, min_size=64):
+    """Write 2x, 4x, ... downsampled copies of a tile image until it is smaller than `min_size`.
+
+    Returns {factor: path}, with factor 1 the original image, for the
+    viewer to pick the smallest level that still covers its zoom.
+    """
+    levels = {"1": image_path}
+    img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return levels
+    factor = 1
+    while min(img.shape[:2]) // 2 >= min_size:
+        factor *= 2
+        img = cv2.resize(img, (img.shape[1] // 2, img.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        path = os.path.join(output_dir, "pyramid", f"{tile_id}_{channel}_{factor}.png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cv2.imwrite(path, img)
+        levels[str(factor)] = path.replace(os.sep, "/")
+    return levels
+
+
+def write_tile_summary(output_dir, tile_id, images, seg, nuclei, foci):
+    """Write `<tile_id>.summary.json`: per-nucleus ids, boxes and counts, without pixels or foci coordinates.
+
+    `images` maps channel -> write_pyramid() levels. Outlines and foci live
+    in the binary detail file (`<tile_id>.json` + `.bin`), which the viewer
+    only fetches for tiles in view.
+    """
+    labels = nuclei.labels
+    table = {
+        "region_id": labels.tolist(),
+        "area": nuclei.areas[labels].tolist(),
+        "centroid": np.round(nuclei.centroids[labels], 2).tolist(),
+        "bbox": [list(nuclei.bbox(label)) for label in labels],
+    }
+    methods = {}
+    for method, results in foci.items():
+        methods[method] = [str(th) for th in results]
+        for th, (counts, area_pix, _) in results.items():
+            table[f"{method}_count_th{th}"] = counts[labels].tolist()
+            table[f"{method}_area_th{th}"] = np.round(area_pix[labels] / nuclei.areas[labels], 6).tolist()
+
+    summary = {
+        "format": "split",
+        "tile_id": tile_id,
+        "shape": list(seg.shape),
+        "pyramid": images,
+        "detail": f"{tile_id}.json",
+        "methods": methods,
+        "nuclei": table,
+    }
+    with open(os.path.join(output_dir, f"{tile_id}.summary.json"), "w") as f:
+        json.dump(summary, f, separators=(",", ":"))
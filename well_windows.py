@@ -0,0 +1,201 @@
+import os
+import math
+import numpy as np
+import tifffile
+from skimage.io import imread
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from foci_detection import log_scale_space, log_peaks, prune_blobs, min_sigma, max_sigma, num_sigma, overlap
+from tile_loader import DEFAULT_CACHE_DIR, cache_entry, remove_stale, source_name, to_gray_uint8
+
+STRIP_ROWS = 512
+
+
+# --- Sources ---
+def open_well_image(path, cache_dir=DEFAULT_CACHE_DIR):
+    """2D gray array for a whole-well image, memory-mapped instead of read into RAM.
+
+    .npy and uncompressed TIFFs are mapped directly. Colour data and formats
+    that cannot be mapped (PNG, compressed TIFF) are converted to uint8 gray
+    once, strip by strip, into an .npy in `cache_dir` keyed by path + mtime.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    raw = None
+    if ext == ".npy":
+        raw = np.load(path, mmap_mode="r")
+    elif ext in (".tif", ".tiff"):
+        try:
+            raw = tifffile.memmap(path, mode="r")
+        except ValueError:
+            pass  # compressed or tiled TIFF
+    if raw is not None and raw.ndim == 2:
+        return np.asarray(raw)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # same-named images of other plate folders keep their own entries
+    name = source_name(path, os.path.splitext(os.path.basename(path))[0] + ".well_gray")
+    entry = cache_entry(cache_dir, path, name)
+    if not os.path.exists(entry):
+        if raw is None:
+            raw = imread(path)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        gray = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=raw.shape[:2])
+        # per-pixel conversion, so strips give the same result as the whole image
+        for r0 in range(0, raw.shape[0], STRIP_ROWS):
+            gray[r0:r0 + STRIP_ROWS] = to_gray_uint8(np.asarray(raw[r0:r0 + STRIP_ROWS]))
+        gray.flush()
+        del gray
+        os.replace(tmp, entry)
+        # only after publishing, and never the new entry: another process may be mapping it now
+        remove_stale(cache_dir, name, keep=entry)
+    return np.asarray(np.load(entry, mmap_mode="r"))
+
+
+# --- Windows ---
+def window_halo(max_sigma=max_sigma):
+    """Halo that makes windowed LoG responses exact: the largest kernel radius plus the 3x3 peak test."""
+    return int(4.0 * max_sigma + 0.5) + 1
+
+
+def iter_windows(shape, window, halo):
+    """Yield (core, padded) slice pairs. Cores tile `shape` exactly, remainder rows/cols included."""
+    height, width = shape
+    for r0 in range(0, height, window):
+        for c0 in range(0, width, window):
+            r1, c1 = min(r0 + window, height), min(c0 + window, width)
+            core = (slice(r0, r1), slice(c0, c1))
+            padded = (slice(max(0, r0 - halo), min(height, r1 + halo)),
+                      slice(max(0, c0 - halo), min(width, c1 + halo)))
+            yield core, padded
+
+
+def image_range(img, window):
+    """(min, max) of a large image, read window by window."""
+    lo = hi = None
+    for core, _ in iter_windows(img.shape, window, 0):
+        chunk = img[core]
+        lo = chunk.min() if lo is None else min(lo, chunk.min())
+        hi = chunk.max() if hi is None else max(hi, chunk.max())
+    return lo, hi
+
+
+# --- Windowed detection ---
+def detect_windowed(img, thresholds, window=1024, halo=None, min_sigma=min_sigma, max_sigma=max_sigma,
+                    num_sigma=num_sigma, overlap=overlap):
+    """detect_blobs_multi for an image too large to hold a LoG stack for.
+
+    The image is min-max normalized with its global range and processed in
+    overlapping windows; each window only keeps peaks whose centre lies in
+    its core, so halo duplicates never appear. Peaks are then ordered and
+    pruned over the whole image exactly as blob_log would, so the result
+    equals detect_blobs_multi(normalized image) while only one window's
+    scale space is in memory at a time.
+    """
+    thresholds = list(thresholds)
+    if not thresholds:
+        return {}
+    halo = window_halo(max_sigma) if halo is None else halo
+    lo, hi = image_range(img, window)
+
+    all_blobs, all_response = [], []
+    for core, padded in iter_windows(img.shape, window, halo):
+        tile = np.asarray(img[padded])
+        cube, sigma_list = log_scale_space((tile - lo) / (hi - lo), min_sigma, max_sigma, num_sigma)
+        blobs, response = log_peaks(cube, sigma_list, min(thresholds))
+        del cube
+        blobs[:, 0] += padded[0].start
+        blobs[:, 1] += padded[1].start
+        in_core = ((blobs[:, 0] >= core[0].start) & (blobs[:, 0] < core[0].stop) &
+                   (blobs[:, 1] >= core[1].start) & (blobs[:, 1] < core[1].stop))
+        all_blobs.append(blobs[in_core])
+        all_response.append(response[in_core])
+
+    blobs = np.concatenate(all_blobs)
+    response = np.concatenate(all_response)
+    # strongest first, ties in raster order, as log_peaks orders a single stack
+    order = np.lexsort((blobs[:, 2], blobs[:, 1], blobs[:, 0], -response))
+    blobs, response = blobs[order], response[order]
+    return {th: prune_blobs(blobs[response > th], overlap) for th in thresholds}
+
+
+# --- Nucleus statistics ---
+def label_stats(labels, window=1024):
+    """Per-label (areas, centroids) of a large label image, accumulated window by window."""
+    n = 0
+    area = np.zeros(1)
+    sum_r = np.zeros(1)
+    sum_c = np.zeros(1)
+    for core, _ in iter_windows(labels.shape, window, 0):
+        flat = np.asarray(labels[core]).ravel()
+        rows, cols = np.divmod(np.arange(flat.size), core[1].stop - core[1].start)
+        n = max(n, int(flat.max()) + 1)
+        area = _grow(area, n) + np.bincount(flat, minlength=n)
+        sum_r = _grow(sum_r, n) + np.bincount(flat, weights=rows + core[0].start, minlength=n)
+        sum_c = _grow(sum_c, n) + np.bincount(flat, weights=cols + core[1].start, minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroids = np.stack([sum_r / area, sum_c / area], axis=1)
+    return area, centroids
+
+
+def _grow(acc, n):
+    return np.pad(acc, (0, n - len(acc))) if len(acc) < n else acc
+
+
+def assign_foci_windowed(blobs, labels, n_labels):
+    """assign_foci against a memory-mapped label image (only the pixels under blobs are read)."""
+    ys = blobs[:, 0].astype(int)
+    xs = blobs[:, 1].astype(int)
+    blob_labels = labels[ys, xs].astype(np.int64)
+    counts = np.bincount(blob_labels, minlength=n_labels)
+    area_pix = np.bincount(blob_labels, weights=math.pi * blobs[:, 2].astype(np.float64)**2, minlength=n_labels)
+    return counts, area_pix, blob_labels
+
+
+# --- Label stitching ---
+def stitch_tile_labels(tiles, grid, out_path, min_contact=1):
+    """Assemble per-tile label images into one well label image at `out_path` (.npy, uint32).
+
+    `tiles` lists equally sized label images in row-major grid order (as
+    splitting.py cut them). Labels are made unique per tile, then nuclei cut
+    by a seam are merged when at least `min_contact` pixel pairs touch across
+    it. Tiles are read and written one at a time through a memmap.
+    """
+    rows, cols = grid
+    if len(tiles) != rows * cols:
+        raise ValueError(f"Expected {rows * cols} tiles for a {rows}x{cols} grid, got {len(tiles)}")
+    tile_h, tile_w = tiles[0].shape
+    offsets = np.concatenate([[0], np.cumsum([int(t.max()) for t in tiles])])
+
+    def tile_at(i, j):
+        t = np.asarray(tiles[i * cols + j]).astype(np.int64)
+        return np.where(t > 0, t + offsets[i * cols + j], 0)
+
+    # label pairs touching across vertical and horizontal seams
+    pairs = []
+    for i in range(rows):
+        for j in range(cols):
+            if j + 1 < cols:
+                pairs.append(np.stack([tile_at(i, j)[:, -1], tile_at(i, j + 1)[:, 0]], axis=1))
+            if i + 1 < rows:
+                pairs.append(np.stack([tile_at(i, j)[-1, :], tile_at(i + 1, j)[0, :]], axis=1))
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+    pairs = pairs[(pairs[:, 0] > 0) & (pairs[:, 1] > 0)]
+    pairs, contact = np.unique(pairs, axis=0, return_counts=True)
+    pairs = pairs[contact >= min_contact]
+
+    n = int(offsets[-1]) + 1
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, component = connected_components(graph, directed=False)
+    # renumber merged nuclei 1..N in label order, background stays 0
+    _, lut = np.unique(component[1:], return_inverse=True)
+    lut = np.concatenate([[0], lut + 1]).astype(np.uint32)
+
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint32, shape=(rows * tile_h, cols * tile_w))
+    for i in range(rows):
+        for j in range(cols):
+            out[i * tile_h:(i + 1) * tile_h, j * tile_w:(j + 1) * tile_w] = lut[tile_at(i, j)]
+    out.flush()
+    del out
+    os.replace(tmp, out_path)
+    return len(pairs)